@@ -0,0 +1,189 @@
+import os
+import threading
+import time
+from collections import deque
+
+from psycopg2 import extensions
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection became available in time"""
+
+
+class ConnectionPool:
+    """Bounded, thread-safe pool of raw psycopg2 connections for one worker process"""
+
+    def __init__(self, min_size=0, max_size=10, timeout=10, max_lifetime=None, max_idle=None):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.max_idle = max_idle
+
+        self._idle = deque()
+        self._born = {}
+        self._size = 0
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+
+        self.stats = {
+            'connections_created': 0,
+            'connections_closed': 0,
+            'checkouts': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'health_check_failures': 0,
+        }
+
+    def getconn(self, connect, check=None):
+        """Take an idle connection or open a new one with connect(), waiting while the pool is exhausted"""
+        deadline = time.monotonic() + self.timeout
+
+        with self._available:
+            while True:
+                while self._idle:
+                    conn, returned_at = self._idle.pop()
+                    if self._is_stale(conn, returned_at):
+                        self._discard(conn)
+                        continue
+                    break
+                else:
+                    conn = None
+
+                if conn is not None or self._size < self.max_size:
+                    break
+
+                remaining = deadline - time.monotonic()
+                self.stats['waits'] += 1
+                if remaining <= 0 or not self._available.wait(remaining):
+                    self.stats['timeouts'] += 1
+                    raise PoolTimeout(
+                        f'No database connection available within {self.timeout}s '
+                        f'(max_size={self.max_size})'
+                    )
+
+            if conn is None:
+                # Reserve the slot before releasing the lock for the slow handshake
+                self._size += 1
+
+            self.stats['checkouts'] += 1
+
+        if conn is None:
+            return self._open(connect)
+
+        if check is not None and not check(conn):
+            with self._lock:
+                self.stats['health_check_failures'] += 1
+                self._discard(conn)
+                self._size += 1
+            return self._open(connect)
+
+        return conn
+
+    def putconn(self, conn):
+        """Return a connection, resetting any open transaction or dropping it if broken"""
+        keep = not conn.closed
+        if keep:
+            status = conn.info.transaction_status
+            if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+                keep = False
+            elif status != extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except Exception:
+                    keep = False
+
+        with self._available:
+            if keep and not self._is_stale(conn, time.monotonic()):
+                self._idle.append((conn, time.monotonic()))
+            else:
+                self._discard(conn)
+            self._available.notify()
+
+    def close_all(self):
+        """Close every idle connection; connections in use are closed on return"""
+        with self._lock:
+            while self._idle:
+                conn, _ = self._idle.pop()
+                self._discard(conn)
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                **self.stats,
+            }
+
+    def _open(self, connect):
+        try:
+            conn = connect()
+        except Exception:
+            with self._available:
+                self._size -= 1
+                self._available.notify()
+            raise
+
+        with self._lock:
+            self._born[id(conn)] = time.monotonic()
+            self.stats['connections_created'] += 1
+        return conn
+
+    def _discard(self, conn):
+        """Close a connection and free its slot, the lock must be held"""
+        self._born.pop(id(conn), None)
+        self._size -= 1
+        self.stats['connections_closed'] += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _is_stale(self, conn, returned_at):
+        if conn.closed:
+            return True
+
+        now = time.monotonic()
+        if self.max_lifetime is not None and now - self._born.get(id(conn), now) >= self.max_lifetime:
+            return True
+
+        # Keep min_size connections warm no matter how long they were idle
+        if self.max_idle is not None and now - returned_at >= self.max_idle:
+            return self._size > self.min_size
+
+        return False
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+_pools_pid = None
+
+
+def get_pool(alias, **options):
+    """Return the process-wide pool for a database alias, creating it on first use"""
+    global _pools_pid
+
+    with _pools_lock:
+        # Pools must never be shared across a fork (gunicorn preloading)
+        if _pools_pid != os.getpid():
+            _pools.clear()
+            _pools_pid = os.getpid()
+
+        pool = _pools.get(alias)
+        if pool is None:
+            pool = _pools[alias] = ConnectionPool(**options)
+
+        return pool
+
+
+def pool_stats():
+    """Statistics for every pool in the current worker process, keyed by alias"""
+    with _pools_lock:
+        if _pools_pid != os.getpid():
+            return {}
+        pools = dict(_pools)
+
+    return {alias: pool.get_stats() for alias, pool in pools.items()}
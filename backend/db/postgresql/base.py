@@ -0,0 +1,91 @@
+"""
+PostgreSQL backend with connection health checks and an optional per-process pool.
+
+Extra keys understood in ``settings.DATABASES[alias]``:
+
+    HEALTH_CHECKS  ping a reused connection before its first use in a request
+    POOL           dict with MIN_SIZE, MAX_SIZE, TIMEOUT, MAX_LIFETIME, MAX_IDLE
+                   or a falsy value to open one connection per Django connection
+"""
+from django.db.backends.postgresql import base
+
+from backend.db.pool import get_pool
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    health_check_enabled = False
+    health_check_done = False
+
+    def __init__(self, settings_dict, *args, **kwargs):
+        super().__init__(settings_dict, *args, **kwargs)
+        self.health_check_enabled = settings_dict.get('HEALTH_CHECKS', False)
+        self.pool_options = settings_dict.get('POOL') or None
+
+    @property
+    def pool(self):
+        if not self.pool_options:
+            return None
+
+        return get_pool(
+            self.alias,
+            min_size=self.pool_options.get('MIN_SIZE', 0),
+            max_size=self.pool_options.get('MAX_SIZE', 10),
+            timeout=self.pool_options.get('TIMEOUT', 10),
+            max_lifetime=self.pool_options.get('MAX_LIFETIME'),
+            max_idle=self.pool_options.get('MAX_IDLE'),
+        )
+
+    def get_new_connection(self, conn_params):
+        pool = self.pool
+        if pool is None:
+            return super().get_new_connection(conn_params)
+
+        connection = pool.getconn(
+            connect=lambda: super(DatabaseWrapper, self).get_new_connection(conn_params),
+            check=self._ping if self.health_check_enabled else None
+        )
+
+        # A reused connection keeps the isolation level applied when it was opened
+        self.isolation_level = self.settings_dict['OPTIONS'].get('isolation_level', connection.isolation_level)
+        return connection
+
+    def connect(self):
+        # A fresh connection (or a pooled one checked on checkout) needs no ping
+        self.health_check_done = True
+        super().connect()
+
+    def _close(self):
+        pool = self.pool
+        if pool is None or self.connection is None:
+            return super()._close()
+
+        with self.wrap_database_errors:
+            pool.putconn(self.connection)
+
+    def close_if_unusable_or_obsolete(self):
+        # Called on request_started and request_finished: the next reuse of a
+        # persistent connection has to prove it is still alive
+        self.health_check_done = False
+        super().close_if_unusable_or_obsolete()
+
+    def ensure_connection(self):
+        if (
+            self.connection is not None and self.health_check_enabled and not self.health_check_done
+            and not self.in_atomic_block
+        ):
+            if not self.is_usable():
+                self.close()
+            self.health_check_done = True
+
+        super().ensure_connection()
+
+    @staticmethod
+    def _ping(connection):
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            if not connection.autocommit:
+                connection.rollback()
+        except Exception:
+            return False
+        return True
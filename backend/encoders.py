@@ -0,0 +1,33 @@
+import json
+from decimal import Decimal
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+try:
+    import orjson
+except ImportError:  # Responses are encoded by the stdlib
+    orjson = None
+
+
+def _default(value):
+    # orjson writes datetimes and UUIDs itself, only Decimal needs help
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+def orjson_encode(data, pretty=False):
+    """Encode to UTF-8 bytes with orjson"""
+    option = orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS if pretty else 0
+    return orjson.dumps(data, default=_default, option=option)
+
+
+def stdlib_encode(data, pretty=False):
+    """Encode to UTF-8 bytes with the json module, Decimal, UUID and datetime handled by DjangoJSONEncoder"""
+    if pretty:
+        return json.dumps(data, cls=DjangoJSONEncoder, sort_keys=True, indent=2, separators=(',', ': ')).encode()
+    return json.dumps(data, cls=DjangoJSONEncoder, separators=(',', ':')).encode()
+
+
+def default_encoder():
+    return orjson_encode if orjson is not None else stdlib_encode
@@ -0,0 +1,130 @@
+import logging
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# Local buckets kept before the ones idle for an hour are dropped
+LOCAL_MAX_BUCKETS = 10000
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a client used up the bucket of an operation"""
+
+
+class Overloaded(Exception):
+    """Raised when a low priority operation is shed"""
+
+
+def take_token(state, now, burst, per_minute):
+    """New (tokens, updated) of a bucket after taking a token, and the seconds to wait when there is none"""
+    rate = per_minute / 60
+    tokens, updated = state if state else (burst, now)
+    tokens = min(burst, tokens + (now - updated) * rate)
+
+    if tokens >= 1:
+        return (tokens - 1, now), 0
+
+    return (tokens, now), (1 - tokens) / rate
+
+
+class RateLimiter:
+    """Token buckets shared by every worker through the cache, kept in process while the cache fails.
+
+    The settings refuse a per process cache, which would give every worker buckets of its own.
+
+    A bucket is read and written back without a lock, concurrent requests of one client may
+    overdraw it by a token or two, which is fine for abuse protection.
+    """
+
+    def __init__(self):
+        self._local = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, burst, per_minute):
+        """Take a token from a bucket, returns the seconds to wait, 0 when the request may go on"""
+        now = time.time()
+        cache_key = f'ratelimit:{key}'
+
+        try:
+            state, wait = take_token(cache.get(cache_key), now, burst, per_minute)
+            # Untouched for this long, the bucket is full again and needn't be kept
+            cache.set(cache_key, state, int(burst * 60 / per_minute) + 1)
+        except Exception:
+            logger.warning('Rate limit cache unavailable, using the local buckets', exc_info=True)
+            with self._lock:
+                if len(self._local) > LOCAL_MAX_BUCKETS:
+                    self._local = {k: v for k, v in self._local.items() if now - v[1] < 3600}
+                self._local[key], wait = take_token(self._local.get(key), now, burst, per_minute)
+
+        return wait
+
+
+class LoadShedder:
+    """Latency of the recent requests of the worker and the use of its database pools"""
+
+    def __init__(self, size=1000):
+        self._samples = deque(maxlen=size)
+        self._p95 = 0
+        self._computed_at = 0
+
+    def record(self, duration_ms):
+        self._samples.append((time.monotonic(), duration_ms))
+
+    def p95(self):
+        """p95 latency of the requests of the last SHED_WINDOW seconds, recomputed once a second"""
+        now = time.monotonic()
+
+        if now - self._computed_at >= 1:
+            window = sorted(d for at, d in list(self._samples) if now - at <= settings.SHED_WINDOW)
+            self._p95 = window[int(len(window) * 0.95) - 1] if len(window) >= 20 else 0
+            self._computed_at = now
+
+        return self._p95
+
+    @staticmethod
+    def pool_usage():
+        from .db.pool import pool_stats
+
+        return max((stats['in_use'] / stats['max_size'] for stats in pool_stats().values()), default=0)
+
+    def overloaded(self):
+        return self.p95() > settings.SHED_P95_MS or self.pool_usage() > settings.SHED_POOL_USAGE
+
+
+limiter = RateLimiter()
+shedder = LoadShedder()
+
+
+def client_identity(request):
+    """The user of a valid token, else the address of the client"""
+    user = getattr(request, 'user', None)
+    if user and user.is_authenticated:
+        return f'user:{user.id}'
+
+    address = request.META.get('REMOTE_ADDR', '')
+    forwarded = [part.strip() for part in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if part.strip()]
+    # Only the addresses appended by our own proxies can be trusted
+    if settings.RATE_LIMIT_PROXIES and len(forwarded) >= settings.RATE_LIMIT_PROXIES:
+        address = forwarded[-settings.RATE_LIMIT_PROXIES]
+
+    return f'ip:{address}'
+
+
+def check_operation(request, field_name):
+    """Shed or rate limit a root field of a request, raising when it mustn't run"""
+    if field_name in settings.SHED_OPERATIONS and shedder.overloaded():
+        request.retry_after = max(getattr(request, 'retry_after', 0), 1)
+        request.shed = True
+        raise Overloaded('The server is busy, try again in a moment')
+
+    burst, per_minute = settings.RATE_LIMITS.get(field_name, settings.RATE_LIMITS['default'])
+    wait = limiter.take(f'{field_name}:{client_identity(request)}', burst, per_minute)
+
+    if wait:
+        request.retry_after = max(getattr(request, 'retry_after', 0), int(wait) + 1)
+        raise RateLimitExceeded(f'Too many requests, try again in {int(wait) + 1}s')
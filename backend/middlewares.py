@@ -1,5 +1,13 @@
+import gzip
+
 from .permissions import resolve_paginated
 
+try:
+    import brotli
+except ImportError:  # Responses are gzipped only
+    brotli = None
+
+
 class CustomAuthMiddleware(object):
     """Custom middleware for user authentication"""
 
@@ -30,3 +38,135 @@ class CustomPaginationMiddleware(object):
             return resolve_paginated(query_data=next(root, info, **kwargs).value, info=info, page_info=page)
 
         return next(root, info, **kwargs)
+
+
+class DatabaseRoutingMiddleware(object):
+    """Custom middleware sending all the queries of a mutation to the primary database"""
+    def resolve(self, next, root, info, **kwargs):
+        if root is None and info.operation.operation == 'mutation':
+            from .routers import use_primary
+            use_primary()
+
+        return next(root, info, **kwargs)
+
+
+class RateLimitMiddleware(object):
+    """Custom middleware rate limiting every root field and shedding the low priority ones under load"""
+    def resolve(self, next, root, info, **kwargs):
+        from django.conf import settings
+
+        if root is None and settings.RATE_LIMIT and not info.field_name.startswith('__'):
+            from .limits import check_operation
+            check_operation(info.context, info.field_name)
+
+        return next(root, info, **kwargs)
+
+
+class ReplicaPinningMiddleware(object):
+    """Django middleware keeping the reads of a client on the primary for a while after it wrote"""
+    cookie_name = 'db_primary_pin'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        from django.conf import settings
+        from .routers import begin_request, end_request
+
+        token = begin_request(primary=self.cookie_name in request.COOKIES)
+        try:
+            response = self.get_response(request)
+        finally:
+            state = end_request(token)
+
+        if state.wrote:
+            response.set_cookie(
+                self.cookie_name, '1',
+                max_age=settings.DB_REPLICA_PIN_SECONDS,
+                httponly=True, samesite='Lax'
+            )
+
+        return response
+
+
+def accepted_encodings(header):
+    """{coding: q} of an Accept-Encoding header, codings refused with q=0 included"""
+    accepted = {}
+
+    for item in header.split(','):
+        coding, *params = [part.strip() for part in item.split(';')]
+        if not coding:
+            continue
+
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+
+        accepted[coding.lower()] = q
+
+    return accepted
+
+
+class CompressionMiddleware(object):
+    """Django middleware compressing responses with brotli or gzip, as the client prefers, above a size"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        from django.conf import settings
+        from django.utils.cache import patch_vary_headers
+
+        response = self.get_response(request)
+
+        # Streams like the product export compress themselves
+        if response.streaming or response.has_header('Content-Encoding'):
+            return response
+
+        if len(response.content) < settings.COMPRESSION_MIN_SIZE:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding', ))
+
+        encoding = self.negotiate(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if not encoding:
+            return response
+
+        if encoding == 'br':
+            content = brotli.compress(response.content, quality=settings.COMPRESSION_BROTLI_QUALITY)
+        else:
+            content = gzip.compress(response.content, compresslevel=settings.COMPRESSION_GZIP_LEVEL, mtime=0)
+
+        if len(content) >= len(response.content):
+            return response
+
+        response.content = content
+        response['Content-Length'] = str(len(content))
+        response['Content-Encoding'] = encoding
+
+        # The bytes sent differ from the ones the tag was computed on
+        etag = response.get('ETag', '')
+        if etag.startswith('"'):
+            response['ETag'] = f'W/{etag}'
+
+        return response
+
+    @staticmethod
+    def negotiate(header):
+        """The coding to use, brotli on equal preference as it is the smaller.
+
+        A coding the header names is used as it says, even refused with q=0, * only stands for the others.
+        """
+        accepted = accepted_encodings(header)
+        supported = ('br', 'gzip') if brotli else ('gzip', )
+
+        candidates = [coding for coding in supported if accepted.get(coding, accepted.get('*', 0)) > 0]
+        if not candidates:
+            return None
+
+        return max(candidates, key=lambda coding: accepted.get(coding, accepted.get('*', 0)))
@@ -1,9 +1,14 @@
+import base64
+import datetime
+import json
 import re
 
 import graphene
 from django.conf import settings
 from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db.models import Q
+from django.utils.dateparse import parse_datetime
 
 
 def is_authenticated(function):
@@ -17,6 +22,17 @@ def is_authenticated(function):
     return wrapper
 
 
+def is_staff(function):
+    """Decorator for check the user from the request is a staff member"""
+    def wrapper(cls, info, **kwargs):
+        if not info.context.user or not info.context.user.is_staff:
+            raise Exception("U aren't allowed to perform operation")
+
+        return function(cls, info, **kwargs)
+
+    return wrapper
+
+
 def paginate(model_type):
     """Create pagination query"""
 
@@ -60,6 +76,88 @@ def resolve_paginated(query_data, info, page_info):
     return get_paginated_data(query_data, info.return_type, page_info)
 
 
+def keyset_paginate(model_type, name=None, **extra_fields):
+    """Create cursor pagination query, for lists too long to count and jump through pages"""
+
+    structure = {
+        'end_cursor': graphene.String(),
+        'has_next': graphene.Boolean(),
+        'result': graphene.List(model_type),
+        **extra_fields
+    }
+
+    return type(name or f'{model_type}Keyset', (graphene.ObjectType, ), structure)
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    """DjangoJSONEncoder keeping the microseconds of datetimes, which it cuts to milliseconds"""
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return {'datetime': o.isoformat()}
+        return super().default(o)
+
+
+def _decode_datetime(obj):
+    if set(obj) == {'datetime'}:
+        value = parse_datetime(obj['datetime'])
+        if value is None:
+            raise ValueError(obj['datetime'])
+        return value
+    return obj
+
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values, cls=CursorEncoder).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode()), object_hook=_decode_datetime)
+    except Exception:
+        raise Exception("Invalid cursor")
+
+
+def keyset_filter(ordering, values):
+    """Rows strictly after the given values of the ordering fields"""
+    query = Q()
+    equal = {}
+
+    for field, value in zip(ordering, values):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        query |= Q(**equal, **{f'{name}__{lookup}': value})
+        equal[name] = value
+
+    return query
+
+
+def resolve_keyset(query, ordering, first=None, after=None):
+    """Keyset paginated data, the last ordering field must be unique"""
+    if first is not None and first <= 0:
+        raise Exception("first must be greater than 0")
+
+    page_size = settings.GRAPHENE.get('PAGE_SIZE', 10)
+    first = min(first or page_size, settings.GRAPHENE.get('MAX_PAGE_SIZE', 100))
+
+    if after:
+        values = decode_cursor(after)
+        if len(values) != len(ordering):
+            raise Exception("Invalid cursor")
+        query = query.filter(keyset_filter(ordering, values))
+
+    # One extra row tells whether there is a next page
+    rows = list(query.order_by(*ordering)[:first + 1])
+    has_next = len(rows) > first
+    rows = rows[:first]
+
+    end_cursor = None
+    if rows:
+        end_cursor = encode_cursor([getattr(rows[-1], field.lstrip('-')) for field in ordering])
+
+    return {'end_cursor': end_cursor, 'has_next': has_next, 'result': rows}
+
+
 def normalize_query(query_string, findterms=re.compile(r'"([^"]+)"|(\S+)').findall, normspace=re.compile(r'\s{2,}').sub):
     return [normspace(' ', (t[0] or t[1]).strip()) for t in findterms(query_string)]
 
@@ -0,0 +1,93 @@
+"""
+Routing of reads to replicas and writes to the primary database.
+
+Reads only go to ``settings.DATABASE_REPLICAS`` inside a request that
+``ReplicaPinningMiddleware`` started. Everything else (management commands,
+shells, background threads) stays on the primary. Any alias listed in
+``DATABASE_REPLICAS`` works, e.g. two SQLite files for local development.
+"""
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class RoutingState:
+    """Routing decisions of one request"""
+    __slots__ = ('primary', 'wrote', 'replica')
+
+    def __init__(self, primary=False):
+        self.primary = primary
+        self.wrote = False
+        self.replica = None
+
+
+_state = ContextVar('database_routing_state', default=None)
+
+
+def begin_request(primary=False):
+    """Start routing reads of the current request, returns a token for end_request"""
+    return _state.set(RoutingState(primary=primary))
+
+
+def end_request(token):
+    """Finish the request and return its routing state"""
+    state = _state.get()
+    _state.reset(token)
+    return state
+
+
+def use_primary():
+    """Send every following read of the current request to the primary"""
+    state = _state.get()
+    if state is not None:
+        state.primary = True
+
+
+def _is_cache(model):
+    """Whether a model is the table of a DatabaseCache"""
+    return model is not None and model._meta.app_label == 'django_cache'
+
+
+class PrimaryReplicaRouter:
+    """Router sending writes to the primary and request reads to a replica.
+
+    The cache table is always read and written on the primary, its writes (rate limit buckets, cached
+    wish lists) aren't writes of the client and don't pin its reads.
+    """
+
+    def db_for_read(self, model, **hints):
+        if _is_cache(model):
+            return DEFAULT_DB_ALIAS
+
+        state = _state.get()
+        replicas = getattr(settings, 'DATABASE_REPLICAS', [])
+
+        if state is None or state.primary or not replicas:
+            return DEFAULT_DB_ALIAS
+
+        # Reads inside a transaction must see its own writes
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+
+        if state.replica is None:
+            state.replica = random.choice(replicas)
+
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None and not _is_cache(model):
+            # Read your own writes for the rest of the request
+            state.primary = True
+            state.wrote = True
+
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
@@ -1,10 +1,39 @@
 import graphene
 
+from backend.db.pool import pool_stats
+from backend.permissions import is_staff
 from product.schema import schema as product_schema
 from user.schema import schema as user_schema
 
 
-class Query(user_schema.Query, product_schema.Query, graphene.ObjectType):
+class DatabasePoolType(graphene.ObjectType):
+    """Response with connection pool statistics of the serving worker"""
+    alias = graphene.String()
+    size = graphene.Int()
+    idle = graphene.Int()
+    in_use = graphene.Int()
+    min_size = graphene.Int()
+    max_size = graphene.Int()
+    connections_created = graphene.Int()
+    connections_closed = graphene.Int()
+    checkouts = graphene.Int()
+    waits = graphene.Int()
+    timeouts = graphene.Int()
+    health_check_failures = graphene.Int()
+
+
+class SystemQuery(graphene.ObjectType):
+    database_pools = graphene.List(
+        DatabasePoolType,
+        description='Response data about the database connection pools of the serving worker'
+    )
+
+    @is_staff
+    def resolve_database_pools(self, info):
+        return [DatabasePoolType(alias=alias, **stats) for alias, stats in pool_stats().items()]
+
+
+class Query(user_schema.Query, product_schema.Query, SystemQuery, graphene.ObjectType):
     pass
 
 
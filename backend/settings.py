@@ -11,10 +11,12 @@ https://docs.djangoproject.com/en/3.2/ref/settings/
 """
 
 import os
+import tempfile
 from pathlib import Path
 
 import whitenoise.middleware
-from decouple import config
+from decouple import Csv, config
+from django.core.exceptions import ImproperlyConfigured
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 import backend.middlewares
@@ -48,7 +50,8 @@ INSTALLED_APPS = [
 
     # My apps
     'user.apps.UserConfig',
-    'product.apps.ProductConfig'
+    'product.apps.ProductConfig',
+    'jobs.apps.JobsConfig'
 ]
 
 AUTH_USER_MODEL = 'user.User'
@@ -56,10 +59,12 @@ AUTH_USER_MODEL = 'user.User'
 MIDDLEWARE = [
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'backend.middlewares.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'backend.middlewares.ReplicaPinningMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -88,23 +93,73 @@ WSGI_APPLICATION = 'backend.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
+# django.db.backends.sqlite3 with a file as DB_NAME works for trying the routing locally
+DB_ENGINE = config('DB_ENGINE', default='backend.db.postgresql')
 DB_NAME = config('DB_NAME')
-DB_USER = config('DB_USER')
-DB_PASSWORD = config('DB_PASSWORD')
-DB_HOST = config('DB_HOST')
-DB_PORT = config('DB_PORT')
+DB_USER = config('DB_USER', default='')
+DB_PASSWORD = config('DB_PASSWORD', default='')
+DB_HOST = config('DB_HOST', default='')
+DB_PORT = config('DB_PORT', default='')
+
+# Seconds a connection is kept open between requests (0 closes it after every request)
+DB_CONN_MAX_AGE = config('DB_CONN_MAX_AGE', default=60, cast=int)
+# Ping a reused connection before the first query of a request
+DB_CONN_HEALTH_CHECKS = config('DB_CONN_HEALTH_CHECKS', default=True, cast=bool)
+
+# In-process pool bounding the connections of every worker
+DB_POOL = config('DB_POOL', default=False, cast=bool)
+DB_POOL_MIN_SIZE = config('DB_POOL_MIN_SIZE', default=1, cast=int)
+DB_POOL_MAX_SIZE = config('DB_POOL_MAX_SIZE', default=10, cast=int)
+DB_POOL_TIMEOUT = config('DB_POOL_TIMEOUT', default=10, cast=int)
+DB_POOL_MAX_LIFETIME = config('DB_POOL_MAX_LIFETIME', default=3600, cast=int)
+DB_POOL_MAX_IDLE = config('DB_POOL_MAX_IDLE', default=300, cast=int)
+
+# Transaction pooling in PgBouncer can't keep server-side cursors alive between
+# transactions. psycopg2 never uses server-side prepared statements, so the
+# cursors are the only thing to turn off.
+DB_PGBOUNCER = config('DB_PGBOUNCER', default=False, cast=bool)
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql_psycopg2',
+        'ENGINE': DB_ENGINE,
         'NAME': DB_NAME,
         'USER': DB_USER,
         'PASSWORD': DB_PASSWORD,
         'HOST': DB_HOST,
-        'PORT': DB_PORT
+        'PORT': DB_PORT,
+        # Pooled connections go back to the pool at the end of every request
+        'CONN_MAX_AGE': 0 if DB_POOL else DB_CONN_MAX_AGE,
+        'HEALTH_CHECKS': DB_CONN_HEALTH_CHECKS,
+        'POOL': {
+            'MIN_SIZE': DB_POOL_MIN_SIZE,
+            'MAX_SIZE': DB_POOL_MAX_SIZE,
+            'TIMEOUT': DB_POOL_TIMEOUT,
+            'MAX_LIFETIME': DB_POOL_MAX_LIFETIME,
+            'MAX_IDLE': DB_POOL_MAX_IDLE,
+        } if DB_POOL else None,
+        'DISABLE_SERVER_SIDE_CURSORS': DB_PGBOUNCER,
     }
 }
 
+# Streaming replicas serving the reads of GraphQL queries, one alias per host
+DB_REPLICA_HOSTS = config('DB_REPLICA_HOSTS', default='', cast=Csv())
+# Replicas by database name instead, e.g. other SQLite files or databases of the same server for local testing
+DB_REPLICA_NAMES = config('DB_REPLICA_NAMES', default='', cast=Csv())
+# Seconds the reads of a client stay on the primary after it wrote
+DB_REPLICA_PIN_SECONDS = config('DB_REPLICA_PIN_SECONDS', default=5, cast=int)
+
+_replicas = [{'HOST': host} for host in DB_REPLICA_HOSTS] + [{'NAME': name} for name in DB_REPLICA_NAMES]
+
+for index, replica in enumerate(_replicas, start=1):
+    DATABASES[f'replica_{index}'] = {
+        **DATABASES['default'],
+        **replica,
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['backend.routers.PrimaryReplicaRouter']
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -166,7 +221,130 @@ AWS_S3_OBJECT_PARAMETERS = {
     'CacheControl': 'max-age=86400'
 }
 
-DEFAULT_FILE_STORAGE = 'backend.storage_backends.MediaStorage'
+# 's3' for the bucket or 'local' for the disk stand-in used in development and tests
+MEDIA_STORAGE = config('MEDIA_STORAGE', default='s3')
+MEDIA_ROOT = config('MEDIA_ROOT', default=os.path.join(BASE_DIR, 'media'))
+
+DEFAULT_FILE_STORAGE = {
+    's3': 'backend.storage_backends.MediaStorage',
+    'local': 'backend.storage_backends.LocalMediaStorage',
+}[MEDIA_STORAGE]
+
+# Direct uploads from clients to the storage
+IMAGE_UPLOAD_MAX_SIZE = config('IMAGE_UPLOAD_MAX_SIZE', default=20 * 1024 * 1024, cast=int)
+IMAGE_UPLOAD_EXPIRES = config('IMAGE_UPLOAD_EXPIRES', default=900, cast=int)
+
+# Uploaded images are processed and pushed to the storage by the run_jobs workers, which may run on other
+# hosts. They are staged in the storage, or spooled to IMAGE_SPOOL_DIR when set, a directory every web and
+# worker process must see, e.g. a shared volume.
+IMAGE_SPOOL_DIR = config('IMAGE_SPOOL_DIR', default='')
+IMAGE_MAX_PIXELS = config('IMAGE_MAX_PIXELS', default=40_000_000, cast=int)
+IMAGE_QUALITY = config('IMAGE_QUALITY', default=85, cast=int)
+
+# Resized copies of every image, rendered by a pool of worker processes
+IMAGE_DERIVATIVE_WIDTHS = config('IMAGE_DERIVATIVE_WIDTHS', default='160,320,640,1280', cast=Csv(int))
+IMAGE_DERIVATIVE_PROCESSES = config('IMAGE_DERIVATIVE_PROCESSES', default=os.cpu_count() or 1, cast=int)
+
+# Streaming catalog export: rows fetched per server-side cursor round trip and gzip level
+EXPORT_CHUNK_SIZE = config('EXPORT_CHUNK_SIZE', default=2000, cast=int)
+EXPORT_GZIP_LEVEL = config('EXPORT_GZIP_LEVEL', default=6, cast=int)
+
+# Bulk product imports: rows validated and written per batch and reported errors, run by the job workers
+PRODUCT_IMPORT_BATCH_SIZE = config('PRODUCT_IMPORT_BATCH_SIZE', default=1000, cast=int)
+PRODUCT_IMPORT_MAX_ERRORS = config('PRODUCT_IMPORT_MAX_ERRORS', default=1000, cast=int)
+
+# Memory-mapped columns of the catalog shared by every worker, built by build_catalog_snapshot --watch.
+# Listings stop reading a snapshot the builder hasn't confirmed for CATALOG_SNAPSHOT_MAX_AGE seconds.
+CATALOG_SNAPSHOT = config('CATALOG_SNAPSHOT', default=False, cast=bool)
+CATALOG_SNAPSHOT_DIR = config('CATALOG_SNAPSHOT_DIR', default=os.path.join(tempfile.gettempdir(), 'catalog-snapshot'))
+CATALOG_SNAPSHOT_CHECK_INTERVAL = config('CATALOG_SNAPSHOT_CHECK_INTERVAL', default=1, cast=float)
+CATALOG_SNAPSHOT_MAX_AGE = config('CATALOG_SNAPSHOT_MAX_AGE', default=60, cast=int)
+
+# "Frequently bought together" products built by build_related_products
+RELATED_PRODUCTS_TOP_K = config('RELATED_PRODUCTS_TOP_K', default=20, cast=int)
+RELATED_PRODUCTS_MIN_SUPPORT = config('RELATED_PRODUCTS_MIN_SUPPORT', default=2, cast=int)
+RELATED_PRODUCTS_CHUNK_SIZE = config('RELATED_PRODUCTS_CHUNK_SIZE', default=100000, cast=int)
+
+# Popularity counters: shards per hour, events buffered by a worker before a flush, score windows
+# and the hours refresh_popularity looks back for products whose counters left a window
+POPULARITY_SHARDS = config('POPULARITY_SHARDS', default=8, cast=int)
+POPULARITY_FLUSH_SIZE = config('POPULARITY_FLUSH_SIZE', default=1000, cast=int)
+POPULARITY_FLUSH_INTERVAL = config('POPULARITY_FLUSH_INTERVAL', default=10, cast=float)
+POPULARITY_TRENDING_HOURS = config('POPULARITY_TRENDING_HOURS', default=24, cast=int)
+POPULARITY_POPULAR_DAYS = config('POPULARITY_POPULAR_DAYS', default=30, cast=int)
+POPULARITY_REFRESH_LOOKBACK = config('POPULARITY_REFRESH_LOOKBACK', default=2, cast=int)
+
+# Cache shared by every worker process: a table of the database by default (manage.py createcachetable),
+# a memcached server in production (CACHE_BACKEND=django.core.cache.backends.memcached.PyMemcacheCache,
+# CACHE_LOCATION=host:port). LocMemCache is per process, only fit for a single process development server.
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.db.DatabaseCache'),
+        'LOCATION': config('CACHE_LOCATION', default='cache_table'),
+        'KEY_PREFIX': config('CACHE_KEY_PREFIX', default='backend'),
+    }
+}
+CACHE_IS_LOCAL = CACHES['default']['BACKEND'] == 'django.core.cache.backends.locmem.LocMemCache'
+
+if CACHE_IS_LOCAL and not config('DEBUG', cast=bool):
+    # Every process would keep its own wish lists, stale for WISHLIST_CACHE_TIMEOUT after a change
+    raise ImproperlyConfigured('LocMemCache is per process, set CACHE_BACKEND to a shared cache')
+
+# Seconds a user's wished product ids stay cached, changes to the wish list drop them right away
+WISHLIST_CACHE_TIMEOUT = config('WISHLIST_CACHE_TIMEOUT', default=3600, cast=int)
+
+# Dotted path of the (data, pretty) -> bytes function encoding GraphQL responses,
+# empty for orjson when it is installed and the json module otherwise
+GRAPHQL_JSON_ENCODER = config('GRAPHQL_JSON_ENCODER', default='')
+
+# Token buckets of the GraphQL root fields, (burst, requests per minute) per user or client address.
+# RATE_LIMIT_PROXIES is the number of proxies in front of the application appending to X-Forwarded-For.
+RATE_LIMIT = config('RATE_LIMIT', default=True, cast=bool)
+RATE_LIMITS = {
+    'default': (60, 600),
+    'products': (20, 120),
+    'loginUser': (5, 10),
+    'registerUser': (3, 5),
+    'getAccess': (10, 30),
+    'importProducts': (2, 6),
+    'completePayment': (5, 20),
+}
+RATE_LIMIT_PROXIES = config('RATE_LIMIT_PROXIES', default=0, cast=int)
+
+if RATE_LIMIT and CACHE_IS_LOCAL:
+    # Every process would keep its own buckets, multiplying the limits by the number of workers
+    raise ImproperlyConfigured('Rate limiting needs a shared cache, set CACHE_BACKEND or RATE_LIMIT=False')
+
+# Low priority root fields refused while the p95 latency of the last SHED_WINDOW seconds
+# or the use of a database pool is above its threshold
+SHED_OPERATIONS = ('products', 'businessStats', 'businessOrders', 'relatedProducts', 'reviews')
+SHED_P95_MS = config('SHED_P95_MS', default=2000, cast=int)
+SHED_POOL_USAGE = config('SHED_POOL_USAGE', default=0.9, cast=float)
+SHED_WINDOW = config('SHED_WINDOW', default=30, cast=int)
+
+# Responses smaller than COMPRESSION_MIN_SIZE bytes are sent as they are
+COMPRESSION_MIN_SIZE = config('COMPRESSION_MIN_SIZE', default=1024, cast=int)
+COMPRESSION_GZIP_LEVEL = config('COMPRESSION_GZIP_LEVEL', default=6, cast=int)
+COMPRESSION_BROTLI_QUALITY = config('COMPRESSION_BROTLI_QUALITY', default=5, cast=int)
+
+# Background jobs run by manage.py run_jobs: worker threads, seconds an idle worker waits, attempts and
+# exponential retry backoff. Running jobs have their lock renewed every JOBS_HEARTBEAT_INTERVAL seconds
+# and are retried by another worker once it is JOBS_LOCK_TIMEOUT seconds old.
+JOBS_CONCURRENCY = config('JOBS_CONCURRENCY', default=4, cast=int)
+JOBS_POLL_INTERVAL = config('JOBS_POLL_INTERVAL', default=1, cast=float)
+JOBS_MAX_ATTEMPTS = config('JOBS_MAX_ATTEMPTS', default=5, cast=int)
+JOBS_RETRY_DELAY = config('JOBS_RETRY_DELAY', default=10, cast=float)
+JOBS_RETRY_MAX_DELAY = config('JOBS_RETRY_MAX_DELAY', default=3600, cast=float)
+JOBS_HEARTBEAT_INTERVAL = config('JOBS_HEARTBEAT_INTERVAL', default=30, cast=float)
+JOBS_LOCK_TIMEOUT = config('JOBS_LOCK_TIMEOUT', default=300, cast=int)
+JOBS_KEEP_DAYS = config('JOBS_KEEP_DAYS', default=7, cast=int)
+
+# Recurring jobs, name: (task, seconds between the end of a run and the next one)
+JOBS_SCHEDULE = {
+    'refresh_popularity': ('product.tasks.refresh_popularity', 60),
+    'build_related_products': ('product.tasks.build_related_products', 24 * 60 * 60),
+    'prune_jobs': ('jobs.tasks.prune_jobs', 60 * 60),
+}
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
@@ -176,10 +354,14 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 GRAPHENE = {
     'SCHEMA': 'backend.schema.schema',
     'MIDDLEWARE': [
+        # Listed first to run innermost, once CustomAuthMiddleware has set the user
+        'backend.middlewares.RateLimitMiddleware',
         'backend.middlewares.CustomAuthMiddleware',
-        'backend.middlewares.CustomPaginationMiddleware'
+        'backend.middlewares.CustomPaginationMiddleware',
+        'backend.middlewares.DatabaseRoutingMiddleware'
     ],
-    'PAGE_SIZE': 10
+    'PAGE_SIZE': 10,
+    'MAX_PAGE_SIZE': 100
 }
 
 CORS_ALLOW_ALL_ORIGINS = True
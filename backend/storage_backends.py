@@ -1,6 +1,43 @@
+from django.core import signing
+from django.core.files.storage import FileSystemStorage
+from django.urls import reverse
 from storages.backends.s3boto3 import S3Boto3Storage
 
+LOCAL_UPLOAD_SALT = 'backend.storage_backends.local_upload'
+
 
 class MediaStorage(S3Boto3Storage):
     location = 'media'
     file_overwrite = False
+
+    def presigned_upload(self, name, content_type, max_size, expires):
+        """Form target letting a client POST a file straight into the bucket"""
+        key = self._normalize_name(self._clean_name(name))
+
+        return self.bucket.meta.client.generate_presigned_post(
+            Bucket=self.bucket_name,
+            Key=key,
+            Fields={'Content-Type': content_type},
+            Conditions=[
+                {'Content-Type': content_type},
+                ['content-length-range', 1, max_size]
+            ],
+            ExpiresIn=expires
+        )
+
+
+class LocalMediaStorage(FileSystemStorage):
+    """Media on the local disk, a stand-in for the bucket in development and tests"""
+
+    def presigned_upload(self, name, content_type, max_size, expires):
+        """Form target accepted by the local upload view, mirroring a presigned POST"""
+        # The view checks the age of the token against IMAGE_UPLOAD_EXPIRES
+        token = signing.dumps(
+            {'name': name, 'content_type': content_type, 'max_size': max_size},
+            salt=LOCAL_UPLOAD_SALT
+        )
+
+        return {
+            'url': reverse('local-upload'),
+            'fields': {'Content-Type': content_type, 'token': token}
+        }
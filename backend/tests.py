@@ -0,0 +1,159 @@
+from types import SimpleNamespace
+from unittest import mock
+
+from django.db import DEFAULT_DB_ALIAS
+from django.http import HttpResponse
+from django.core.cache import cache
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+
+from .limits import RateLimiter
+from .middlewares import (
+    CompressionMiddleware, DatabaseRoutingMiddleware, ReplicaPinningMiddleware, accepted_encodings
+)
+from .routers import PrimaryReplicaRouter, begin_request, end_request
+
+
+@override_settings(DATABASE_REPLICAS=['replica_1', 'replica_2'], DB_REPLICA_PIN_SECONDS=5)
+class PrimaryReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.router = PrimaryReplicaRouter()
+        self.factory = RequestFactory()
+
+    def request(self, view, cookies=None):
+        """Run a view through ReplicaPinningMiddleware, returns the response"""
+        request = self.factory.post('/graphview/')
+        request.COOKIES.update(cookies or {})
+        return ReplicaPinningMiddleware(view)(request)
+
+    def resolve_mutation(self):
+        info = SimpleNamespace(operation=SimpleNamespace(operation='mutation'))
+        DatabaseRoutingMiddleware().resolve(lambda root, info: None, None, info)
+
+    def test_reads_outside_a_request_use_the_primary(self):
+        self.assertEqual(self.router.db_for_read(None), DEFAULT_DB_ALIAS)
+
+    def test_query_reads_stick_to_one_replica(self):
+        aliases = []
+
+        def view(request):
+            aliases.extend(self.router.db_for_read(None) for _ in range(3))
+            return HttpResponse()
+
+        response = self.request(view)
+
+        self.assertIn(aliases[0], ('replica_1', 'replica_2'))
+        self.assertEqual(len(set(aliases)), 1)
+        self.assertNotIn(ReplicaPinningMiddleware.cookie_name, response.cookies)
+
+    def test_mutation_reads_use_the_primary(self):
+        aliases = []
+
+        def view(request):
+            self.resolve_mutation()
+            aliases.append(self.router.db_for_read(None))
+            return HttpResponse()
+
+        self.request(view)
+
+        self.assertEqual(aliases, [DEFAULT_DB_ALIAS])
+
+    def test_write_pins_the_following_requests(self):
+        aliases = []
+
+        def write(request):
+            self.router.db_for_write(None)
+            aliases.append(self.router.db_for_read(None))
+            return HttpResponse()
+
+        def read(request):
+            aliases.append(self.router.db_for_read(None))
+            return HttpResponse()
+
+        cookie = self.request(write).cookies[ReplicaPinningMiddleware.cookie_name]
+        self.assertEqual(cookie['max-age'], 5)
+
+        self.request(read, cookies={ReplicaPinningMiddleware.cookie_name: cookie.value})
+        self.request(read)
+
+        self.assertEqual(aliases[:2], [DEFAULT_DB_ALIAS, DEFAULT_DB_ALIAS])
+        self.assertIn(aliases[2], ('replica_1', 'replica_2'))
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_no_replicas(self):
+        aliases = []
+
+        def view(request):
+            aliases.append(self.router.db_for_read(None))
+            return HttpResponse()
+
+        self.request(view)
+
+        self.assertEqual(aliases, [DEFAULT_DB_ALIAS])
+
+
+class NegotiationTests(SimpleTestCase):
+    def negotiate(self, header):
+        return CompressionMiddleware.negotiate(header)
+
+    def test_preferences(self):
+        self.assertEqual(self.negotiate(''), None)
+        self.assertEqual(self.negotiate('gzip'), 'gzip')
+        self.assertEqual(self.negotiate('gzip, br'), 'br')
+        self.assertEqual(self.negotiate('br;q=0.5, gzip'), 'gzip')
+        self.assertEqual(self.negotiate('identity'), None)
+
+    def test_refused_codings_are_not_picked_by_the_wildcard(self):
+        self.assertEqual(self.negotiate('gzip;q=0, *'), 'br')
+        self.assertEqual(self.negotiate('br;q=0, gzip;q=0, *;q=0.1'), None)
+        self.assertEqual(self.negotiate('br;q=0, *'), 'gzip')
+        self.assertEqual(self.negotiate('*;q=0'), None)
+
+    def test_parameters(self):
+        self.assertEqual(accepted_encodings('GZIP; Q=0.5, br;level=1;q=0'), {'gzip': 0.5, 'br': 0.0})
+
+
+class RateLimiterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_buckets_are_shared_through_the_cache(self):
+        # Two limiters stand for two worker processes
+        workers = (RateLimiter(), RateLimiter())
+
+        waits = [workers[number % 2].take('loginUser:ip:1', 5, 10) for number in range(6)]
+
+        self.assertEqual(waits[:5], [0] * 5)
+        self.assertGreater(waits[5], 0)
+
+    def test_local_buckets_while_the_cache_fails(self):
+        limiter = RateLimiter()
+
+        with mock.patch.object(cache, 'get', side_effect=ConnectionError):
+            waits = [limiter.take('loginUser:ip:1', 2, 10) for _ in range(3)]
+
+        self.assertEqual(waits[:2], [0, 0])
+        self.assertGreater(waits[2], 0)
+
+
+# The test database stands in for the replica, the reads of a TestCase stay in its transaction anyway
+@override_settings(DATABASE_REPLICAS=['default'], RATE_LIMIT=True)
+class CacheRoutingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_rate_limiting_doesnt_pin_to_the_primary(self):
+        token = begin_request()
+        RateLimiter().take('loginUser:ip:1', 5, 10)
+        state = end_request(token)
+
+        self.assertFalse(state.primary)
+        self.assertFalse(state.wrote)
+
+    def test_rate_limited_query_sets_no_pin_cookie(self):
+        response = self.client.post(
+            '/graphview/', {'query': '{ categories { id } }'}, content_type='application/json'
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('errors', response.json())
+        self.assertNotIn(ReplicaPinningMiddleware.cookie_name, response.cookies)
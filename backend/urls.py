@@ -17,10 +17,19 @@ from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path
-from graphene_file_upload.django import FileUploadGraphQLView
 from django.views.decorators.csrf import csrf_exempt
 
+from backend.views import GraphQLView
+from product.views import product_export
+from user.views import local_upload
+
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path('graphview/', csrf_exempt(FileUploadGraphQLView.as_view(graphiql=True))),
+    path('graphview/', csrf_exempt(GraphQLView.as_view(graphiql=True))),
+    path('export/products/', product_export, name='product-export'),
 ] + static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
+
+if settings.MEDIA_STORAGE == 'local':
+    urlpatterns += [
+        path('uploads/local/', local_upload, name='local-upload'),
+    ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -0,0 +1,79 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.http import HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+from django.utils.module_loading import import_string
+from graphene_file_upload.django import FileUploadGraphQLView
+
+from .encoders import default_encoder
+from .limits import shedder
+
+
+def etag_matches(if_none_match, etag):
+    """Weak comparison of an If-None-Match header with an ETag, as GET requests allow"""
+    if not if_none_match:
+        return False
+
+    etags = parse_etags(if_none_match)
+    if '*' in etags:
+        return True
+
+    return etag.replace('W/', '', 1) in {tag.replace('W/', '', 1) for tag in etags}
+
+
+class GraphQLView(FileUploadGraphQLView):
+    """GraphQL endpoint tagging the results of GET queries, so clients can revalidate them for a 304"""
+
+    # Callable (data, pretty) -> bytes, GRAPHQL_JSON_ENCODER or orjson when installed
+    encoder = None
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+
+        if self.encoder is None:
+            path = settings.GRAPHQL_JSON_ENCODER
+            self.encoder = import_string(path) if path else default_encoder()
+
+    def json_encode(self, request, d, pretty=False):
+        encoded = self.encoder(d, pretty=self.pretty or pretty or bool(request.GET.get('pretty')))
+        # Batched results are joined as text by the parent view
+        return encoded.decode() if self.batch else encoded
+
+    def dispatch(self, request, *args, **kwargs):
+        started = time.perf_counter()
+        response = super().dispatch(request, *args, **kwargs)
+        shedder.record((time.perf_counter() - started) * 1000)
+
+        # Set by the RateLimitMiddleware when it refused a field
+        if getattr(request, 'retry_after', None) and response.status_code == 200:
+            response.status_code = 503 if getattr(request, 'shed', False) else 429
+            response['Retry-After'] = str(request.retry_after)
+            return response
+
+        # Mutations are POST only, a GET is always a query
+        if request.method != 'GET' or response.status_code != 200 or response.streaming:
+            return response
+
+        if not response.get('Content-Type', '').startswith('application/json'):
+            return response
+
+        # Strong, from the uncompressed body: the same result always gets the same tag
+        response['ETag'] = f'"{hashlib.blake2b(response.content, digest_size=16).hexdigest()}"'
+        response['Cache-Control'] = 'private, no-cache'
+        # Results depend on the user the token belongs to
+        patch_vary_headers(response, ('Authorization', ))
+
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if etag_matches(if_none_match, response['ETag']):
+            not_modified = HttpResponseNotModified()
+            for header in ('ETag', 'Cache-Control', 'Vary'):
+                not_modified[header] = response[header]
+            # Compressed responses carried the weak form of the tag
+            if f"W/{response['ETag']}" in if_none_match:
+                not_modified['ETag'] = f"W/{response['ETag']}"
+            return not_modified
+
+        return response
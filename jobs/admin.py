@@ -0,0 +1,27 @@
+from django.contrib import admin
+from django.utils import timezone
+
+from .models import Job
+from .queue import queue_stats
+
+
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'task', 'status', 'priority', 'run_at', 'attempts', 'started_at', 'finished_at')
+    list_filter = ('status', 'task')
+    search_fields = ('task', 'key')
+    actions = ('retry', )
+
+    def changelist_view(self, request, extra_context=None):
+        # Depth and latency per task above the list
+        return super().changelist_view(request, {**(extra_context or {}), 'queue_stats': queue_stats()})
+
+    @admin.action(description='Retry the selected failed jobs')
+    def retry(self, request, queryset):
+        pending_keys = Job.objects.filter(status__in=(Job.QUEUED, Job.RUNNING)).exclude(key='').values('key')
+        retried = queryset.filter(status=Job.FAILED).exclude(key__in=pending_keys).update(
+            status=Job.QUEUED, run_at=timezone.now(), attempts=0, finished_at=None
+        )
+        self.message_user(request, f'{retried} jobs queued again')
+
+
+admin.site.register(Job, JobAdmin)
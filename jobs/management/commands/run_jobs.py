@@ -0,0 +1,82 @@
+import logging
+import os
+import signal
+import socket
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from jobs import worker
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Run the queued background jobs, with a number of worker threads, until stopped'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=settings.JOBS_CONCURRENCY, help='Worker threads')
+        parser.add_argument(
+            '--interval', type=float, default=settings.JOBS_POLL_INTERVAL,
+            help='Seconds a worker waits before looking again when nothing is due'
+        )
+        parser.add_argument('--once', action='store_true', help='Exit once no job is due')
+
+    def handle(self, *args, **options):
+        stop = threading.Event()
+        prefix = f'{socket.gethostname()}:{os.getpid()}'
+        names = [f'{prefix}:{number}' for number in range(options['concurrency'])]
+
+        # Running jobs are finished before exiting
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *args: stop.set())
+
+        self.maintain()
+
+        threads = [
+            threading.Thread(
+                target=worker.work, args=(name, stop, options['interval']), kwargs={'drain': options['once']},
+                name=f'jobs-{number}'
+            ) for number, name in enumerate(names)
+        ]
+        for thread in threads:
+            thread.start()
+
+        self.stdout.write(f'Started {len(threads)} workers as {prefix}')
+
+        beat = time.monotonic()
+        # Locks are renewed until the last running job is finished, stopping or not
+        while True:
+            alive = [thread for thread in threads if thread.is_alive()]
+            if not alive:
+                break
+
+            alive[0].join(1)
+            if time.monotonic() - beat < settings.JOBS_HEARTBEAT_INTERVAL:
+                continue
+
+            beat = time.monotonic()
+            try:
+                worker.heartbeat(names)
+            except Exception:
+                logger.exception('Renewing the locks of the running jobs failed')
+            if not stop.is_set():
+                self.maintain()
+
+        self.stdout.write('Stopped')
+
+    def maintain(self):
+        close_old_connections()
+        try:
+            recovered = worker.recover_stale()
+            scheduled = worker.ensure_schedule()
+        except Exception:
+            # The workers go on, the next round tries again
+            logger.exception('Job queue maintenance failed')
+            return
+
+        if recovered or scheduled:
+            self.stdout.write(f'Recovered {recovered} stale jobs, scheduled {scheduled}')
@@ -0,0 +1,55 @@
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+from django.db.models import Q
+from django.utils import timezone
+
+
+class Job(models.Model):
+    """Class for creation a background job table in a database, run by the run_jobs workers"""
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    STATUS_CHOICES = (
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed')
+    )
+
+    # Registered name of the task, the dotted path of its function
+    task = models.CharField(max_length=255)
+    # Keyword arguments of the task
+    payload = models.JSONField(default=dict, blank=True, encoder=DjangoJSONEncoder)
+    # At most one queued or running job per key, e.g. the next run of a scheduled job
+    key = models.CharField(max_length=255, blank=True, default='')
+    status = models.CharField(max_length=8, choices=STATUS_CHOICES, default=QUEUED)
+    priority = models.SmallIntegerField(default=0)
+    run_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    last_error = models.TextField(blank=True)
+    locked_by = models.CharField(max_length=128, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ('-created_at', )
+        constraints = [
+            models.UniqueConstraint(
+                fields=('key', ), condition=Q(status__in=('queued', 'running')) & ~Q(key=''),
+                name='unique_pending_job_key'
+            ),
+        ]
+        indexes = [
+            # Only the queued jobs are scanned by the workers claiming the next one
+            models.Index(fields=('-priority', 'run_at'), condition=Q(status='queued'), name='job_queued_idx'),
+            models.Index(fields=('status', 'finished_at'), name='job_status_finished_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.task}    |    {self.status}    |    {self.run_at}"
@@ -0,0 +1,99 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Avg, Count, F, Min, Q
+from django.utils import timezone
+
+# Finished jobs the wait and run times of the admin are averaged over
+STATS_WINDOW = timedelta(hours=1)
+
+# Keys of the pending runs of the JOBS_SCHEDULE entries
+SCHEDULE_PREFIX = 'schedule:'
+
+_registry = {}
+
+
+def task_name(task):
+    return task if isinstance(task, str) else f'{task.__module__}.{task.__name__}'
+
+
+def task(func=None, *, priority=0, max_attempts=None, atomic=False):
+    """Register a function as a task the workers can run, as @task or @task(...).
+
+    An atomic task runs in the transaction marking its job done, so its writes are never applied twice.
+    """
+    def register(func):
+        _registry[task_name(func)] = {
+            'func': func, 'priority': priority, 'max_attempts': max_attempts, 'atomic': atomic
+        }
+        return func
+
+    return register(func) if func else register
+
+
+def get_task(name):
+    return _registry.get(name)
+
+
+def enqueue(task, payload=None, run_at=None, delay=0, priority=None, key=''):
+    """Queue a job in the current transaction, the workers only see it once the transaction commits.
+
+    While a job with the same key is queued or running nothing is queued and None is returned.
+    """
+    from .models import Job
+
+    name = task_name(task)
+    options = get_task(name)
+    if options is None:
+        raise Exception(f'Unknown task {name}')
+
+    job = Job(
+        task=name,
+        payload=payload or {},
+        key=key,
+        run_at=run_at or timezone.now() + timedelta(seconds=delay),
+        priority=options['priority'] if priority is None else priority,
+        max_attempts=options['max_attempts'] or settings.JOBS_MAX_ATTEMPTS
+    )
+
+    if not key:
+        job.save()
+        return job
+
+    try:
+        with transaction.atomic():
+            job.save()
+    except IntegrityError:
+        return None
+
+    return job
+
+
+def queue_stats(now=None):
+    """Depth and latency of the queue per task: jobs waiting, due, running and failed, the age of the
+    oldest due job, and the average wait and run time of the jobs finished in the last STATS_WINDOW"""
+    from .models import Job
+
+    now = now or timezone.now()
+    recent = Q(status=Job.DONE, finished_at__gte=now - STATS_WINDOW)
+
+    rows = Job.objects.filter(Q(status__in=(Job.QUEUED, Job.RUNNING, Job.FAILED)) | recent).values('task').annotate(
+        queued=Count('id', filter=Q(status=Job.QUEUED)),
+        due=Count('id', filter=Q(status=Job.QUEUED, run_at__lte=now)),
+        running=Count('id', filter=Q(status=Job.RUNNING)),
+        failed=Count('id', filter=Q(status=Job.FAILED)),
+        done=Count('id', filter=recent),
+        oldest_due=Min('run_at', filter=Q(status=Job.QUEUED, run_at__lte=now)),
+        wait=Avg(F('started_at') - F('run_at'), filter=recent),
+        duration=Avg(F('finished_at') - F('started_at'), filter=recent),
+    ).order_by('task')
+
+    stats = list(rows)
+    for row in stats:
+        oldest_due = row.pop('oldest_due')
+        row['lag'] = (now - oldest_due).total_seconds() if oldest_due else 0
+        row['wait'] = row['wait'].total_seconds() if row['wait'] is not None else None
+        row['duration'] = row['duration'].total_seconds() if row['duration'] is not None else None
+
+    return stats
@@ -0,0 +1,8 @@
+from .queue import task
+from .worker import prune
+
+
+@task
+def prune_jobs():
+    """Delete the old finished jobs"""
+    prune()
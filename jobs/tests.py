@@ -0,0 +1,138 @@
+import threading
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from .models import Job
+from .queue import SCHEDULE_PREFIX, enqueue, task
+from .worker import claim, complete, recover_stale, retry_delay, run_job
+
+SCHEDULE = {'noop': ('jobs.tests.noop', 60)}
+
+
+@task
+def noop():
+    pass
+
+
+@task(max_attempts=2)
+def broken():
+    raise Exception('Broken on purpose')
+
+
+class ClaimTests(TransactionTestCase):
+    def test_claim_skips_rows_locked_by_another_worker(self):
+        now = timezone.now()
+        locked = enqueue(noop, run_at=now - timedelta(seconds=2))
+        free = enqueue(noop, run_at=now - timedelta(seconds=1))
+        holding, release = threading.Event(), threading.Event()
+
+        def hold():
+            # Another worker in the middle of claiming the oldest job
+            with transaction.atomic():
+                list(Job.objects.select_for_update().filter(id=locked.id))
+                holding.set()
+                release.wait(10)
+            connection.close()
+
+        thread = threading.Thread(target=hold)
+        thread.start()
+        try:
+            self.assertTrue(holding.wait(10))
+            claimed = claim('worker-2')
+        finally:
+            release.set()
+            thread.join()
+
+        self.assertEqual([job.id for job in claimed], [free.id])
+        self.assertEqual((claimed[0].status, claimed[0].attempts, claimed[0].locked_by), (Job.RUNNING, 1, 'worker-2'))
+        self.assertEqual(Job.objects.get(id=locked.id).status, Job.QUEUED)
+
+    def test_claim_order(self):
+        now = timezone.now()
+        enqueue(noop, run_at=now + timedelta(minutes=1), priority=10)
+        low = enqueue(noop, run_at=now - timedelta(minutes=1))
+        high = enqueue(noop, run_at=now, priority=10)
+
+        self.assertEqual([job.id for job in claim('worker', limit=3, now=now)], [high.id, low.id])
+
+
+@override_settings(JOBS_RETRY_DELAY=10, JOBS_RETRY_MAX_DELAY=60)
+class RetryTests(TestCase):
+    def test_retry_delay(self):
+        self.assertTrue(5 <= retry_delay(1) <= 10)
+        self.assertTrue(10 <= retry_delay(2) <= 20)
+        self.assertTrue(30 <= retry_delay(10) <= 60)
+
+    def test_failed_job_is_retried_after_a_backoff_then_given_up(self):
+        job = enqueue(broken)
+
+        started = timezone.now()
+        run_job(claim('worker')[0])
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.locked_by), (Job.QUEUED, 1, ''))
+        self.assertIn('Broken on purpose', job.last_error)
+        self.assertTrue(started + timedelta(seconds=5) <= job.run_at <= timezone.now() + timedelta(seconds=10))
+        self.assertEqual(claim('worker'), [])
+
+        run_job(claim('worker', now=job.run_at)[0])
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+        self.assertIsNotNone(job.finished_at)
+
+
+@override_settings(JOBS_LOCK_TIMEOUT=300)
+class RecoverStaleTests(TestCase):
+    def running(self, locked_at, attempts):
+        return Job.objects.create(
+            task='jobs.tests.noop', status=Job.RUNNING, locked_by='worker', locked_at=locked_at,
+            attempts=attempts, max_attempts=2
+        )
+
+    def test_recover_stale(self):
+        now = timezone.now()
+        retried = self.running(now - timedelta(seconds=301), attempts=1)
+        given_up = self.running(now - timedelta(seconds=301), attempts=2)
+        alive = self.running(now - timedelta(seconds=10), attempts=1)
+
+        self.assertEqual(recover_stale(now), 2)
+
+        retried.refresh_from_db()
+        self.assertEqual((retried.status, retried.run_at, retried.locked_by), (Job.QUEUED, now, ''))
+        given_up.refresh_from_db()
+        self.assertEqual((given_up.status, given_up.finished_at), (Job.FAILED, now))
+        self.assertEqual(Job.objects.get(id=alive.id).status, Job.RUNNING)
+
+
+@override_settings(JOBS_SCHEDULE=SCHEDULE)
+class ScheduleTests(TestCase):
+    def test_completed_scheduled_job_queues_its_next_run(self):
+        enqueue(noop, key=f'{SCHEDULE_PREFIX}noop')
+
+        job = claim('worker')[0]
+        complete(job)
+
+        following = Job.objects.get(status=Job.QUEUED)
+        self.assertEqual(following.key, f'{SCHEDULE_PREFIX}noop')
+        self.assertAlmostEqual(
+            (following.run_at - Job.objects.get(id=job.id).finished_at).total_seconds(), 60, places=3
+        )
+
+    def test_job_dropped_from_the_schedule_stops(self):
+        enqueue(noop, key=f'{SCHEDULE_PREFIX}noop')
+        job = claim('worker')[0]
+
+        with override_settings(JOBS_SCHEDULE={}):
+            complete(job)
+
+        self.assertFalse(Job.objects.filter(status=Job.QUEUED).exists())
+
+    def test_unscheduled_job_isnt_queued_again(self):
+        enqueue(noop, key='noop')
+        complete(claim('worker')[0])
+
+        self.assertFalse(Job.objects.filter(status=Job.QUEUED).exists())
@@ -0,0 +1,175 @@
+import logging
+import random
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+from .queue import SCHEDULE_PREFIX, enqueue, get_task
+
+logger = logging.getLogger(__name__)
+
+
+class LostLock(Exception):
+    """Raised when the lock of a job expired and another worker claimed it"""
+
+
+def _table(model):
+    return connection.ops.quote_name(model._meta.db_table)
+
+
+def claim(worker, limit=1, now=None):
+    """Lock the next due jobs for a worker in one statement, skipping the rows other workers are claiming"""
+    return list(Job.objects.raw(
+        f'UPDATE {_table(Job)} SET status = %(running)s, locked_by = %(worker)s, locked_at = %(now)s, '
+        f'started_at = %(now)s, attempts = attempts + 1 '
+        f'WHERE id IN (SELECT id FROM {_table(Job)} WHERE status = %(queued)s AND run_at <= %(now)s '
+        f'ORDER BY priority DESC, run_at LIMIT %(limit)s FOR UPDATE SKIP LOCKED) '
+        f'RETURNING *',
+        {
+            'running': Job.RUNNING, 'queued': Job.QUEUED, 'worker': worker,
+            'now': now or timezone.now(), 'limit': limit
+        }
+    ))
+
+
+def retry_delay(attempts):
+    """Exponential backoff with jitter, so the jobs failing together don't retry together"""
+    delay = min(settings.JOBS_RETRY_DELAY * 2 ** (attempts - 1), settings.JOBS_RETRY_MAX_DELAY)
+    return delay * random.uniform(0.5, 1)
+
+
+def _schedule_next(job, now):
+    if not job.key.startswith(SCHEDULE_PREFIX):
+        return
+
+    # An entry dropped from the schedule stops with its last run
+    entry = settings.JOBS_SCHEDULE.get(job.key[len(SCHEDULE_PREFIX):])
+    if entry:
+        task, interval = entry
+        enqueue(task, key=job.key, run_at=now + timedelta(seconds=interval))
+
+
+def complete(job):
+    """Mark a job done, queueing the next run of a scheduled job"""
+    now = timezone.now()
+
+    with transaction.atomic():
+        done = Job.objects.filter(id=job.id, status=Job.RUNNING, locked_by=job.locked_by).update(
+            status=Job.DONE, finished_at=now, locked_by='', locked_at=None
+        )
+        if not done:
+            raise LostLock(f'Job {job.id} was claimed by another worker')
+
+        _schedule_next(job, now)
+
+
+def fail(job, error):
+    """Queue a failed job again after a backoff, or give up on it once it used up its attempts"""
+    now = timezone.now()
+    fields = {'last_error': error, 'locked_by': '', 'locked_at': None}
+
+    if job.attempts < job.max_attempts:
+        fields.update(status=Job.QUEUED, run_at=now + timedelta(seconds=retry_delay(job.attempts)))
+    else:
+        fields.update(status=Job.FAILED, finished_at=now)
+
+    with transaction.atomic():
+        failed = Job.objects.filter(id=job.id, status=Job.RUNNING, locked_by=job.locked_by).update(**fields)
+
+        if failed and fields['status'] == Job.FAILED:
+            _schedule_next(job, now)
+
+
+def run_job(job):
+    """Run a claimed job and record how it went"""
+    options = get_task(job.task)
+
+    try:
+        if options is None:
+            # Not deployed on this worker yet, another one may know it by the next attempt
+            raise Exception(f'Unknown task {job.task}')
+
+        if options['atomic']:
+            with transaction.atomic():
+                options['func'](**job.payload)
+                complete(job)
+            return
+
+        options['func'](**job.payload)
+    except LostLock:
+        logger.warning('Job %s was claimed by another worker, its result is dropped', job.id)
+        return
+    except Exception:
+        logger.exception('Job %s (%s) failed on attempt %d', job.id, job.task, job.attempts)
+        fail(job, traceback.format_exc())
+        return
+
+    try:
+        complete(job)
+    except LostLock:
+        logger.warning('Job %s was claimed by another worker while it ran', job.id)
+
+
+def work(worker, stop, poll_interval, drain=False):
+    """Claim and run jobs one at a time until stop is set, or the queue has nothing due when draining"""
+    while not stop.is_set():
+        close_old_connections()
+
+        try:
+            jobs = claim(worker)
+        except Exception:
+            logger.exception('Worker %s failed to claim a job', worker)
+            jobs = []
+
+        for job in jobs:
+            try:
+                run_job(job)
+            except Exception:
+                # Left running, the lock expires and the job is retried
+                logger.exception('Worker %s failed to record job %s', worker, job.id)
+
+        if not jobs:
+            if drain:
+                break
+            stop.wait(poll_interval)
+
+    connection.close()
+
+
+def heartbeat(workers):
+    """Extend the locks of the jobs the given workers are running"""
+    return Job.objects.filter(status=Job.RUNNING, locked_by__in=workers).update(locked_at=timezone.now())
+
+
+def recover_stale(now=None):
+    """Queue again the jobs whose worker stopped renewing its lock, or fail them when out of attempts"""
+    now = now or timezone.now()
+    stale = Job.objects.filter(status=Job.RUNNING, locked_at__lt=now - timedelta(seconds=settings.JOBS_LOCK_TIMEOUT))
+    fields = {'last_error': 'The lock of the worker expired', 'locked_by': '', 'locked_at': None}
+
+    return (
+        stale.filter(attempts__lt=F('max_attempts')).update(status=Job.QUEUED, run_at=now, **fields)
+        + stale.update(status=Job.FAILED, finished_at=now, **fields)
+    )
+
+
+def ensure_schedule():
+    """Queue a run of every JOBS_SCHEDULE entry that has none queued or running"""
+    return sum(
+        enqueue(task, key=f'{SCHEDULE_PREFIX}{name}') is not None
+        for name, (task, interval) in settings.JOBS_SCHEDULE.items()
+    )
+
+
+def prune(now=None):
+    """Delete the jobs finished more than JOBS_KEEP_DAYS ago"""
+    now = now or timezone.now()
+    deleted, _ = Job.objects.filter(
+        status__in=(Job.DONE, Job.FAILED), finished_at__lt=now - timedelta(days=settings.JOBS_KEEP_DAYS)
+    ).delete()
+    return deleted
@@ -2,11 +2,13 @@ from django.contrib import admin
 
 from .models import (
     Category, Business, Product, ProductComment,
-    ProductImage, Wish, Cart, RequestCart
+    ProductImage, ProductRating, Wish, Cart, RequestCart,
+    DailySales, HourlySales, ProductImport, ProductCard, RelatedProduct, PopularityCounter
 )
 
 
 admin.site.register((
     Category, Business, Product, ProductComment,
-    ProductImage, Wish, Cart, RequestCart
+    ProductImage, ProductRating, Wish, Cart, RequestCart,
+    DailySales, HourlySales, ProductImport, ProductCard, RelatedProduct, PopularityCounter
 ))
@@ -0,0 +1,95 @@
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .cards import mark_dirty
+
+# Items accepted by a single bulk update
+MAX_ITEMS = 1000
+
+MAX_PRICE = Decimal('99999999.99')
+
+MAX_ID = 2 ** 63 - 1
+
+
+def parse_product_id(value):
+    try:
+        product_id = int(value)
+    except (TypeError, ValueError):
+        product_id = 0
+
+    if not 0 < product_id <= MAX_ID:
+        raise Exception(f"Invalid product id: {value}")
+
+    return product_id
+
+
+def validate_items(items):
+    """Raise on items the update can't apply"""
+    if len(items) > MAX_ITEMS:
+        raise Exception(f"No more than {MAX_ITEMS} items can be updated at once")
+
+    product_ids = [parse_product_id(item['product_id']) for item in items]
+    if len(set(product_ids)) != len(product_ids):
+        raise Exception("Every product can appear only once")
+
+    for item in items:
+        if item.get('price') is not None and not 0 <= item['price'] <= MAX_PRICE:
+            raise Exception(f"Price of product {item['product_id']} is out of range")
+
+        if item.get('total_available') is not None and item['total_available'] < 0:
+            raise Exception(f"Stock of product {item['product_id']} must not be negative")
+
+        if item.get('total_available') is not None and item.get('delta'):
+            raise Exception(f"Set either the stock or a delta of product {item['product_id']}, not both")
+
+
+def bulk_update_products(business_id, items):
+    """Apply price, stock and stock delta changes in one statement, returns the ids of the changed products.
+
+    Nothing is applied when a delta would take the stock of a product below zero.
+    """
+    from .models import Product
+
+    if not items:
+        return []
+
+    validate_items(items)
+
+    table = connection.ops.quote_name(Product._meta.db_table)
+    values = ', '.join(['(%s::bigint, %s::numeric, %s::integer, %s::integer)'] * len(items))
+    params = [
+        value for item in items for value in (
+            parse_product_id(item['product_id']), item.get('price'), item.get('total_available'), item.get('delta') or 0
+        )
+    ]
+
+    price = 'COALESCE(v.price, p.price)'
+    stock = 'COALESCE(v.total_available, p.total_available) + v.delta'
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        # The rows are locked, so the stock checked is the stock the deltas are added to
+        cursor.execute(
+            f'SELECT p.id, {stock} < 0 FROM {table} AS p '
+            f'JOIN (VALUES {values}) AS v (id, price, total_available, delta) ON p.id = v.id '
+            f'WHERE p.business_id = %s ORDER BY p.id FOR UPDATE OF p',
+            [*params, business_id]
+        )
+        overdrawn = [product_id for product_id, below_zero in cursor.fetchall() if below_zero]
+        if overdrawn:
+            raise Exception(f"Stock of products {', '.join(map(str, overdrawn))} would go below zero")
+
+        cursor.execute(
+            f'UPDATE {table} AS p SET price = {price}, total_available = {stock}, updated_at = %s '
+            f'FROM (VALUES {values}) AS v (id, price, total_available, delta) '
+            f'WHERE p.id = v.id AND p.business_id = %s '
+            f'AND (p.price <> {price} OR p.total_available <> {stock}) '
+            f'RETURNING p.id',
+            [timezone.now(), *params, business_id]
+        )
+        changed = [row[0] for row in cursor.fetchall()]
+
+    mark_dirty(changed)
+
+    return changed
@@ -0,0 +1,104 @@
+import logging
+import threading
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .categories import changed_categories, refresh_category_stats
+
+# Card column and the expression of the source tables it is read from
+COLUMNS = (
+    ('product_id', 'p.id'),
+    ('business_id', 'p.business_id'),
+    ('category_id', 'p.category_id'),
+    ('name', 'p.name'),
+    ('business_name', 'b.name'),
+    ('category_name', 'c.name'),
+    ('price', 'p.price'),
+    ('total_available', 'p.total_available'),
+    ('rating_avg', 'p.rating_avg'),
+    ('rating_count', 'p.rating_count'),
+    ('cover_image', "COALESCE(u.image, '')"),
+    ('created_at', 'p.created_at'),
+    ('refreshed_at', '%(now)s'),
+)
+
+_pending = threading.local()
+
+logger = logging.getLogger(__name__)
+
+
+def _table(model):
+    return connection.ops.quote_name(model._meta.db_table)
+
+
+def refresh_cards(product_ids=None):
+    """Upsert the cards of the given products, or of every product, from the source tables in one statement"""
+    from user.models import ImageUpload
+    from .models import Business, Category, Product, ProductCard, ProductImage
+
+    if product_ids is not None:
+        # Ids coming from GraphQL arguments are strings
+        product_ids = [int(product_id) for product_id in product_ids]
+        if not product_ids:
+            return 0
+
+    # The cards of a deleted business are dropped with it and never written again
+    where = 'WHERE b.deleted_at IS NULL' + ('' if product_ids is None else ' AND p.id = ANY(%(ids)s)')
+    updates = ', '.join(f'{column} = EXCLUDED.{column}' for column, _ in COLUMNS[1:])
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {_table(ProductCard)} ({", ".join(column for column, _ in COLUMNS)}) '
+            f'SELECT {", ".join(source for _, source in COLUMNS)} '
+            f'FROM {_table(Product)} p '
+            f'JOIN {_table(Business)} b ON b.id = p.business_id '
+            f'JOIN {_table(Category)} c ON c.id = p.category_id '
+            f'LEFT JOIN {_table(ProductImage)} i ON i.id = p.cover_image_id '
+            f'LEFT JOIN {_table(ImageUpload)} u ON u.id = i.image_id '
+            f'{where} '
+            f'ON CONFLICT (product_id) DO UPDATE SET {updates}',
+            {'ids': product_ids, 'now': timezone.now()}
+        )
+        return cursor.rowcount
+
+
+def mark_dirty(product_ids):
+    """Refresh the cards of products once the current transaction commits, batched per transaction"""
+    ids = getattr(_pending, 'ids', None)
+    if ids is None:
+        ids = _pending.ids = set()
+
+    ids.update(int(product_id) for product_id in product_ids)
+    # Every mark registers a flush, the first one to run takes the whole batch.
+    # Ids marked in a rolled back transaction are refreshed by the next flush.
+    transaction.on_commit(flush)
+
+
+def flush():
+    ids = getattr(_pending, 'ids', None)
+    if not ids:
+        return
+
+    _pending.ids = set()
+    try:
+        categories = changed_categories(ids)
+        refresh_cards(ids)
+        # Products created, moved or repriced change the stats of their categories
+        refresh_category_stats(categories)
+    except Exception:
+        # The writes are committed already, a stale card must not fail them
+        logger.exception('Refreshing the cards of %d products failed', len(ids))
+        _pending.ids.update(ids)
+
+
+def rename_business(business_id, name):
+    from .models import ProductCard
+
+    ProductCard.objects.filter(business_id=business_id).exclude(business_name=name).update(business_name=name)
+
+
+def rename_category(category_id, name):
+    from .models import ProductCard
+
+    ProductCard.objects.filter(category_id=category_id).exclude(category_name=name).update(category_name=name)
@@ -0,0 +1,168 @@
+import logging
+import threading
+
+from django.db import connection, transaction
+from django.db.models import Q
+
+_pending = threading.local()
+
+logger = logging.getLogger(__name__)
+
+
+def _table(model):
+    return connection.ops.quote_name(model._meta.db_table)
+
+
+def refresh_category_stats(category_ids=None):
+    """Recompute the product count and price range of the given categories, or of every category, in one statement"""
+    from .models import Category, Product
+
+    if category_ids is not None:
+        category_ids = [int(category_id) for category_id in category_ids]
+        if not category_ids:
+            return 0
+
+    where = '' if category_ids is None else 'WHERE k.id = ANY(%(ids)s)'
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'UPDATE {_table(Category)} AS c '
+            f'SET product_count = s.product_count, min_price = s.min_price, max_price = s.max_price '
+            f'FROM (SELECT k.id, p.* FROM {_table(Category)} k CROSS JOIN LATERAL ('
+            # Per category, so the (category, price) index answers without reading the products
+            f'SELECT COUNT(*) AS product_count, MIN(price) AS min_price, MAX(price) AS max_price '
+            f'FROM {_table(Product)} WHERE category_id = k.id) AS p {where}) AS s '
+            f'WHERE c.id = s.id AND (c.product_count, c.min_price, c.max_price) '
+            f'IS DISTINCT FROM (s.product_count, s.min_price, s.max_price)',
+            {'ids': category_ids}
+        )
+        refreshed = cursor.rowcount
+
+        # The categories and their ancestors, the only subtrees whose totals can have changed
+        roots = '' if category_ids is None else (
+            f'AND a.id IN (SELECT r.id FROM {_table(Category)} r JOIN {_table(Category)} k '
+            f"ON k.path LIKE r.path || '%%' WHERE r.path <> '' AND k.id = ANY(%(ids)s))"
+        )
+        cursor.execute(
+            f'UPDATE {_table(Category)} AS c SET tree_product_count = s.total '
+            f'FROM (SELECT a.id, SUM(d.product_count) AS total FROM {_table(Category)} a '
+            f"JOIN {_table(Category)} d ON d.path LIKE a.path || '%%' WHERE a.path <> '' {roots} "
+            f'GROUP BY a.id) AS s '
+            f'WHERE c.id = s.id AND c.tree_product_count <> s.total',
+            {'ids': category_ids}
+        )
+        return refreshed + cursor.rowcount
+
+
+def ancestor_ids(path):
+    """Ids of the categories on a path, the root first"""
+    return [int(category_id) for category_id in path.split('/') if category_id]
+
+
+def check_parent(category):
+    """Raise if a category would become its own ancestor"""
+    from .models import Category
+
+    if not category.parent_id or not category.path:
+        return
+
+    parent_path = Category.objects.filter(id=category.parent_id).values_list('path', flat=True).first() or ''
+    if parent_path.startswith(category.path):
+        raise Exception("A category can't be moved under itself or one of its subcategories")
+
+
+def place_category(category):
+    """Write the path and depth of a new or moved category, and of its whole subtree in one statement"""
+    from .models import Category
+
+    parent_path = ''
+    if category.parent_id:
+        parent_path = Category.objects.filter(id=category.parent_id).values_list('path', flat=True).first() or ''
+
+    old_path = category.path
+    new_path = f'{parent_path}{category.id}/'
+    if old_path == new_path:
+        return
+
+    depth = new_path.count('/') - 1
+
+    with connection.cursor() as cursor:
+        if old_path:
+            # The prefix of every path under the category is swapped, the depths move by the same step
+            cursor.execute(
+                f'UPDATE {_table(Category)} SET path = %s || substr(path, %s), depth = depth + %s '
+                f"WHERE path LIKE %s || '%%'",
+                [new_path, len(old_path) + 1, depth - category.depth, old_path]
+            )
+        else:
+            cursor.execute(
+                f'UPDATE {_table(Category)} SET path = %s, depth = %s WHERE id = %s',
+                [new_path, depth, category.id]
+            )
+
+    category.path, category.depth = new_path, depth
+
+    # The subtree totals of the old and the new ancestors change
+    mark_dirty(ancestor_ids(old_path) + ancestor_ids(new_path))
+
+
+def subtree_filter(name, prefix=''):
+    """Q matching the categories named like name and everything under them, one path prefix per subtree"""
+    from .models import Category
+
+    paths = []
+    for path in sorted(Category.objects.filter(name__icontains=name).values_list('path', flat=True)):
+        # A subtree already inside another one adds nothing
+        if path and not any(path.startswith(root) for root in paths):
+            paths.append(path)
+
+    condition = Q(**{f'{prefix}pk__in': []})
+    for path in paths:
+        condition |= Q(**{f'{prefix}path__startswith': path})
+
+    return condition
+
+
+def changed_categories(product_ids):
+    """Categories whose stats are affected by products created, moved or repriced since their card was written"""
+    from .models import Product, ProductCard
+
+    product_ids = [int(product_id) for product_id in product_ids]
+    if not product_ids:
+        return set()
+
+    # Read before the cards are refreshed, they still hold the previous category and price
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT card.category_id, p.category_id FROM unnest(%s::bigint[]) AS t (id) '
+            f'LEFT JOIN {_table(ProductCard)} card ON card.product_id = t.id '
+            f'LEFT JOIN {_table(Product)} p ON p.id = t.id '
+            f'WHERE card.product_id IS NULL OR p.id IS NULL '
+            f'OR card.category_id <> p.category_id OR card.price <> p.price',
+            [product_ids]
+        )
+        return {category_id for row in cursor.fetchall() for category_id in row if category_id is not None}
+
+
+def mark_dirty(category_ids):
+    """Refresh the stats of categories once the current transaction commits, batched per transaction"""
+    ids = getattr(_pending, 'ids', None)
+    if ids is None:
+        ids = _pending.ids = set()
+
+    ids.update(int(category_id) for category_id in category_ids)
+    transaction.on_commit(flush)
+
+
+def flush():
+    ids = getattr(_pending, 'ids', None)
+    if not ids:
+        return
+
+    _pending.ids = set()
+    try:
+        refresh_category_stats(ids)
+    except Exception:
+        # The writes are committed already, stale counts must not fail them
+        logger.exception('Refreshing the stats of %d categories failed', len(ids))
+        _pending.ids.update(ids)
@@ -0,0 +1,39 @@
+from django.db import transaction
+from django.utils import timezone
+
+from .cards import mark_dirty
+
+
+def set_cover(product_id, image_id):
+    """Make an image the only cover of its product, returns False if it isn't an image of it"""
+    from .models import Product, ProductImage
+
+    now = timezone.now()
+
+    with transaction.atomic():
+        # Cover switches of one product wait for each other on its row
+        if not Product.objects.select_for_update().filter(id=product_id).exists():
+            return False
+
+        if not ProductImage.objects.filter(id=image_id, product_id=product_id).exists():
+            return False
+
+        # The old cover is cleared first, the partial unique index is checked statement by statement
+        ProductImage.objects.filter(product_id=product_id, is_cover=True).exclude(id=image_id).update(
+            is_cover=False, updated_at=now
+        )
+        ProductImage.objects.filter(id=image_id).update(is_cover=True, updated_at=now)
+        Product.objects.filter(id=product_id).update(cover_image_id=image_id)
+
+    mark_dirty([product_id])
+
+    return True
+
+
+def unset_cover(product_id, image_id):
+    """Stop an image from being the cover of its product"""
+    from .models import Product, ProductImage
+
+    ProductImage.objects.filter(id=image_id, product_id=product_id).update(is_cover=False, updated_at=timezone.now())
+    if Product.objects.filter(id=product_id, cover_image_id=image_id).update(cover_image=None):
+        mark_dirty([product_id])
@@ -0,0 +1,106 @@
+import csv
+import io
+import zlib
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from user.schema import media_url
+
+CSV = 'csv'
+NDJSON = 'ndjson'
+
+CONTENT_TYPES = {CSV: 'text/csv; charset=utf-8', NDJSON: 'application/x-ndjson'}
+
+# Exported column and the field it is read from
+COLUMNS = (
+    ('id', 'id'),
+    ('name', 'name'),
+    ('description', 'description'),
+    ('price', 'price'),
+    ('total_available', 'total_available'),
+    ('total_count', 'total_count'),
+    ('rating_avg', 'rating_avg'),
+    ('rating_count', 'rating_count'),
+    ('category_id', 'category_id'),
+    ('category', 'category__name'),
+    ('business_id', 'business_id'),
+    ('business', 'business__name'),
+    ('cover_image', 'cover_image__image__image'),
+    ('created_at', 'created_at'),
+    ('updated_at', 'updated_at'),
+)
+
+# Rendered rows are compressed in pieces of about this size
+FLUSH_SIZE = 64 * 1024
+
+
+def export_query(query):
+    """Product rows as tuples of the exported columns, related names joined in the same query"""
+    return query.order_by('id').values_list(*(field for _, field in COLUMNS))
+
+
+def iter_rows(query, chunk_size=None):
+    """Rows fetched through a server-side cursor, so memory doesn't grow with the catalog"""
+    cover_index = [name for name, _ in COLUMNS].index('cover_image')
+
+    for row in query.iterator(chunk_size=chunk_size or settings.EXPORT_CHUNK_SIZE):
+        if row[cover_index]:
+            row = row[:cover_index] + (media_url(row[cover_index]), ) + row[cover_index + 1:]
+        yield row
+
+
+def render_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([name for name, _ in COLUMNS])
+
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= FLUSH_SIZE:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+
+    yield buffer.getvalue().encode()
+
+
+def render_ndjson(rows):
+    names = [name for name, _ in COLUMNS]
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    lines = []
+    size = 0
+
+    for row in rows:
+        line = encoder.encode(dict(zip(names, row)))
+        lines.append(line)
+        size += len(line)
+        if size >= FLUSH_SIZE:
+            yield ('\n'.join(lines) + '\n').encode()
+            lines = []
+            size = 0
+
+    if lines:
+        yield ('\n'.join(lines) + '\n').encode()
+
+
+RENDERERS = {CSV: render_csv, NDJSON: render_ndjson}
+
+
+def gzip_stream(chunks, level=None):
+    """Compress a stream of bytes into a single gzip member, piece by piece"""
+    # wbits 31 writes the gzip header and trailer around the deflate stream
+    compressor = zlib.compressobj(settings.EXPORT_GZIP_LEVEL if level is None else level, zlib.DEFLATED, 31)
+
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+
+    yield compressor.flush()
+
+
+def export_products(query, export_format=CSV, gzip=True, chunk_size=None):
+    """Stream of the encoded export of the products of a query"""
+    stream = RENDERERS[export_format](iter_rows(export_query(query), chunk_size))
+    return gzip_stream(stream) if gzip else stream
@@ -0,0 +1,267 @@
+import codecs
+import csv
+import json
+import logging
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .cards import mark_dirty
+from .models import Category, Product, ProductImport
+
+logger = logging.getLogger(__name__)
+
+# Columns written to existing products, the others of a row are ignored
+UPDATE_FIELDS = ('description', 'price', 'category_id', 'total_count', 'total_available', 'updated_at')
+
+MAX_PRICE = Decimal('99999999.99')
+
+
+class ImportFormatError(Exception):
+    """Raised when an import file can't be read at all"""
+
+
+def read_rows(stream, file_format):
+    """Stream (line number, row dict) from a binary CSV or NDJSON file"""
+    # utf-8-sig drops the byte order mark spreadsheets like to write
+    lines = codecs.getreader('utf-8-sig')(stream)
+
+    if file_format == ProductImport.CSV:
+        reader = csv.DictReader(lines)
+        if not reader.fieldnames or 'name' not in reader.fieldnames:
+            raise ImportFormatError('The CSV header must have a name column')
+
+        for row in reader:
+            yield reader.line_num, row
+    elif file_format == ProductImport.NDJSON:
+        for line_number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield line_number, row if isinstance(row, dict) else {'__invalid__': 'Line is not a JSON object'}
+    else:
+        raise ImportFormatError(f'Unsupported format: {file_format}')
+
+
+def _text(value):
+    return '' if value is None else str(value).strip()
+
+
+def _count(value, field, errors):
+    try:
+        number = int(_text(value))
+    except ValueError:
+        errors[field] = 'Must be a whole number'
+        return None
+
+    if number < 0:
+        errors[field] = 'Must not be negative'
+        return None
+
+    return number
+
+
+class ProductImporter:
+    """Validate and write product rows of one business in batches"""
+
+    def __init__(self, business_id, update_existing=False, batch_size=None, max_errors=None, progress=None):
+        self.business_id = business_id
+        self.update_existing = update_existing
+        self.batch_size = batch_size or settings.PRODUCT_IMPORT_BATCH_SIZE
+        self.max_errors = settings.PRODUCT_IMPORT_MAX_ERRORS if max_errors is None else max_errors
+        self.progress = progress
+
+        self.processed = self.created = self.updated = self.failed = 0
+        self.errors = []
+
+        # One query each instead of one per row
+        self.categories = {
+            name.strip().lower(): category_id for category_id, name in Category.objects.values_list('id', 'name')
+        }
+        self.category_ids = set(self.categories.values())
+
+        self.existing = dict(Product.objects.filter(business_id=business_id).values_list('name', 'id'))
+        self.seen = set()
+
+    def run(self, rows):
+        """Import every (line number, row) and return the report"""
+        batch = []
+
+        for line_number, row in rows:
+            batch.append((line_number, row))
+            if len(batch) >= self.batch_size:
+                self.write_batch(batch)
+                batch = []
+
+        if batch:
+            self.write_batch(batch)
+
+        return self.report()
+
+    def report(self):
+        return {
+            'processed': self.processed,
+            'created': self.created,
+            'updated': self.updated,
+            'failed': self.failed,
+            'errors': self.errors,
+        }
+
+    def validate(self, row):
+        """Model field values of a row and the errors found in it"""
+        errors = {}
+
+        if '__invalid__' in row:
+            return None, {'row': row['__invalid__']}
+
+        name = _text(row.get('name'))
+        if not name:
+            errors['name'] = 'Is required'
+        elif len(name) > Product._meta.get_field('name').max_length:
+            errors['name'] = 'Is too long'
+        elif name in self.seen:
+            errors['name'] = 'Appears more than once in the file'
+        elif name in self.existing and not self.update_existing:
+            errors['name'] = 'You already have a product with this name'
+
+        try:
+            price = Decimal(_text(row.get('price')) or '0').quantize(Decimal('0.01'))
+            if not 0 <= price <= MAX_PRICE:
+                errors['price'] = 'Is out of range'
+        except InvalidOperation:
+            price = None
+            errors['price'] = 'Must be a number'
+
+        if _text(row.get('category_id')):
+            try:
+                category_id = int(_text(row['category_id']))
+            except ValueError:
+                category_id = None
+            if category_id not in self.category_ids:
+                errors['category_id'] = 'Unknown category'
+        else:
+            category = _text(row.get('category')).lower()
+            category_id = self.categories.get(category)
+            if category_id is None:
+                errors['category'] = 'Unknown category' if category else 'Is required'
+
+        total_count = _count(row.get('total_count'), 'total_count', errors)
+        total_available = None
+        if _text(row.get('total_available')):
+            total_available = _count(row.get('total_available'), 'total_available', errors)
+
+        if errors:
+            return None, errors
+
+        self.seen.add(name)
+
+        data = {
+            'name': name,
+            'description': _text(row.get('description')),
+            'price': price,
+            'category_id': category_id,
+            'total_count': total_count,
+        }
+        if total_available is not None:
+            data['total_available'] = total_available
+
+        return data, None
+
+    def write_batch(self, batch):
+        to_create = []
+        # Updated products keep their stock unless the row sets it
+        to_update = {True: [], False: []}
+        now = timezone.now()
+
+        for line_number, row in batch:
+            data, errors = self.validate(row)
+
+            if errors:
+                self.failed += 1
+                if len(self.errors) < self.max_errors:
+                    self.errors.append({'row': line_number, 'errors': errors})
+                continue
+
+            product_id = self.existing.get(data['name'])
+            if product_id:
+                to_update['total_available' in data].append(
+                    Product(id=product_id, business_id=self.business_id, updated_at=now, **data)
+                )
+            else:
+                data.setdefault('total_available', data['total_count'])
+                to_create.append(Product(business_id=self.business_id, **data))
+
+        with transaction.atomic():
+            created = Product.objects.bulk_create(to_create)
+            for with_stock, products in to_update.items():
+                fields = UPDATE_FIELDS if with_stock else tuple(f for f in UPDATE_FIELDS if f != 'total_available')
+                if products:
+                    Product.objects.bulk_update(products, fields)
+
+            # bulk_create and bulk_update don't send the signals keeping the cards fresh
+            mark_dirty([product.id for product in created] + [
+                product.id for products in to_update.values() for product in products
+            ])
+
+        for product in created:
+            self.existing[product.name] = product.id
+
+        self.processed += len(batch)
+        self.created += len(to_create)
+        self.updated += len(to_update[True]) + len(to_update[False])
+
+        if self.progress:
+            self.progress(self)
+
+
+def save_progress(product_import, importer):
+    ProductImport.objects.filter(id=product_import.id).update(
+        processed_rows=importer.processed,
+        created_count=importer.created,
+        updated_count=importer.updated,
+        failed_count=importer.failed,
+        updated_at=timezone.now()
+    )
+
+
+def process_import(import_id):
+    """Run a pending uploaded import, keeping its progress up to date"""
+    claimed = ProductImport.objects.filter(id=import_id, status=ProductImport.PENDING).update(
+        status=ProductImport.PROCESSING, updated_at=timezone.now()
+    )
+    if not claimed:
+        return None
+
+    product_import = ProductImport.objects.get(id=import_id)
+    importer = None
+
+    try:
+        importer = ProductImporter(
+            product_import.business_id, update_existing=product_import.update_existing,
+            progress=lambda importer: save_progress(product_import, importer)
+        )
+        with product_import.file.open('rb') as stream:
+            importer.run(read_rows(stream, product_import.format))
+    except Exception as e:
+        # Batches written so far stay, the report tells how far it got
+        logger.exception('Product import %s failed', import_id)
+        product_import.status = ProductImport.FAILED
+        product_import.error = str(e)
+    else:
+        product_import.status = ProductImport.DONE
+
+    if importer:
+        product_import.processed_rows = importer.processed
+        product_import.created_count = importer.created
+        product_import.updated_count = importer.updated
+        product_import.failed_count = importer.failed
+        product_import.errors = importer.errors
+
+    product_import.save()
+
+    return product_import
@@ -0,0 +1,100 @@
+import resource
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import reset_queries, transaction
+
+from product.export import CONTENT_TYPES, CSV, export_products
+from product.models import Business, Category, Product
+from user.models import User
+
+BENCHMARK_EMAIL = 'export-benchmark@example.invalid'
+
+
+def peak_rss_mb():
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class Command(BaseCommand):
+    help = 'Measure the throughput and memory of the streaming product export on a seeded catalog'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=1_000_000)
+        parser.add_argument('--format', default=CSV, choices=list(CONTENT_TYPES))
+        parser.add_argument('--chunk-size', type=int, default=None)
+        parser.add_argument('--no-gzip', action='store_true')
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded products for the next run')
+
+    def handle(self, *args, **options):
+        business = self.seed(options['products'])
+
+        try:
+            rss_before = peak_rss_mb()
+            started = time.perf_counter()
+            first_byte = None
+            size = 0
+
+            stream = export_products(
+                Product.objects.filter(business=business), options['format'],
+                gzip=not options['no_gzip'], chunk_size=options['chunk_size']
+            )
+            for chunk in stream:
+                if first_byte is None:
+                    first_byte = time.perf_counter() - started
+                size += len(chunk)
+
+            elapsed = time.perf_counter() - started
+        finally:
+            if not options['keep']:
+                self.cleanup(business)
+
+        self.stdout.write(
+            f"{options['products']} products as {options['format']}"
+            f"{'' if options['no_gzip'] else '.gz'}: {elapsed:.2f}s, "
+            f"{options['products'] / elapsed:,.0f} rows/s, first byte after {first_byte or 0:.3f}s, "
+            f"{size / 1024 / 1024:.1f} MiB, peak RSS {rss_before:.0f} -> {peak_rss_mb():.0f} MiB"
+        )
+
+    def seed(self, count):
+        """Benchmark business holding exactly `count` products"""
+        user = User.objects.filter(email=BENCHMARK_EMAIL).first() or User.objects.create_user(
+            email=BENCHMARK_EMAIL, password=None, first_name='Export', last_name='Benchmark'
+        )
+        business, _ = Business.objects.get_or_create(user=user, defaults={'name': 'Export benchmark'})
+        category, _ = Category.objects.get_or_create(name='Export benchmark')
+
+        existing = Product.objects.filter(business=business).count()
+        if existing > count:
+            self.cleanup(business)
+            existing = 0
+
+        batch_size = 5000
+        for start in range(existing, count, batch_size):
+            with transaction.atomic():
+                Product.objects.bulk_create([
+                    Product(
+                        business=business, category=category, name=f'Benchmark product {number}',
+                        description=f'Description of the benchmark product {number}, long enough to be realistic',
+                        price=Decimal(number % 10000) / 100, total_available=number % 100, total_count=100
+                    ) for number in range(start, min(start + batch_size, count))
+                ])
+            # DEBUG keeps every query in memory, which would be measured as the export's
+            reset_queries()
+            self.stdout.write(f'Seeded {min(start + batch_size, count)}/{count} products', ending='\r')
+
+        self.stdout.write('')
+        return business
+
+    def cleanup(self, business):
+        products = Product.objects.filter(business=business)
+
+        # Cascading deletes collect every row in memory, delete in batches
+        while True:
+            ids = list(products.order_by('id').values_list('id', flat=True)[:5000])
+            if not ids:
+                break
+            Product.objects.filter(id__in=ids).delete()
+
+        business.user.delete()
@@ -0,0 +1,63 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.test.utils import override_settings
+
+DEFAULT_QUERY = (
+    '{ products(page: 1) { totalData result { id name description price totalAvailable '
+    'ratingAvg category { name } business { name } } } }'
+)
+
+# Label, method and extra request headers of every measured variant
+VARIANTS = (
+    ('POST', 'post', {}),
+    ('GET identity', 'get', {}),
+    ('GET gzip', 'get', {'HTTP_ACCEPT_ENCODING': 'gzip'}),
+    ('GET br', 'get', {'HTTP_ACCEPT_ENCODING': 'br, gzip'}),
+    ('GET If-None-Match', 'get', {'HTTP_ACCEPT_ENCODING': 'br, gzip'}),
+)
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+class Command(BaseCommand):
+    help = 'Measure the bytes on the wire and the latency of a GraphQL query, plain, compressed and revalidated'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Requests per variant')
+        parser.add_argument('--query', default=DEFAULT_QUERY)
+
+    def handle(self, *args, **options):
+        client = Client()
+        query = options['query']
+
+        # The test client talks to the application in process, as testserver, and from a single address
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'], RATE_LIMIT=False):
+            etag = client.get('/graphview/', {'query': query}).get('ETag')
+
+            for label, method, headers in VARIANTS:
+                if label == 'GET If-None-Match':
+                    headers = {**headers, 'HTTP_IF_NONE_MATCH': etag}
+
+                timings = []
+                size = status = None
+
+                for _ in range(options['requests']):
+                    started = time.perf_counter()
+                    if method == 'post':
+                        response = client.post('/graphview/', {'query': query}, content_type='application/json')
+                    else:
+                        response = client.get('/graphview/', {'query': query}, **headers)
+                    timings.append((time.perf_counter() - started) * 1000)
+                    size, status = len(response.content), response.status_code
+
+                self.stdout.write(
+                    f'{label:<18} {status} {size:>8} bytes  '
+                    f'p50 {statistics.median(timings):7.2f} ms  p95 {percentile(timings, 0.95):7.2f} ms'
+                )
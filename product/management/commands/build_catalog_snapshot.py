@@ -0,0 +1,43 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from product import snapshot
+
+
+class Command(BaseCommand):
+    help = 'Build the memory-mapped catalog snapshot the product listings filter and sort on'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--watch', action='store_true', help='Keep running and rebuild whenever the cards change')
+        parser.add_argument('--interval', type=float, default=2, help='Seconds between two checks with --watch')
+
+    def handle(self, *args, **options):
+        if snapshot.np is None:
+            raise CommandError('The catalog snapshot needs numpy')
+
+        last = None
+
+        while True:
+            close_old_connections()
+            current = snapshot.signature()
+
+            if current != last:
+                started = time.perf_counter()
+                path = snapshot.build_snapshot()
+                self.stdout.write(
+                    f'Built {path} with {current[0]} products in {time.perf_counter() - started:.2f}s'
+                )
+                last = current
+            else:
+                snapshot.confirm_current()
+
+            if not options['watch']:
+                break
+
+            time.sleep(options['interval'])
+
+        if not settings.CATALOG_SNAPSHOT:
+            self.stdout.write(self.style.WARNING('CATALOG_SNAPSHOT is off, listings don\'t read the snapshot'))
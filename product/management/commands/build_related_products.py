@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from product import recommendations
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the "frequently bought together" products from the purchase history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-k', type=int, default=None, help='Related products kept per product')
+        parser.add_argument('--min-support', type=int, default=None,
+                            help='Users who must have bought both products for them to be related')
+        parser.add_argument('--chunk-size', type=int, default=None, help='Purchases processed per chunk')
+
+    def handle(self, *args, **options):
+        if recommendations.sparse is None:
+            raise CommandError('Building related products needs numpy and scipy')
+
+        started = time.perf_counter()
+        written = recommendations.build_related_products(
+            top_k=options['top_k'], min_support=options['min_support'], chunk_size=options['chunk_size']
+        )
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Stored {written} related products in {time.perf_counter() - started:.2f}s'
+        ))
@@ -0,0 +1,68 @@
+import csv
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from product.importing import ImportFormatError, ProductImporter, read_rows
+from product.models import Business, ProductImport
+
+
+class Command(BaseCommand):
+    help = 'Import the products of a business from a CSV or NDJSON file, in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--business', type=int, required=True, help='Id of the business owning the products')
+        parser.add_argument('--format', choices=(ProductImport.CSV, ProductImport.NDJSON),
+                            help='Defaults to the extension of the file')
+        parser.add_argument('--update-existing', action='store_true',
+                            help='Update the products named like a row instead of rejecting the row')
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--max-errors', type=int, default=None, help='Number of row errors reported')
+        parser.add_argument('--report', help='Write the row errors to this CSV file instead of stderr')
+
+    def handle(self, *args, **options):
+        if not Business.objects.filter(id=options['business']).exists():
+            raise CommandError(f"Business {options['business']} doesn't exist")
+
+        file_format = options['format'] or os.path.splitext(options['path'])[1].lstrip('.').lower()
+        started = time.perf_counter()
+
+        def progress(importer):
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f'{importer.processed} rows ({importer.processed / elapsed:,.0f}/s): '
+                f'{importer.created} created, {importer.updated} updated, {importer.failed} failed'
+            )
+
+        importer = ProductImporter(
+            options['business'], update_existing=options['update_existing'],
+            batch_size=options['batch_size'], max_errors=options['max_errors'], progress=progress
+        )
+
+        try:
+            with open(options['path'], 'rb') as stream:
+                report = importer.run(read_rows(stream, file_format))
+        except ImportFormatError as e:
+            raise CommandError(e)
+
+        self.write_report(report['errors'], options['report'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {report['processed']} rows: {report['created']} created, "
+            f"{report['updated']} updated, {report['failed']} failed"
+        ))
+
+    def write_report(self, errors, path):
+        if path:
+            with open(path, 'w', newline='') as output:
+                writer = csv.writer(output)
+                writer.writerow(('row', 'field', 'error'))
+                for error in errors:
+                    for field, message in error['errors'].items():
+                        writer.writerow((error['row'], field, message))
+        else:
+            for error in errors:
+                for field, message in error['errors'].items():
+                    self.stderr.write(f"Row {error['row']}, {field}: {message}")
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from product.cards import refresh_cards
+from product.categories import refresh_category_stats
+from product.models import Product, ProductCard
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the product cards from the source tables, in batches, and the category stats'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        refreshed = 0
+        last_id = 0
+
+        while True:
+            ids = list(Product.objects.filter(id__gt=last_id).order_by('id').values_list(
+                'id', flat=True)[:options['batch_size']])
+            if not ids:
+                break
+
+            refreshed += refresh_cards(ids)
+            last_id = ids[-1]
+
+        # Cards are deleted with their product, this only catches rows removed behind the ORM's back
+        orphans, _ = ProductCard.objects.exclude(product_id__in=Product.objects.values('id')).delete()
+
+        categories = refresh_category_stats()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Refreshed {refreshed} cards, deleted {orphans} orphans, corrected {categories} category stats'
+        ))
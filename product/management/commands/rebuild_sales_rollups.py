@@ -0,0 +1,30 @@
+from datetime import datetime, time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date, parse_datetime
+
+from product.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Recompute the daily and hourly sales rollups from the payment history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--business', type=int, action='append', dest='businesses',
+                            help='Only rebuild the rollups of this business id, may be repeated')
+        parser.add_argument('--since', help='Only rebuild the buckets from this date or datetime on')
+
+    def handle(self, *args, **options):
+        since = None
+
+        if options['since']:
+            since = parse_datetime(options['since'])
+            if since is None:
+                day = parse_date(options['since'])
+                if day is None:
+                    raise CommandError('--since must be a date or a datetime')
+                since = datetime.combine(day, time.min)
+
+        created = rebuild_rollups(options['businesses'], since)
+
+        self.stdout.write(self.style.SUCCESS(f'Created {created} rollup rows'))
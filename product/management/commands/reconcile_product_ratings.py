@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from product.models import Product
+from product.ratings import rebuild_histograms, reconcile_ratings
+
+
+class Command(BaseCommand):
+    help = 'Recompute drifted product rating aggregates and the rating histograms from the product comments, in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        checked = fixed = 0
+        last_id = 0
+
+        while True:
+            ids = list(Product.objects.filter(id__gt=last_id).order_by('id').values_list(
+                'id', flat=True)[:options['batch_size']])
+            if not ids:
+                break
+
+            fixed += reconcile_ratings(Product.objects.filter(id__in=ids))
+            rebuild_histograms(ids)
+            checked += len(ids)
+            last_id = ids[-1]
+
+        self.stdout.write(self.style.SUCCESS(f'Checked {checked} products, fixed {fixed}'))
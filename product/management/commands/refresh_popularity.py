@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from product import popularity
+
+
+class Command(BaseCommand):
+    help = 'Refresh the trending and popular scores of the products from the popularity counters'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Recompute every product with a score or a counter')
+        parser.add_argument('--watch', action='store_true', help='Keep running and refresh every interval')
+        parser.add_argument('--interval', type=float, default=60, help='Seconds between two refreshes with --watch')
+
+    def handle(self, *args, **options):
+        full = options['full']
+
+        while True:
+            close_old_connections()
+            started = time.perf_counter()
+            checked, changed = popularity.refresh_popularity(full=full)
+            self.stdout.write(
+                f'Checked {checked} products, {changed} scores changed in {time.perf_counter() - started:.2f}s'
+            )
+            full = False
+
+            if not options['watch']:
+                break
+
+            time.sleep(options['interval'])
@@ -0,0 +1,52 @@
+# Generated by Django 3.2.8 on 2026-10-19 10:26
+
+from django.db import migrations, models
+from django.db.models import Count, DecimalField, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce, NullIf
+
+
+def backfill_ratings(apps, schema_editor):
+    Product = apps.get_model('product', 'Product')
+    ProductComment = apps.get_model('product', 'ProductComment')
+
+    comments = ProductComment.objects.filter(product_id=OuterRef('id')).order_by().values('product_id')
+    rating_sum = Coalesce(Subquery(comments.annotate(total=Sum('rate')).values('total')), 0)
+    rating_count = Coalesce(
+        Subquery(comments.annotate(total=Count('id')).values('total'), output_field=IntegerField()), 0
+    )
+    rating_avg = Cast(
+        Cast(rating_sum, DecimalField(max_digits=12, decimal_places=4)) / NullIf(rating_count, 0),
+        DecimalField(max_digits=3, decimal_places=2)
+    )
+
+    Product.objects.update(
+        rating_sum=rating_sum,
+        rating_count=rating_count,
+        rating_avg=Coalesce(rating_avg, Value(0), output_field=DecimalField(max_digits=3, decimal_places=2))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_avg',
+            field=models.DecimalField(db_index=True, decimal_places=2, default=0, max_digits=3),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_ratings, migrations.RunPython.noop),
+    ]
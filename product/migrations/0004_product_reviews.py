@@ -0,0 +1,56 @@
+# Generated by Django 3.2.8 on 2026-10-19 10:27
+
+from django.db import migrations, models
+from django.db.models import Count
+import django.db.models.deletion
+
+
+def backfill_histograms(apps, schema_editor):
+    ProductComment = apps.get_model('product', 'ProductComment')
+    ProductRating = apps.get_model('product', 'ProductRating')
+
+    buckets = ProductComment.objects.order_by().values('product_id', 'rate').annotate(total=Count('id'))
+
+    ProductRating.objects.bulk_create(
+        (ProductRating(product_id=row['product_id'], rate=row['rate'], count=row['total']) for row in buckets.iterator()),
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0003_product_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductRating',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rate', models.PositiveIntegerField()),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'Product Ratings',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='productcomment',
+            index=models.Index(fields=['product', 'created_at'], name='product_pro_product_f975c8_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productcomment',
+            index=models.Index(fields=['product', 'rate'], name='product_pro_product_4230ff_idx'),
+        ),
+        migrations.AddField(
+            model_name='productrating',
+            name='product',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='product_ratings', to='product.product'),
+        ),
+        migrations.AddConstraint(
+            model_name='productrating',
+            constraint=models.UniqueConstraint(fields=('product', 'rate'), name='unique_product_rate'),
+        ),
+        migrations.RunPython(backfill_histograms, migrations.RunPython.noop),
+    ]
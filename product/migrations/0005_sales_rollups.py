@@ -0,0 +1,65 @@
+# Generated by Django 3.2.8 on 2026-10-19 10:28
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0004_product_reviews'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='requestcart',
+            name='price',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.CreateModel(
+            name='HourlySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('units', models.PositiveBigIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('orders', models.PositiveIntegerField(default=0)),
+                ('hour', models.DateTimeField()),
+                ('business', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='product.business')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='product.product')),
+            ],
+            options={
+                'verbose_name_plural': 'Hourly Sales',
+            },
+        ),
+        migrations.CreateModel(
+            name='DailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('units', models.PositiveBigIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('orders', models.PositiveIntegerField(default=0)),
+                ('day', models.DateField()),
+                ('business', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='product.business')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='product.product')),
+            ],
+            options={
+                'verbose_name_plural': 'Daily Sales',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='hourlysales',
+            index=models.Index(fields=['business', 'hour'], name='product_hou_busines_ccfcd3_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='hourlysales',
+            constraint=models.UniqueConstraint(fields=('business', 'product', 'hour'), name='unique_hourly_sales'),
+        ),
+        migrations.AddIndex(
+            model_name='dailysales',
+            index=models.Index(fields=['business', 'day'], name='product_dai_busines_a3d2e1_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailysales',
+            constraint=models.UniqueConstraint(fields=('business', 'product', 'day'), name='unique_daily_sales'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 3.2.8 on 2026-10-19 10:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0005_sales_rollups'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='requestcart',
+            index=models.Index(fields=['user', 'created_at'], name='product_req_user_id_37d2e8_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='requestcart',
+            index=models.Index(fields=['business', 'created_at'], name='product_req_busines_0c7125_idx'),
+        ),
+    ]
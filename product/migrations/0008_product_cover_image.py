@@ -0,0 +1,37 @@
+# Generated by Django 3.2.8 on 2026-10-19 10:42
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_covers(apps, schema_editor):
+    Product = apps.get_model('product', 'Product')
+    ProductImage = apps.get_model('product', 'ProductImage')
+
+    # The newest flagged image of a product stays its cover
+    newest = ProductImage.objects.filter(product_id=OuterRef('product_id'), is_cover=True).order_by('-id')
+    ProductImage.objects.filter(is_cover=True).exclude(id=Subquery(newest.values('id')[:1])).update(is_cover=False)
+
+    covers = ProductImage.objects.filter(product_id=OuterRef('id'), is_cover=True)
+    Product.objects.update(cover_image_id=Subquery(covers.values('id')[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0007_product_imports'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='cover_image',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='product.productimage'),
+        ),
+        migrations.RunPython(backfill_covers, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='productimage',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_cover', True)), fields=('product',), name='unique_product_cover'),
+        ),
+    ]
@@ -0,0 +1,81 @@
+# Generated by Django 3.2.8 on 2026-10-19 10:44
+
+from django.db import migrations, models
+from django.utils import timezone
+import django.db.models.deletion
+
+
+def backfill_cards(apps, schema_editor):
+    quote = schema_editor.connection.ops.quote_name
+    tables = {
+        name: quote(apps.get_model(app, name)._meta.db_table) for app, name in (
+            ('product', 'ProductCard'), ('product', 'Product'), ('product', 'Business'),
+            ('product', 'Category'), ('product', 'ProductImage'), ('user', 'ImageUpload'),
+        )
+    }
+
+    schema_editor.execute(
+        f"INSERT INTO {tables['ProductCard']} (product_id, business_id, category_id, name, business_name, "
+        f"category_name, price, total_available, rating_avg, rating_count, cover_image, created_at, refreshed_at) "
+        f"SELECT p.id, p.business_id, p.category_id, p.name, b.name, c.name, p.price, p.total_available, "
+        f"p.rating_avg, p.rating_count, COALESCE(u.image, ''), p.created_at, %s "
+        f"FROM {tables['Product']} p "
+        f"JOIN {tables['Business']} b ON b.id = p.business_id "
+        f"JOIN {tables['Category']} c ON c.id = p.category_id "
+        f"LEFT JOIN {tables['ProductImage']} i ON i.id = p.cover_image_id "
+        f"LEFT JOIN {tables['ImageUpload']} u ON u.id = i.image_id",
+        [schema_editor.connection.ops.adapt_datetimefield_value(timezone.now())]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0008_product_cover_image'),
+        ('user', '0004_image_upload_source_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductCard',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='card', serialize=False, to='product.product')),
+                ('business_id', models.BigIntegerField()),
+                ('category_id', models.BigIntegerField()),
+                ('name', models.CharField(max_length=128)),
+                ('business_name', models.CharField(max_length=128)),
+                ('category_name', models.CharField(max_length=128)),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('total_available', models.PositiveIntegerField()),
+                ('rating_avg', models.DecimalField(decimal_places=2, max_digits=3)),
+                ('rating_count', models.PositiveIntegerField()),
+                ('cover_image', models.CharField(blank=True, max_length=255)),
+                ('created_at', models.DateTimeField()),
+                ('refreshed_at', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name_plural': 'Product Cards',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='productcard',
+            index=models.Index(fields=['created_at', 'product'], name='product_pro_created_2845ad_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productcard',
+            index=models.Index(fields=['category_id', 'created_at', 'product'], name='product_pro_categor_f37887_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productcard',
+            index=models.Index(fields=['business_id', 'created_at', 'product'], name='product_pro_busines_cc7b11_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productcard',
+            index=models.Index(fields=['price', 'product'], name='product_pro_price_71edae_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productcard',
+            index=models.Index(fields=['rating_avg', 'product'], name='product_pro_rating__9c7346_idx'),
+        ),
+        migrations.RunPython(backfill_cards, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 3.2.8 on 2026-10-19 10:52
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0010_related_products'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='popular_score',
+            field=models.FloatField(db_index=True, default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='trending_score',
+            field=models.FloatField(db_index=True, default=0),
+        ),
+        migrations.CreateModel(
+            name='PopularityCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event', models.CharField(choices=[('view', 'View'), ('wish', 'Wish'), ('cart', 'Cart'), ('purchase', 'Purchase')], max_length=8)),
+                ('hour', models.DateTimeField()),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='product.product')),
+            ],
+            options={
+                'verbose_name_plural': 'Popularity Counters',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='popularitycounter',
+            index=models.Index(fields=['hour', 'product'], name='product_pop_hour_ac6553_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='popularitycounter',
+            constraint=models.UniqueConstraint(fields=('product', 'event', 'hour', 'shard'), name='unique_popularity_counter'),
+        ),
+    ]
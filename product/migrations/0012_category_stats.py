@@ -0,0 +1,47 @@
+# Generated by Django 3.2.8 on 2026-10-19 10:54
+
+from django.db import migrations, models
+
+
+def backfill_stats(apps, schema_editor):
+    quote = schema_editor.connection.ops.quote_name
+    categories = quote(apps.get_model('product', 'Category')._meta.db_table)
+    products = quote(apps.get_model('product', 'Product')._meta.db_table)
+
+    schema_editor.execute(
+        f"UPDATE {categories} AS c SET product_count = s.product_count, min_price = s.min_price, "
+        f"max_price = s.max_price "
+        f"FROM (SELECT category_id, COUNT(*) AS product_count, MIN(price) AS min_price, MAX(price) AS max_price "
+        f"FROM {products} GROUP BY category_id) AS s "
+        f"WHERE c.id = s.category_id"
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0011_popularity_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='max_price',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='min_price',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='product_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'price'], name='product_pro_categor_4ea9af_idx'),
+        ),
+        migrations.RunPython(backfill_stats, migrations.RunPython.noop),
+    ]
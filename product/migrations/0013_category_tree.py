@@ -0,0 +1,48 @@
+# Generated by Django 3.2.8 on 2026-10-19 10:57
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_paths(apps, schema_editor):
+    categories = schema_editor.connection.ops.quote_name(apps.get_model('product', 'Category')._meta.db_table)
+
+    # Every existing category is a root
+    schema_editor.execute(
+        f"UPDATE {categories} SET path = id || '/', depth = 0, tree_product_count = product_count"
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0012_category_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='children', to='product.category'),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='path',
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='tree_product_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='category',
+            index=models.Index(fields=['path'], name='product_category_path_idx', opclasses=('varchar_pattern_ops',)),
+        ),
+        migrations.RunPython(backfill_paths, migrations.RunPython.noop),
+    ]
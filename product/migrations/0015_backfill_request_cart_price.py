@@ -0,0 +1,24 @@
+from django.db import migrations, models
+from django.db.models import ExpressionWrapper, F, OuterRef, Subquery
+
+
+def backfill_prices(apps, schema_editor):
+    # Request carts written before 0005 got price 0. They are priced at the current price of their product,
+    # which is only approximate for products repriced since. rebuild_sales_rollups picks them up afterwards.
+    Product = apps.get_model('product', 'Product')
+    RequestCart = apps.get_model('product', 'RequestCart')
+
+    price = Subquery(Product.objects.filter(id=OuterRef('product_id')).values('price')[:1])
+    total = ExpressionWrapper(price * F('quantity'), output_field=models.DecimalField(max_digits=12, decimal_places=2))
+    RequestCart.objects.filter(price=0).update(price=total)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0014_business_deleted_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_prices, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models import Q
 
 from user.models import ImageUpload, User
 
@@ -6,10 +7,25 @@ from user.models import ImageUpload, User
 class Category(models.Model):
     """Class for creation a category table in a database"""
     name = models.CharField(max_length=128, unique=True)
+    parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='children')
+    # Ids of the ancestors and of the category itself, "1/4/9/", maintained by product.categories.
+    # A subtree is every category whose path starts with the path of its root.
+    path = models.CharField(max_length=255, blank=True, editable=False)
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
+    # Aggregates of product_categories, maintained by product.categories
+    product_count = models.PositiveIntegerField(default=0)
+    min_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    max_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    # product_count summed over the whole subtree
+    tree_product_count = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         verbose_name_plural = 'Categories'
+        indexes = [
+            # Serves path LIKE 'prefix%' whatever the collation of the database
+            models.Index(fields=('path', ), name='product_category_path_idx', opclasses=('varchar_pattern_ops', )),
+        ]
 
     def __str__(self):
         return self.name
@@ -17,8 +33,11 @@ class Category(models.Model):
 
 class Business(models.Model):
     """Class for creation a business table in a database"""
-    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='user_business')
+    # Detached from its owner when deleted, until the delete_business job removes it
+    user = models.OneToOneField(User, on_delete=models.CASCADE, null=True, blank=True, related_name='user_business')
     name = models.CharField(max_length=128, unique=True)
+    # Set when the owner deleted the business, its products are hidden from then on
+    deleted_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -29,6 +48,12 @@ class Business(models.Model):
         return self.name
 
 
+class ProductQuerySet(models.QuerySet):
+    def visible(self):
+        """Products of the businesses that aren't deleted"""
+        return self.filter(business__deleted_at__isnull=True)
+
+
 class Product(models.Model):
     """Class for creation a product table in a database"""
     category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='product_categories')
@@ -38,12 +63,29 @@ class Product(models.Model):
     total_available = models.PositiveIntegerField()
     total_count = models.PositiveIntegerField()
     description = models.TextField()
+    # Aggregates of product_comments, maintained by product.ratings
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    rating_avg = models.DecimalField(max_digits=3, decimal_places=2, default=0, db_index=True)
+    # The image of product_images flagged is_cover, maintained by product.covers
+    cover_image = models.ForeignKey(
+        'ProductImage', on_delete=models.SET_NULL, null=True, blank=True, related_name='+'
+    )
+    # Weighted activity over the trending and popular windows, maintained by product.popularity
+    trending_score = models.FloatField(default=0, db_index=True)
+    popular_score = models.FloatField(default=0, db_index=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = ProductQuerySet.as_manager()
+
     class Meta:
         ordering = ("-created_at", )
         verbose_name_plural = 'Products'
+        indexes = [
+            # Covers the category stats, counted and ranged without reading the products
+            models.Index(fields=('category', 'price')),
+        ]
 
     def __str__(self):
         return f"{self.name}    |    {self.business.name}"
@@ -59,6 +101,9 @@ class ProductImage(models.Model):
 
     class Meta:
         verbose_name_plural = 'Product Images'
+        constraints = [
+            models.UniqueConstraint(fields=('product', ), condition=Q(is_cover=True), name='unique_product_cover'),
+        ]
 
     def __str__(self):
         return f"{self.product.name}    |    {self.is_cover}"
@@ -75,11 +120,31 @@ class ProductComment(models.Model):
 
     class Meta:
         verbose_name_plural = 'Product Comments'
+        indexes = [
+            models.Index(fields=('product', 'created_at')),
+            models.Index(fields=('product', 'rate')),
+        ]
 
     def __str__(self):
         return f"{self.product.name}    |    {self.user.first_name}"
 
 
+class ProductRating(models.Model):
+    """Class for creation a product rating histogram table in a database, one row per product and rate"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='product_ratings')
+    rate = models.PositiveIntegerField()
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = 'Product Ratings'
+        constraints = [
+            models.UniqueConstraint(fields=('product', 'rate'), name='unique_product_rate'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id}    |    {self.rate}    |    {self.count}"
+
+
 class Wish(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='user_wish')
     products = models.ManyToManyField(Product, related_name='products_wished')
@@ -107,7 +172,185 @@ class RequestCart(models.Model):
     business = models.ForeignKey(Business, on_delete=models.CASCADE, related_name='business_request')
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='product_request')
     quantity = models.PositiveIntegerField()
+    # Total of the line at the moment of the payment
+    price = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         ordering = ('created_at', )
+        indexes = [
+            models.Index(fields=('user', 'created_at')),
+            models.Index(fields=('business', 'created_at')),
+        ]
+
+
+class SalesRollup(models.Model):
+    """Sales of a product over a period, maintained by product.rollups"""
+    business = models.ForeignKey(Business, on_delete=models.CASCADE, related_name='+')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    units = models.PositiveBigIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    orders = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+
+class DailySales(SalesRollup):
+    """Class for creation a daily sales rollup table in a database"""
+    day = models.DateField()
+
+    class Meta:
+        verbose_name_plural = 'Daily Sales'
+        constraints = [
+            models.UniqueConstraint(fields=('business', 'product', 'day'), name='unique_daily_sales'),
+        ]
+        indexes = [
+            models.Index(fields=('business', 'day')),
+        ]
+
+
+class HourlySales(SalesRollup):
+    """Class for creation an hourly sales rollup table in a database"""
+    hour = models.DateTimeField()
+
+    class Meta:
+        verbose_name_plural = 'Hourly Sales'
+        constraints = [
+            models.UniqueConstraint(fields=('business', 'product', 'hour'), name='unique_hourly_sales'),
+        ]
+        indexes = [
+            models.Index(fields=('business', 'hour')),
+        ]
+
+
+class ProductImport(models.Model):
+    """Class for creation a bulk product import table in a database"""
+
+    PENDING = 'pending'
+    PROCESSING = 'processing'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (PROCESSING, 'Processing'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed')
+    )
+
+    CSV = 'csv'
+    NDJSON = 'ndjson'
+
+    FORMAT_CHOICES = (
+        (CSV, 'CSV'),
+        (NDJSON, 'NDJSON')
+    )
+
+    business = models.ForeignKey(Business, on_delete=models.CASCADE, related_name='business_imports')
+    file = models.FileField(upload_to='imports/%Y/%m/%d/')
+    format = models.CharField(max_length=8, choices=FORMAT_CHOICES, default=CSV)
+    # Rows naming an existing product update it instead of being rejected
+    update_existing = models.BooleanField(default=False)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PENDING, db_index=True)
+    processed_rows = models.PositiveIntegerField(default=0)
+    created_count = models.PositiveIntegerField(default=0)
+    updated_count = models.PositiveIntegerField(default=0)
+    failed_count = models.PositiveIntegerField(default=0)
+    # [{"row": line number, "errors": {field: message}}], capped by PRODUCT_IMPORT_MAX_ERRORS
+    errors = models.JSONField(default=list, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ('-created_at', )
+        verbose_name_plural = 'Product Imports'
+
+    def __str__(self):
+        return f"{self.file.name}    |    {self.status}"
+
+
+class ProductCard(models.Model):
+    """Class for creation a denormalized product listing table in a database, maintained by product.cards"""
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='card')
+    # Plain ids: listings filter on them but never join
+    business_id = models.BigIntegerField()
+    category_id = models.BigIntegerField()
+    name = models.CharField(max_length=128)
+    business_name = models.CharField(max_length=128)
+    category_name = models.CharField(max_length=128)
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    total_available = models.PositiveIntegerField()
+    rating_avg = models.DecimalField(max_digits=3, decimal_places=2)
+    rating_count = models.PositiveIntegerField()
+    # Storage name of the cover image, empty without a cover
+    cover_image = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField()
+    refreshed_at = models.DateTimeField()
+
+    class Meta:
+        verbose_name_plural = 'Product Cards'
+        indexes = [
+            models.Index(fields=('created_at', 'product')),
+            models.Index(fields=('category_id', 'created_at', 'product')),
+            models.Index(fields=('business_id', 'created_at', 'product')),
+            models.Index(fields=('price', 'product')),
+            models.Index(fields=('rating_avg', 'product')),
+        ]
+
+    def __str__(self):
+        return f"{self.name}    |    {self.business_name}"
+
+
+class RelatedProduct(models.Model):
+    """Class for creation a "frequently bought together" table in a database, built by product.recommendations"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='related_products')
+    related = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        verbose_name_plural = 'Related Products'
+        constraints = [
+            # Also the index serving a product's neighbours in rank order
+            models.UniqueConstraint(fields=('product', 'rank'), name='unique_related_product_rank'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id}    |    {self.related_id}"
+
+
+class PopularityCounter(models.Model):
+    """Class for creation a sharded hourly product activity counter table in a database, written by product.popularity"""
+
+    VIEW = 'view'
+    WISH = 'wish'
+    CART = 'cart'
+    PURCHASE = 'purchase'
+
+    EVENT_CHOICES = (
+        (VIEW, 'View'),
+        (WISH, 'Wish'),
+        (CART, 'Cart'),
+        (PURCHASE, 'Purchase')
+    )
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    event = models.CharField(max_length=8, choices=EVENT_CHOICES)
+    hour = models.DateTimeField()
+    # Every worker process writes its own shard, so their flushes never wait on the same rows
+    shard = models.PositiveSmallIntegerField()
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = 'Popularity Counters'
+        constraints = [
+            models.UniqueConstraint(fields=('product', 'event', 'hour', 'shard'), name='unique_popularity_counter'),
+        ]
+        indexes = [
+            models.Index(fields=('hour', 'product')),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id}    |    {self.event}    |    {self.hour}    |    {self.count}"
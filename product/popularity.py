@@ -0,0 +1,186 @@
+import atexit
+import logging
+import os
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+# How much one event of each kind adds to the scores
+WEIGHTS = {
+    'view': 1,
+    'wish': 3,
+    'cart': 5,
+    'purchase': 10,
+}
+
+# Values of the products sort_by argument and the score column they sort on
+SORT_FIELDS = {
+    'TRENDING': 'trending_score',
+    'POPULAR': 'popular_score',
+}
+
+_buffer = {}
+_flushed_at = time.monotonic()
+_lock = threading.Lock()
+
+logger = logging.getLogger(__name__)
+
+
+def _table(model):
+    return connection.ops.quote_name(model._meta.db_table)
+
+
+def _hour(moment):
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def record(product_id, event, count=1):
+    """Count an event of a product in the worker's buffer, written by a later flush"""
+    global _flushed_at
+
+    key = (int(product_id), event, _hour(timezone.now()))
+
+    with _lock:
+        _buffer[key] = _buffer.get(key, 0) + count
+        due = (
+            len(_buffer) >= settings.POPULARITY_FLUSH_SIZE
+            or time.monotonic() - _flushed_at >= settings.POPULARITY_FLUSH_INTERVAL
+        )
+        if due:
+            _flushed_at = time.monotonic()
+
+    if due:
+        # Outside of any transaction, the counts must not be rolled back with the request's writes
+        transaction.on_commit(flush)
+
+
+def flush():
+    """Write the buffered counts, events buffered since the last flush are lost if the worker dies"""
+    global _buffer
+
+    with _lock:
+        pending, _buffer = _buffer, {}
+
+    if not pending:
+        return
+
+    try:
+        write_counters(pending)
+    except Exception:
+        logger.exception('Writing %d popularity counters failed', len(pending))
+        with _lock:
+            for key, count in pending.items():
+                _buffer[key] = _buffer.get(key, 0) + count
+
+
+atexit.register(flush)
+
+
+def write_counters(counts):
+    """Add {(product id, event, hour): count} to the counters of the worker's shard in one statement"""
+    from .models import PopularityCounter, Product
+
+    values = ', '.join(['(%s::bigint, %s, %s::timestamptz, %s::integer)'] * len(counts))
+    params = [value for (product_id, event, hour), count in counts.items() for value in (product_id, event, hour, count)]
+
+    with connection.cursor() as cursor:
+        # Products deleted since the events were counted are skipped by the join
+        cursor.execute(
+            f'INSERT INTO {_table(PopularityCounter)} AS c (product_id, event, hour, shard, count) '
+            f'SELECT v.product_id, v.event, v.hour, %s, v.count '
+            f'FROM (VALUES {values}) AS v (product_id, event, hour, count) '
+            f'JOIN {_table(Product)} p ON p.id = v.product_id '
+            f'ON CONFLICT (product_id, event, hour, shard) DO UPDATE SET count = c.count + EXCLUDED.count',
+            [os.getpid() % settings.POPULARITY_SHARDS, *params]
+        )
+        return cursor.rowcount
+
+
+def windows(now=None):
+    """Oldest hour counted by the trending and by the popular score"""
+    now = _hour(now or timezone.now())
+    return (
+        now - timedelta(hours=settings.POPULARITY_TRENDING_HOURS - 1),
+        now - timedelta(days=settings.POPULARITY_POPULAR_DAYS) + timedelta(hours=1)
+    )
+
+
+def stale_products(full=False, now=None):
+    """Ids of the products whose scores may have changed since the last refresh"""
+    from .models import PopularityCounter, Product
+
+    now = now or timezone.now()
+    trending, popular = windows(now)
+    lookback = timedelta(hours=settings.POPULARITY_REFRESH_LOOKBACK)
+
+    with connection.cursor() as cursor:
+        if full:
+            cursor.execute(
+                f'SELECT id FROM {_table(Product)} WHERE trending_score <> 0 OR popular_score <> 0 '
+                f'UNION SELECT product_id FROM {_table(PopularityCounter)} WHERE hour >= %s',
+                [popular]
+            )
+        else:
+            # Products counted recently, and those whose counters slid out of a window
+            cursor.execute(
+                f'SELECT DISTINCT product_id FROM {_table(PopularityCounter)} '
+                f'WHERE hour >= %s OR hour >= %s AND hour < %s OR hour >= %s AND hour < %s',
+                [_hour(now) - lookback, trending - lookback, trending, popular - lookback, popular]
+            )
+        return sorted(row[0] for row in cursor.fetchall())
+
+
+def refresh_scores(product_ids, now=None):
+    """Recompute the scores of products from their counters in one statement, returns the products changed"""
+    from .models import PopularityCounter, Product
+
+    if not product_ids:
+        return 0
+
+    trending, popular = windows(now)
+    cases = ' '.join(f"WHEN '{event}' THEN {value}" for event, value in WEIGHTS.items())
+    weight = f'CASE event {cases} END'
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'UPDATE {_table(Product)} AS p '
+            f'SET trending_score = COALESCE(s.trending, 0), popular_score = COALESCE(s.popular, 0) '
+            f'FROM unnest(%(ids)s::bigint[]) AS t (id) LEFT JOIN ('
+            f'SELECT product_id, SUM({weight} * count) FILTER (WHERE hour >= %(trending)s) AS trending, '
+            f'SUM({weight} * count) AS popular FROM {_table(PopularityCounter)} '
+            f'WHERE product_id = ANY(%(ids)s) AND hour >= %(popular)s GROUP BY product_id'
+            f') AS s ON s.product_id = t.id '
+            f'WHERE p.id = t.id '
+            f'AND (p.trending_score <> COALESCE(s.trending, 0) OR p.popular_score <> COALESCE(s.popular, 0))',
+            {'ids': list(product_ids), 'trending': trending, 'popular': popular}
+        )
+        return cursor.rowcount
+
+
+def prune_counters(now=None):
+    """Delete the counters older than the popular window, once a refresh has taken them out of the scores"""
+    from .models import PopularityCounter
+
+    _, popular = windows(now)
+    lookback = timedelta(hours=settings.POPULARITY_REFRESH_LOOKBACK)
+
+    deleted, _ = PopularityCounter.objects.filter(hour__lt=popular - lookback).delete()
+    return deleted
+
+
+def refresh_popularity(full=False, batch_size=5000):
+    """Refresh the scores of the stale products batch by batch, returns (products checked, products changed)"""
+    now = timezone.now()
+    product_ids = stale_products(full, now)
+    changed = 0
+
+    for start in range(0, len(product_ids), batch_size):
+        changed += refresh_scores(product_ids[start:start + batch_size], now)
+
+    prune_counters(now)
+
+    return len(product_ids), changed
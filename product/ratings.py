@@ -0,0 +1,111 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Case, Count, DecimalField, F, IntegerField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce, NullIf
+
+from .cards import mark_dirty
+
+MIN_RATE = 1
+MAX_RATE = 5
+
+
+def average(total, count):
+    """Expression of the rounded average rating from a sum and a count expression"""
+    return Cast(
+        Cast(total, DecimalField(max_digits=12, decimal_places=4)) / count,
+        DecimalField(max_digits=3, decimal_places=2)
+    )
+
+
+def apply_rating_change(product_id, added=(), removed=()):
+    """Adjust the rating aggregates and histogram of a product for added and removed rates"""
+    from .models import Product
+
+    apply_histogram_change(product_id, added, removed)
+
+    delta_sum = sum(added) - sum(removed)
+    delta_count = len(added) - len(removed)
+
+    if not delta_sum and not delta_count:
+        return
+
+    # Every F() refers to the row before the UPDATE
+    rating_sum = F('rating_sum') + delta_sum
+    rating_count = F('rating_count') + delta_count
+
+    Product.objects.filter(id=product_id).update(
+        rating_sum=rating_sum,
+        rating_count=rating_count,
+        rating_avg=Case(
+            When(rating_count__gt=-delta_count, then=average(rating_sum, rating_count)),
+            default=Value(0),
+            output_field=DecimalField(max_digits=3, decimal_places=2)
+        )
+    )
+
+
+def apply_histogram_change(product_id, added=(), removed=()):
+    """Adjust the histogram buckets of a product, creating missing ones"""
+    from .models import ProductRating
+
+    deltas = Counter(added)
+    deltas.subtract(removed)
+
+    for rate, delta in deltas.items():
+        if not delta:
+            continue
+
+        bucket = ProductRating.objects.filter(product_id=product_id, rate=rate)
+        if not bucket.update(count=F('count') + delta):
+            ProductRating.objects.get_or_create(product_id=product_id, rate=rate)
+            bucket.update(count=F('count') + delta)
+
+
+def rebuild_histograms(product_ids):
+    """Recompute the histogram buckets of products from their comments"""
+    from .models import ProductComment, ProductRating
+
+    buckets = ProductComment.objects.filter(product_id__in=product_ids).order_by().values(
+        'product_id', 'rate').annotate(total=Count('id'))
+
+    with transaction.atomic():
+        ProductRating.objects.filter(product_id__in=product_ids).delete()
+        ProductRating.objects.bulk_create([
+            ProductRating(product_id=row['product_id'], rate=row['rate'], count=row['total']) for row in buckets
+        ])
+
+
+def comment_aggregates():
+    """Subquery expressions of the rating sum and count of the outer product, from its comments"""
+    from .models import ProductComment
+
+    comments = ProductComment.objects.filter(product_id=OuterRef('id')).order_by().values('product_id')
+
+    rating_sum = Coalesce(Subquery(comments.annotate(total=Sum('rate')).values('total')), 0)
+    rating_count = Coalesce(
+        Subquery(comments.annotate(total=Count('id')).values('total'), output_field=IntegerField()), 0
+    )
+    return rating_sum, rating_count
+
+
+def reconcile_ratings(products):
+    """Recompute the rating aggregates of products whose stored values drifted, returns their count"""
+    rating_sum, rating_count = comment_aggregates()
+
+    drifted = list(products.annotate(actual_sum=rating_sum, actual_count=rating_count).exclude(
+        rating_sum=F('actual_sum'), rating_count=F('actual_count')
+    ).values_list('id', flat=True))
+
+    fixed = products.model.objects.filter(id__in=drifted).update(
+        rating_sum=rating_sum,
+        rating_count=rating_count,
+        rating_avg=Coalesce(
+            average(rating_sum, NullIf(rating_count, 0)), Value(0),
+            output_field=DecimalField(max_digits=3, decimal_places=2)
+        )
+    )
+
+    mark_dirty(drifted)
+
+    return fixed
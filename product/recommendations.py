@@ -0,0 +1,129 @@
+from django.conf import settings
+from django.db import transaction
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:  # Only the offline build needs them, related products are served from the table
+    np = sparse = None
+
+
+def _basket_matrix(rows, product_ids):
+    """Binary basket x product matrix of (basket, product_id) rows"""
+    baskets, products = np.array(rows, dtype='int64').reshape(-1, 2).T
+    product_index = np.searchsorted(product_ids, products).clip(max=len(product_ids) - 1)
+
+    # Products created after the build started are left out
+    known = product_ids[product_index] == products
+
+    matrix = sparse.csr_matrix(
+        (np.ones(known.sum(), dtype='float32'), (baskets[known], product_index[known])),
+        shape=(baskets[-1] + 1, len(product_ids))
+    )
+    # A product bought several times by a user counts once
+    matrix.data[:] = 1
+    return matrix
+
+
+def cooccurrence(product_ids, chunk_size=None):
+    """Sparse product x product matrix of the number of users who bought both, built chunk by chunk"""
+    from .models import RequestCart
+
+    chunk_size = chunk_size or settings.RELATED_PRODUCTS_CHUNK_SIZE
+    totals = sparse.csr_matrix((len(product_ids), len(product_ids)), dtype='float32')
+    purchases = RequestCart.objects.order_by('user_id').values_list('user_id', 'product_id')
+    rows = []
+    last_user = None
+    basket = -1
+
+    for user_id, product_id in purchases.iterator(chunk_size=chunk_size):
+        if user_id != last_user:
+            # Chunks end between two users, the purchases of a user must stay together
+            if len(rows) >= chunk_size:
+                baskets = _basket_matrix(rows, product_ids)
+                totals = totals + baskets.T @ baskets
+                rows = []
+                basket = -1
+
+            # Users are numbered by chunk, their ids are UUIDs
+            basket += 1
+            last_user = user_id
+
+        rows.append((basket, product_id))
+
+    if rows:
+        baskets = _basket_matrix(rows, product_ids)
+        totals = totals + baskets.T @ baskets
+
+    return totals.tocsr()
+
+
+def similarity(counts, min_support=1):
+    """Cosine similarity of the products from their co-occurrence counts, without the diagonal"""
+    buyers = counts.diagonal()
+
+    counts = counts.tocoo()
+    keep = (counts.row != counts.col) & (counts.data >= min_support)
+    rows, cols, data = counts.row[keep], counts.col[keep], counts.data[keep]
+
+    scores = data / np.sqrt(buyers[rows] * buyers[cols])
+
+    return sparse.csr_matrix((scores, (rows, cols)), shape=counts.shape)
+
+
+def top_neighbours(scores, top_k):
+    """(row, column, score) of the best top_k columns of every row, best first"""
+    for row in range(scores.shape[0]):
+        start, end = scores.indptr[row], scores.indptr[row + 1]
+        if start == end:
+            continue
+
+        columns = scores.indices[start:end]
+        values = scores.data[start:end]
+
+        if len(values) > top_k:
+            best = np.argpartition(-values, top_k - 1)[:top_k]
+            columns, values = columns[best], values[best]
+
+        # Ties are broken by the column, which keeps the ranks stable between builds
+        order = np.lexsort((columns, -values))
+        yield from ((row, columns[index], values[index]) for index in order)
+
+
+def build_related_products(top_k=None, min_support=None, chunk_size=None, batch_size=5000):
+    """Replace the related products with the top_k most similar products of each, returns the rows written"""
+    from .models import Product, RelatedProduct
+
+    top_k = top_k or settings.RELATED_PRODUCTS_TOP_K
+    min_support = min_support or settings.RELATED_PRODUCTS_MIN_SUPPORT
+
+    product_ids = np.array(Product.objects.order_by('id').values_list('id', flat=True), dtype='int64')
+    if not len(product_ids):
+        return 0
+
+    scores = similarity(cooccurrence(product_ids, chunk_size), min_support)
+
+    rows = []
+    written = 0
+    rank = 0
+    previous = None
+
+    with transaction.atomic():
+        RelatedProduct.objects.all().delete()
+
+        for row, column, score in top_neighbours(scores, top_k):
+            rank = rank + 1 if row == previous else 1
+            previous = row
+            rows.append(RelatedProduct(
+                product_id=int(product_ids[row]), related_id=int(product_ids[column]), rank=rank, score=float(score)
+            ))
+
+            if len(rows) >= batch_size:
+                RelatedProduct.objects.bulk_create(rows)
+                written += len(rows)
+                rows = []
+
+        RelatedProduct.objects.bulk_create(rows)
+        written += len(rows)
+
+    return written
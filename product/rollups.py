@@ -0,0 +1,121 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDay, TruncHour
+from django.utils import timezone
+
+DAY = 'day'
+HOUR = 'hour'
+
+
+def _rollup_models():
+    from .models import DailySales, HourlySales
+
+    return {DAY: DailySales, HOUR: HourlySales}
+
+
+def _bucket(created_at, granularity):
+    """Start of the day or hour of a moment, buckets are in the project time zone"""
+    if timezone.is_naive(created_at):
+        created_at = timezone.make_aware(created_at)
+
+    hour = timezone.localtime(created_at).replace(minute=0, second=0, microsecond=0)
+    return hour.date() if granularity == DAY else hour
+
+
+def _upsert(model, bucket_field, rows):
+    """Add the rows to the rollup table in a single INSERT ... ON CONFLICT statement"""
+    table = connection.ops.quote_name(model._meta.db_table)
+    placeholders = ', '.join(['(%s, %s, %s, %s, %s, %s)'] * len(rows))
+    params = [value for row in rows for value in row]
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} (business_id, product_id, {bucket_field}, units, revenue, orders) '
+            f'VALUES {placeholders} '
+            f'ON CONFLICT (business_id, product_id, {bucket_field}) DO UPDATE SET '
+            f'units = {table}.units + EXCLUDED.units, '
+            f'revenue = {table}.revenue + EXCLUDED.revenue, '
+            f'orders = {table}.orders + EXCLUDED.orders',
+            params
+        )
+
+
+def record_sales(request_carts):
+    """Add freshly written request cart rows to the daily and hourly rollups"""
+    for granularity, model in _rollup_models().items():
+        totals = defaultdict(lambda: [0, Decimal(0), 0])
+
+        for item in request_carts:
+            key = (item.business_id, item.product_id, _bucket(item.created_at, granularity))
+            totals[key][0] += item.quantity
+            totals[key][1] += item.price
+            totals[key][2] += 1
+
+        if totals:
+            # Sorted rows lock the rollup rows in the same order in every transaction
+            _upsert(model, granularity, [key + tuple(values) for key, values in sorted(totals.items())])
+
+
+def rebuild_rollups(business_ids=None, since=None):
+    """Recompute the rollups from the request carts, for every business or the given ones"""
+    from .models import RequestCart
+
+    created = 0
+
+    for granularity, model in _rollup_models().items():
+        sales = RequestCart.objects.all()
+        rollups = model.objects.all()
+
+        if business_ids:
+            sales = sales.filter(business_id__in=business_ids)
+            rollups = rollups.filter(business_id__in=business_ids)
+
+        if since:
+            # Only whole buckets are rebuilt
+            start = _bucket(since, granularity)
+            sales = sales.filter(**{'created_at__date__gte' if granularity == DAY else 'created_at__gte': start})
+            rollups = rollups.filter(**{f'{granularity}__gte': start})
+
+        trunc = TruncDay('created_at') if granularity == DAY else TruncHour('created_at')
+        rows = sales.annotate(bucket=trunc).values('business_id', 'product_id', 'bucket').annotate(
+            units=Sum('quantity'), revenue=Sum('price'), orders=Count('id')
+        ).order_by()
+
+        with transaction.atomic():
+            rollups.delete()
+            objects = [
+                model(**{
+                    'business_id': row['business_id'],
+                    'product_id': row['product_id'],
+                    granularity: row['bucket'].date() if granularity == DAY else row['bucket'],
+                    'units': row['units'],
+                    'revenue': row['revenue'],
+                    'orders': row['orders'],
+                }) for row in rows.iterator()
+            ]
+            model.objects.bulk_create(objects, batch_size=1000)
+            created += len(objects)
+
+    return created
+
+
+def sales_stats(business_id, start, end, granularity):
+    """Totals, per bucket series and per product breakdown of the sales of a business between two moments"""
+    model = _rollup_models()[granularity]
+
+    # Partial buckets at the edges are included whole
+    start, end = _bucket(start, granularity), _bucket(end, granularity)
+
+    rollups = model.objects.filter(**{
+        'business_id': business_id, f'{granularity}__gte': start, f'{granularity}__lte': end
+    })
+    sums = {'units': Sum('units'), 'revenue': Sum('revenue'), 'orders': Sum('orders')}
+
+    return {
+        'totals': rollups.aggregate(**sums),
+        'series': rollups.values(bucket=F(granularity)).annotate(**sums).order_by('bucket'),
+        'products': rollups.values('product_id').annotate(**sums).order_by('-revenue', 'product_id'),
+    }
@@ -1,19 +1,31 @@
+from datetime import datetime, time, timedelta
+
 import graphene
 
+from django.conf import settings
+from django.db import transaction
 from django.db.models import Q
+from django.utils import timezone
 from graphene_django import DjangoObjectType
+from graphene_file_upload.scalars import Upload
 
 from .models import (
     Category, Business, Product, ProductComment,
-    ProductImage, Wish, Cart, RequestCart
+    PopularityCounter, ProductCard, ProductImage, ProductImport, ProductRating, RelatedProduct, Wish, Cart, RequestCart
 )
-from backend.permissions import get_query, paginate, is_authenticated
-
-
-class CategoryType(DjangoObjectType):
-
-    class Meta:
-        model = Category
+from backend.permissions import get_query, keyset_paginate, paginate, is_authenticated, resolve_keyset
+from .bulk import bulk_update_products
+from .cards import mark_dirty
+from .categories import subtree_filter
+from .covers import set_cover, unset_cover
+from .popularity import SORT_FIELDS as POPULARITY_SORT_FIELDS, record as record_activity
+from .ratings import MAX_RATE, MIN_RATE, apply_rating_change
+from .rollups import DAY, HOUR, sales_stats
+from .snapshot import SORT_COLUMNS as SNAPSHOT_SORT_COLUMNS, SnapshotResult, current_snapshot
+from .tasks import delete_business, import_products, record_sales
+from .wishlist import add_to_wishlist, remove_from_wishlist, request_wished_ids, wished_product_ids
+from jobs.queue import enqueue
+from user.schema import media_url
 
 
 class BusinessType(DjangoObjectType):
@@ -23,10 +35,34 @@ class BusinessType(DjangoObjectType):
 
 
 class ProductType(DjangoObjectType):
+    is_wished = graphene.Boolean()
 
     class Meta:
         model = Product
 
+    def resolve_is_wished(self, info):
+        return self.id in request_wished_ids(info.context)
+
+
+ProductsPaginatedType = paginate(ProductType)
+
+
+class CategoryType(DjangoObjectType):
+    products = graphene.Field(ProductsPaginatedType, page=graphene.Int())
+    product_categories = graphene.List(ProductType, deprecation_reason='Use products')
+
+    class Meta:
+        model = Category
+
+    def resolve_products(self, info, **kwargs):
+        # Products of the whole subtree
+        return Product.objects.visible().select_related('category', 'business', 'cover_image__image').filter(
+            category__path__startswith=self.path
+        )
+
+    def resolve_product_categories(self, info):
+        return self.product_categories.all()
+
 
 class ProductCommentType(DjangoObjectType):
 
@@ -40,6 +76,80 @@ class ProductImageType(DjangoObjectType):
         model = ProductImage
 
 
+class ProductCardType(DjangoObjectType):
+    id = graphene.ID()
+    business_id = graphene.ID()
+    category_id = graphene.ID()
+    cover_url = graphene.String()
+    in_stock = graphene.Boolean()
+
+    class Meta:
+        model = ProductCard
+        # Every field of a card is read from its own row, never through a relation
+        exclude = ('product', )
+
+    def resolve_id(self, info):
+        return self.product_id
+
+    def resolve_cover_url(self, info):
+        return media_url(self.cover_image) if self.cover_image else None
+
+    def resolve_in_stock(self, info):
+        return self.total_available > 0
+
+
+class CardSort(graphene.Enum):
+    NEWEST = 'newest'
+    PRICE_ASC = 'price_asc'
+    PRICE_DESC = 'price_desc'
+    TOP_RATED = 'top_rated'
+
+
+# The product id ends every ordering to make the keyset cursors unambiguous
+CARD_ORDERINGS = {
+    'newest': ('-created_at', '-product_id'),
+    'price_asc': ('price', 'product_id'),
+    'price_desc': ('-price', '-product_id'),
+    'top_rated': ('-rating_avg', '-product_id'),
+}
+
+ProductCardsType = keyset_paginate(ProductCardType, name='ProductCards')
+
+
+class ProductImportType(DjangoObjectType):
+
+    class Meta:
+        model = ProductImport
+
+
+class RatingBucketType(graphene.ObjectType):
+    """Response with the number of reviews of a product with a rate"""
+    rate = graphene.Int()
+    count = graphene.Int()
+
+
+class ReviewSort(graphene.Enum):
+    NEWEST = 'newest'
+    OLDEST = 'oldest'
+    HIGHEST = 'highest'
+    LOWEST = 'lowest'
+
+
+# The unique id ends every ordering to make the keyset cursors unambiguous
+REVIEW_ORDERINGS = {
+    'newest': ('-created_at', '-id'),
+    'oldest': ('created_at', 'id'),
+    'highest': ('-rate', '-id'),
+    'lowest': ('rate', 'id'),
+}
+
+ProductReviewsType = keyset_paginate(
+    ProductCommentType, name='ProductReviews',
+    total=graphene.Int(), rating_avg=graphene.Float(),
+    histogram=graphene.List(RatingBucketType)
+)
+
+
 class WishType(DjangoObjectType):
 
     class Meta:
@@ -58,34 +168,161 @@ class RequestCartType(DjangoObjectType):
         model = RequestCart
 
 
+OrdersType = keyset_paginate(RequestCartType, name='Orders')
+
+# Newest orders first, the id breaks ties between the rows of one payment
+ORDER_ORDERING = ('-created_at', '-id')
+
+
+def filter_orders(query, product_id=None, start=None, end=None):
+    """Narrow a request cart query down by product and creation date"""
+    if product_id:
+        query = query.filter(product_id=product_id)
+
+    if start:
+        query = query.filter(created_at__gte=start)
+
+    if end:
+        query = query.filter(created_at__lt=end)
+
+    return query
+
+
+class StatsGranularity(graphene.Enum):
+    DAY = DAY
+    HOUR = HOUR
+
+
+class SalesType(graphene.ObjectType):
+    """Response with the sales of a business over a period"""
+    units = graphene.Int()
+    revenue = graphene.Decimal()
+    orders = graphene.Int()
+
+
+class SalesBucketType(SalesType):
+    """Response with the sales of a business in a day or an hour"""
+    bucket = graphene.DateTime()
+
+    def resolve_bucket(self, info):
+        # Daily buckets are dates, reported as the midnight they start at
+        return self['bucket'] if isinstance(self['bucket'], datetime) else datetime.combine(
+            self['bucket'], time.min, tzinfo=timezone.get_current_timezone()
+        )
+
+
+class ProductSalesType(SalesType):
+    """Response with the sales of a product over a period"""
+    product = graphene.Field(ProductType)
+
+
+class BusinessStatsType(graphene.ObjectType):
+    """Response with the sales dashboard of a business"""
+    totals = graphene.Field(SalesType)
+    series = graphene.List(SalesBucketType)
+    products = graphene.List(ProductSalesType)
+
+    def resolve_products(self, info):
+        products = Product.objects.in_bulk([row['product_id'] for row in self['products']])
+        return [{**row, 'product': products.get(row['product_id'])} for row in self['products']]
+
+
+# Hourly series longer than this are better served by the daily rollups
+MAX_HOURLY_RANGE = timedelta(days=31)
+
+
+def select_from_snapshot(snapshot, query, min_price=None, max_price=None, category=None, business=None,
+                         min_rating=None, sort_by=None, is_asc=False, **kwargs):
+    """Filter and sort products over the catalog snapshot, only the rows of a page are read from the database"""
+    category_ids = business_ids = None
+
+    if category:
+        category_ids = list(Category.objects.filter(subtree_filter(category)).values_list('id', flat=True))
+
+    if business:
+        business_ids = list(Business.objects.filter(
+            name__icontains=business, deleted_at__isnull=True
+        ).values_list('id', flat=True))
+
+    ids = snapshot.select(
+        min_price=min_price or None, max_price=max_price or None,
+        category_ids=category_ids, business_ids=business_ids, min_rating=min_rating or None,
+        # Without sort_by the listing is newest first, like Product.Meta.ordering
+        sort_by=sort_by or 'created_at', descending=not (sort_by and is_asc)
+    )
+
+    return SnapshotResult(ids, query)
+
+
 class Query(graphene.ObjectType):
     categories = graphene.List(
         CategoryType,
-        name=graphene.String(),
+        name=graphene.String(), parent_id=graphene.ID(),
         description='Response data about existing categories'
     )
     products = graphene.Field(
-        paginate(ProductType), search=graphene.String(),
+        ProductsPaginatedType, page=graphene.Int(), search=graphene.String(),
         min_price=graphene.Decimal(), max_price=graphene.Float(),
         category=graphene.String(), business=graphene.String(),
-        sort_by=graphene.String(), is_asc=graphene.Boolean(),
+        min_rating=graphene.Float(),
+        sort_by=graphene.String(description='A product field, or TRENDING or POPULAR'), is_asc=graphene.Boolean(),
         description='Response data paginated about existing products'
     )
     product = graphene.Field(
         ProductType, id=graphene.ID(required=True),
         description='Response data about existing product'
     )
+    product_cards = graphene.Field(
+        ProductCardsType, first=graphene.Int(), after=graphene.String(), sort=CardSort(),
+        category_id=graphene.ID(), business_id=graphene.ID(), in_stock=graphene.Boolean(),
+        description='Response data with cursor pagination about the products as listing cards'
+    )
+    related_products = graphene.List(
+        ProductType, product_id=graphene.ID(required=True), limit=graphene.Int(default_value=10),
+        description='Response data about the products frequently bought with a product'
+    )
+    reviews = graphene.Field(
+        ProductReviewsType, product_id=graphene.ID(required=True),
+        first=graphene.Int(), after=graphene.String(),
+        sort=ReviewSort(), min_rate=graphene.Int(),
+        description='Response data with cursor pagination about the reviews of a product'
+    )
     carts = graphene.List(
         CartType, name=graphene.String(),
         description='Response data about existing products in user cart'
     )
     request_carts = graphene.List(
         RequestCartType, name=graphene.String(),
-        description='Response data about existing products in payment cart'
+        description='Response data about existing products in payment cart',
+        deprecation_reason='Use businessOrders'
+    )
+    my_orders = graphene.Field(
+        OrdersType, first=graphene.Int(), after=graphene.String(),
+        product_id=graphene.ID(), start=graphene.DateTime(name='from'), end=graphene.DateTime(name='to'),
+        description='Response data with cursor pagination about the paid products of the user'
+    )
+    business_orders = graphene.Field(
+        OrdersType, first=graphene.Int(), after=graphene.String(),
+        product_id=graphene.ID(), start=graphene.DateTime(name='from'), end=graphene.DateTime(name='to'),
+        description='Response data with cursor pagination about the products paid to the business of the user'
+    )
+    product_import = graphene.Field(
+        ProductImportType, id=graphene.ID(required=True),
+        description='Response data about the progress and errors of a product import'
+    )
+    business_stats = graphene.Field(
+        BusinessStatsType, start=graphene.DateTime(required=True, name='from'),
+        end=graphene.DateTime(required=True, name='to'),
+        granularity=StatsGranularity(default_value=DAY), top=graphene.Int(default_value=10),
+        description='Response data about the sales of the business of the user'
     )
 
-    def resolve_categories(self, info, name):
-        query = Category.objects.prefetch_related('product_categories')
+    def resolve_categories(self, info, name=None, parent_id=None):
+        # Menus only need the names and the counts kept on every category
+        query = Category.objects.all()
+
+        if parent_id:
+            query = query.filter(parent_id=parent_id)
 
         if name:
             query = query.filter(Q(name__icontains=name) | Q(name__iexact=name)).distinct()
@@ -111,10 +348,57 @@ class Query(graphene.ObjectType):
 
         return query
 
+    @is_authenticated
+    def resolve_my_orders(self, info, first=None, after=None, **kwargs):
+        query = RequestCart.objects.select_related('product', 'business').filter(user_id=info.context.user.id)
+
+        return resolve_keyset(filter_orders(query, **kwargs), ORDER_ORDERING, first, after)
+
+    @is_authenticated
+    def resolve_business_orders(self, info, first=None, after=None, **kwargs):
+        try:
+            business_id = info.context.user.user_business.id
+        except Exception:
+            raise Exception("User doesn't have a business card")
+
+        query = RequestCart.objects.select_related('user', 'product').filter(business_id=business_id)
+
+        return resolve_keyset(filter_orders(query, **kwargs), ORDER_ORDERING, first, after)
+
+    @is_authenticated
+    def resolve_product_import(self, info, id):
+        try:
+            return ProductImport.objects.get(id=id, business__user_id=info.context.user.id)
+        except ProductImport.DoesNotExist:
+            raise Exception("Product import with id doesn't exist")
+
+    @is_authenticated
+    def resolve_business_stats(self, info, start, end, granularity=DAY, top=10):
+        try:
+            business_id = info.context.user.user_business.id
+        except Exception:
+            raise Exception("User doesn't have a business card")
+
+        if start > end:
+            raise Exception("The start of the period must be before its end")
+
+        if granularity == HOUR and end - start > MAX_HOURLY_RANGE:
+            raise Exception(f"Hourly stats are limited to {MAX_HOURLY_RANGE.days} days")
+
+        stats = sales_stats(business_id, start, end, granularity)
+        stats['products'] = stats['products'][:min(max(top, 0), settings.GRAPHENE['MAX_PAGE_SIZE'])]
+
+        return stats
+
     def resolve_products(self, info, **kwargs):
-        query = Product.objects.select_related('category', 'business').prefetch_related(
-            'product_images', 'product_comments', 'products_wished', 'product_cart', 'product_request'
-        )
+        # Cards only show the cover, joined instead of prefetching every image
+        query = Product.objects.visible().select_related(
+            'category', 'business', 'cover_image__image'
+        ).prefetch_related('products_wished', 'product_cart', 'product_request')
+
+        snapshot = None if kwargs.get('search') else current_snapshot()
+        if snapshot and (kwargs.get('sort_by') or 'created_at') in SNAPSHOT_SORT_COLUMNS:
+            return select_from_snapshot(snapshot, query, **kwargs)
 
         if kwargs.get('search', None):
             qs = kwargs['search']
@@ -125,26 +409,26 @@ class Query(graphene.ObjectType):
             query = query.filter(search_data)
 
         if kwargs.get('min_price', None):
-            qs = kwargs['min_price']
-
-            query.filter(Q(price__qt=qs) | Q(price=qs)).distinct()
+            query = query.filter(price__gte=kwargs['min_price'])
 
         if kwargs.get('max_price', None):
-            qs = kwargs['max_price']
-
-            query.filter(Q(price__lt=qs) | Q(price=qs)).distinct()
+            query = query.filter(price__lte=kwargs['max_price'])
 
         if kwargs.get('category', None):
-            qs = kwargs['category']
-
-            query.filter(Q(product__name__icontains=qs) | Q(category__name__iexct=qs)).distinct()
+            # The matching categories and everything under them
+            query = query.filter(subtree_filter(kwargs['category'], prefix='category__'))
 
         if kwargs.get('business', None):
-            qs = kwargs['business']
+            query = query.filter(business__name__icontains=kwargs['business'])
 
-            query.filter(Q(bussiness__name__icontains=qs) | Q(bussiness__name__iexct=qs)).distinct()
+        if kwargs.get('min_rating', None):
+            query = query.filter(rating_avg__gte=kwargs['min_rating'])
 
-        if kwargs.get('sort_by', None):
+        if kwargs.get('sort_by', None) in POPULARITY_SORT_FIELDS:
+            direction = '' if kwargs.get('is_asc', False) else '-'
+            # Most products share a score of 0, the id keeps the pages stable
+            query = query.order_by(f"{direction}{POPULARITY_SORT_FIELDS[kwargs['sort_by']]}", f'{direction}id')
+        elif kwargs.get('sort_by', None):
             qs = kwargs['sort_by']
 
             is_asc = kwargs.get('is_asc', False)
@@ -157,12 +441,59 @@ class Query(graphene.ObjectType):
         return query
 
     def resolve_product(self, info, id):
-        query = Product.objects.select_related('category', 'business').prefetch_related(
-            'product_images', 'product_comments', 'products_wished', 'product_cart', 'product_request'
-        ).get(id=id)
+        query = Product.objects.visible().select_related(
+            'category', 'business', 'cover_image__image'
+        ).prefetch_related('product_images', 'products_wished', 'product_cart', 'product_request').get(id=id)
+
+        record_activity(query.id, PopularityCounter.VIEW)
 
         return query
 
+    def resolve_product_cards(self, info, sort=None, category_id=None, business_id=None, in_stock=None, **kwargs):
+        query = ProductCard.objects.all()
+
+        if category_id:
+            query = query.filter(category_id=category_id)
+
+        if business_id:
+            query = query.filter(business_id=business_id)
+
+        if in_stock is not None:
+            query = query.filter(total_available__gt=0) if in_stock else query.filter(total_available=0)
+
+        return resolve_keyset(query, CARD_ORDERINGS[sort or CardSort.NEWEST.value], **kwargs)
+
+    def resolve_related_products(self, info, product_id, limit=10):
+        limit = min(max(limit, 0), settings.RELATED_PRODUCTS_TOP_K)
+
+        related = RelatedProduct.objects.select_related(
+            'related__category', 'related__business', 'related__cover_image__image'
+        ).filter(product_id=product_id, related__business__deleted_at__isnull=True).order_by('rank')[:limit]
+
+        return [row.related for row in related]
+
+    def resolve_reviews(self, info, product_id, sort=None, min_rate=None, **kwargs):
+        try:
+            product = Product.objects.visible().only('id', 'rating_avg').get(id=product_id)
+        except Product.DoesNotExist:
+            raise Exception("Product with product_id doesn't exist")
+
+        query = ProductComment.objects.select_related('user').filter(product_id=product_id)
+        histogram = ProductRating.objects.filter(product_id=product_id, count__gt=0).order_by('-rate')
+
+        if min_rate:
+            query = query.filter(rate__gte=min_rate)
+            histogram = histogram.filter(rate__gte=min_rate)
+
+        histogram = [RatingBucketType(rate=bucket.rate, count=bucket.count) for bucket in histogram]
+
+        return ProductReviewsType(
+            **resolve_keyset(query, REVIEW_ORDERINGS[sort or ReviewSort.NEWEST.value], **kwargs),
+            total=sum(bucket.count for bucket in histogram),
+            rating_avg=product.rating_avg,
+            histogram=histogram
+        )
+
 
 class CreateBusiness(graphene.Mutation):
     """Create a business card"""
@@ -199,12 +530,22 @@ class UpdateBusiness(graphene.Mutation):
 
 
 class DeleteBusiness(graphene.Mutation):
-    """Delete a business card"""
+    """Delete a business card, it is hidden at once and its products are deleted by a background job"""
     status = graphene.Boolean()
 
     @is_authenticated
     def mutate(self, info):
-        Business.objects.filter(user_id=info.context.user.id).delete()
+        with transaction.atomic():
+            business = Business.objects.select_for_update().filter(user_id=info.context.user.id).first()
+
+            if business:
+                # Hidden and out of the owner's hands right away, the job only removes the rows
+                business.user = None
+                business.deleted_at = timezone.now()
+                business.save(update_fields=('user', 'deleted_at', 'updated_at'))
+                ProductCard.objects.filter(business_id=business.id).delete()
+
+                enqueue(delete_business, {'business_id': business.id}, key=f'delete_business:{business.id}')
 
         return DeleteBusiness(
             status=True
@@ -220,7 +561,7 @@ class ProductInput(graphene.InputObjectType):
 
 class ProductImageInput(graphene.InputObjectType):
     image_id = graphene.ID(required=True)
-    is_cover = graphene.Boolean
+    is_cover = graphene.Boolean()
 
 
 class CreateProduct(graphene.Mutation):
@@ -244,19 +585,56 @@ class CreateProduct(graphene.Mutation):
         if existing_product:
             raise Exception("You already have a product with this name")
 
-        product_data['total_available'] = product_data['total_count']
+        if sum(1 for image in images if image.get('is_cover')) > 1:
+            raise Exception("A product can have only one cover image")
 
-        product = Product.objects.create(**product_data, **kwargs)
+        product_data['total_available'] = kwargs['total_count']
 
-        ProductImage.objects.bulk_create([
-            ProductImage(product_id=product.id, **image) for image in images
-        ])
+        with transaction.atomic():
+            product = Product.objects.create(business_id=business_id, **product_data, **kwargs)
+
+            product_images = ProductImage.objects.bulk_create([
+                ProductImage(product_id=product.id, **image) for image in images
+            ])
+
+            product.cover_image = next((image for image in product_images if image.is_cover), None)
+            if product.cover_image:
+                product.save(update_fields=('cover_image', ))
 
         return CreateProduct(
             product=product
         )
 
 
+class ImportProducts(graphene.Mutation):
+    """Import products from a CSV or NDJSON file, it is processed in the background and the progress can be polled"""
+    product_import = graphene.Field(ProductImportType)
+
+    class Arguments:
+        file = Upload(required=True)
+        format = graphene.String()
+        update_existing = graphene.Boolean()
+
+    @is_authenticated
+    def mutate(self, info, file, format=None, update_existing=False):
+        try:
+            business_id = info.context.user.user_business.id
+        except Exception:
+            raise Exception("User doesn't have a business card")
+
+        format = format or file.name.rsplit('.', 1)[-1].lower()
+        if format not in dict(ProductImport.FORMAT_CHOICES):
+            raise Exception(f"Unsupported format, use one of {', '.join(dict(ProductImport.FORMAT_CHOICES))}")
+
+        product_import = ProductImport.objects.create(
+            business_id=business_id, file=file, format=format, update_existing=update_existing
+        )
+
+        enqueue(import_products, {'import_id': product_import.id}, key=f'import_products:{product_import.id}')
+
+        return ImportProducts(product_import=product_import)
+
+
 class UpdateProduct(graphene.Mutation):
     """Update a product"""
     product = graphene.Field(ProductType)
@@ -279,10 +657,39 @@ class UpdateProduct(graphene.Mutation):
                 raise Exception("You already have a product with this name")
 
         Product.objects.filter(id=product_id, business_id=business_id).update(**product_data, **kwargs)
+        mark_dirty([product_id])
         
         return UpdateProduct(product=Product.objects.get(id=product_id))
 
 
+class BulkProductInput(graphene.InputObjectType):
+    product_id = graphene.ID(required=True)
+    price = graphene.Decimal()
+    total_available = graphene.Int()
+    delta = graphene.Int()
+
+
+class BulkUpdateProducts(graphene.Mutation):
+    """Update the price and stock of many products at once, returns the products that changed"""
+    products = graphene.List(ProductType)
+
+    class Arguments:
+        items = graphene.List(BulkProductInput, required=True)
+
+    @is_authenticated
+    def mutate(self, info, items):
+        try:
+            business_id = info.context.user.user_business.id
+        except Exception:
+            raise Exception("User doesn't have a business card")
+
+        changed = bulk_update_products(business_id, items)
+
+        return BulkUpdateProducts(
+            products=Product.objects.select_related('category', 'business').filter(id__in=changed).order_by('id')
+        )
+
+
 class DeleteProduct(graphene.Mutation):
     """Update a product"""
     status = graphene.Boolean()
@@ -312,15 +719,22 @@ class UpdateProductImage(graphene.Mutation):
         except Exception:
             raise Exception("You don't have a business card, access denied")
 
-        image = ProductImage.objects.filter(id=id, product__business_id=business_id)
+        image = ProductImage.objects.filter(id=id, product__business_id=business_id).first()
 
         if not image:
             raise Exception("You don't own this product")
-        
-        image.update(**image_data)
 
-        if image_data.get('is_cover', False):
-            ProductImage.objects.filter(product__business_id=business_id).exclude(id=id).update(is_cover=False)
+        is_cover = image_data.pop('is_cover', None)
+
+        with transaction.atomic():
+            if image_data:
+                ProductImage.objects.filter(id=id).update(**image_data)
+                mark_dirty([image.product_id])
+
+            if is_cover:
+                set_cover(image.product_id, image.id)
+            elif is_cover is not None:
+                unset_cover(image.product_id, image.id)
 
         return UpdateProductImage(
             image = ProductImage.objects.get(id=id)
@@ -349,9 +763,21 @@ class CreateProductComment(graphene.Mutation):
             if own_product:
                 raise Exception("You can't commit on you product")
 
-        ProductComment.objects.filter(user=info.context.user.id, product_id=product_id).delete()
+        if kwargs.get('rate') is not None and not MIN_RATE <= kwargs['rate'] <= MAX_RATE:
+            raise Exception(f"Rate must be between {MIN_RATE} and {MAX_RATE}")
+
+        with transaction.atomic():
+            previous = ProductComment.objects.select_for_update().filter(
+                user_id=info.context.user.id, product_id=product_id
+            )
+            removed = [comment.rate for comment in previous]
+            previous.delete()
+
+            product_comment = ProductComment.objects.create(
+                product_id=product_id, user_id=info.context.user.id, **kwargs
+            )
 
-        product_comment = ProductComment.objects.create(product_id=product_id, **kwargs)
+            apply_rating_change(product_id, added=[product_comment.rate], removed=removed)
 
         return CreateProductComment(product_comment=product_comment)
 
@@ -366,26 +792,14 @@ class WishList(graphene.Mutation):
 
     @is_authenticated
     def mutate(self, info, product_id, is_check=False):
-        try:
-            product = Product.objects.get(id=product_id)
-        except Exception:
-            raise Exception("Product with product_id doesn't exist")
+        user_id = info.context.user.id
 
-        try:
-            user_wish = info.context.user.user_wish
-        except Exception:
-            user_wish = Wish.objects.create(user_id=info.context.user.id)
+        if is_check:
+            return WishList(status=int(product_id) in wished_product_ids(user_id))
 
-        product_exists = user_wish.products.filter(id=product_id)
-
-        if product_exists:
-            if is_check:
-                return WishList(status=True)
-            user_wish.products.remove(product)
-        else:
-            if is_check:
-                return WishList(status=False)
-            user_wish.products.add()
+        if not remove_from_wishlist(user_id, product_id):
+            add_to_wishlist(user_id, product_id)
+            record_activity(product_id, PopularityCounter.WISH)
 
         return WishList(status=True)
 
@@ -400,9 +814,13 @@ class CreateCartItem(graphene.Mutation):
 
     @is_authenticated
     def mutate(self, info, product_id, **kwargs):
+        if not Product.objects.visible().filter(id=product_id).exists():
+            raise Exception("Product with product_id doesn't exist")
+
         Cart.objects.filter(product_id=product_id, user_id=info.context.user.id).delete()
 
         cart_item = Cart.objects.create(product_id=product_id, user_id=info.context.user.id, **kwargs)
+        record_activity(product_id, PopularityCounter.CART)
 
         return CreateCartItem(
             cart_item=cart_item
@@ -448,19 +866,28 @@ class CompletePayment(graphene.Mutation):
 
     @is_authenticated
     def mutate(self, info):
-        user_carts = Cart.objects.filter(user_id=info.context.user.id)
+        # Products of a deleted business can't be bought anymore, their cart items go with them
+        user_carts = Cart.objects.select_related('product').filter(
+            user_id=info.context.user.id, product__business__deleted_at__isnull=True
+        )
+
+        with transaction.atomic():
+            request_carts = RequestCart.objects.bulk_create([
+                RequestCart(
+                    user_id=info.context.user.id,
+                    business_id=cart_item.product.business_id,
+                    product_id=cart_item.product.id,
+                    quantity=cart_item.quantity,
+                    price=cart_item.quantity * cart_item.product.price
+                ) for cart_item in user_carts
+            ])
 
-        RequestCart.objects.bulk_create([
-            RequestCart(
-                user_id=info.context.user.id,
-                business_id=cart_item.product.business.id,
-                product_id=cart_item.product.id,
-                quantity=cart_item.quantity,
-                price=cart_item.quantity * cart_item.product.price
-            ) for cart_item in user_carts
-        ])
+            # The rollups are written by a job, committed with the payment
+            enqueue(record_sales, {'request_cart_ids': [request_cart.id for request_cart in request_carts]})
+            user_carts.delete()
 
-        user_carts.delete()
+        for request_cart in request_carts:
+            record_activity(request_cart.product_id, PopularityCounter.PURCHASE)
 
         return CompletePayment(
             status=True
@@ -472,7 +899,9 @@ class Mutation(graphene.ObjectType):
     update_business = UpdateBusiness.Field()
     delete_business = DeleteBusiness.Field()
     create_product = CreateProduct.Field()
+    import_products = ImportProducts.Field()
     update_product = UpdateProduct.Field()
+    bulk_update_products = BulkUpdateProducts.Field()
     delete_product = DeleteProduct.Field()
     update_product_image = UpdateProductImage.Field()
     create_product_comment = CreateProductComment.Field()
@@ -0,0 +1,85 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from user.models import ImageUpload
+from .cards import mark_dirty, rename_business, rename_category
+from .categories import ancestor_ids, check_parent, mark_dirty as mark_categories_dirty, place_category
+from .models import Business, Category, Product, ProductComment, ProductImage, Wish
+from .wishlist import invalidate as invalidate_wishlists
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        mark_dirty([instance.id])
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    # The card is deleted with the product, the category is the only thing left to refresh
+    mark_categories_dirty([instance.category_id])
+
+
+@receiver((post_save, post_delete), sender=ProductImage)
+def product_image_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        mark_dirty([instance.product_id])
+
+
+@receiver((post_save, post_delete), sender=ProductComment)
+def product_comment_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        mark_dirty([instance.product_id])
+
+
+@receiver(post_save, sender=ImageUpload)
+def image_upload_saved(sender, instance, raw=False, created=False, **kwargs):
+    # A new image can't be a cover yet
+    if not raw and not created:
+        mark_dirty(Product.objects.filter(cover_image__image_id=instance.id).values_list('id', flat=True))
+
+
+@receiver(post_save, sender=Business)
+def business_saved(sender, instance, raw=False, created=False, **kwargs):
+    if not raw and not created:
+        rename_business(instance.id, instance.name)
+
+
+@receiver(pre_save, sender=Category)
+def category_saving(sender, instance, raw=False, **kwargs):
+    if not raw:
+        check_parent(instance)
+
+
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, raw=False, created=False, **kwargs):
+    if raw:
+        return
+
+    place_category(instance)
+
+    if not created:
+        rename_category(instance.id, instance.name)
+
+
+@receiver(post_delete, sender=Category)
+def category_deleted(sender, instance, **kwargs):
+    # Subcategories are deleted with it, their products only leave the totals of the ancestors
+    mark_categories_dirty(ancestor_ids(instance.path)[:-1])
+
+
+@receiver(m2m_changed, sender=Wish.products.through)
+def wish_products_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+
+    if not reverse:
+        invalidate_wishlists([instance.user_id])
+    else:
+        wishes = Wish.objects.filter(id__in=pk_set) if pk_set else instance.products_wished.all()
+        invalidate_wishlists(wishes.values_list('user_id', flat=True))
+
+
+@receiver(post_delete, sender=Wish)
+def wish_deleted(sender, instance, **kwargs):
+    invalidate_wishlists([instance.user_id])
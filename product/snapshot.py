@@ -0,0 +1,235 @@
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.db.models import Count, Max
+from django.utils import timezone
+
+try:
+    import numpy as np
+except ImportError:  # The snapshot is an optimization, listings fall back to SQL without it
+    np = None
+
+CURRENT = 'CURRENT'
+
+# Column, dtype and how a product card value is stored in it
+COLUMNS = {
+    'id': 'int64',
+    'price': 'int64',             # cents
+    'category_id': 'int64',
+    'business_id': 'int64',
+    'total_available': 'int32',
+    'rating_avg': 'int16',        # hundredths
+    'created_at': 'int64',        # microseconds since the epoch
+}
+
+# Product fields a listing can be sorted by and the column holding them
+SORT_COLUMNS = {
+    'id': 'id',
+    'price': 'price',
+    'total_available': 'total_available',
+    'rating_avg': 'rating_avg',
+    'created_at': 'created_at',
+}
+
+_loaded = None
+_checked_at = 0
+_confirmed_at = 0
+_lock = threading.Lock()
+
+
+def available():
+    return np is not None and settings.CATALOG_SNAPSHOT
+
+
+def _to_row(card):
+    product_id, price, category_id, business_id, total_available, rating_avg, created_at = card
+    return (
+        product_id, int(price * 100), category_id, business_id, total_available,
+        int(rating_avg * 100), int(created_at.timestamp() * 1_000_000)
+    )
+
+
+def build_snapshot(directory=None, chunk_size=10000):
+    """Write a new snapshot version from the product cards and point CURRENT to it, returns its path"""
+    from .models import ProductCard
+
+    directory = directory or settings.CATALOG_SNAPSHOT_DIR
+    os.makedirs(directory, exist_ok=True)
+
+    built_at = timezone.now()
+    cards = ProductCard.objects.order_by('product_id').values_list(
+        'product_id', 'price', 'category_id', 'business_id', 'total_available', 'rating_avg', 'created_at'
+    )
+
+    # Sized from a count, cards created meanwhile are picked up by the next build
+    capacity = cards.count()
+    columns = {name: np.empty(capacity, dtype=dtype) for name, dtype in COLUMNS.items()}
+    size = 0
+
+    def fill(rows):
+        block = np.array(rows[:capacity - size], dtype='int64').reshape(-1, len(COLUMNS))
+        for index, name in enumerate(COLUMNS):
+            columns[name][size:size + len(block)] = block[:, index]
+        return len(block)
+
+    rows = []
+    for card in cards.iterator(chunk_size=chunk_size):
+        rows.append(_to_row(card))
+        if len(rows) == chunk_size:
+            size += fill(rows)
+            rows = []
+    if rows:
+        size += fill(rows)
+
+    version = f'{built_at:%Y%m%d%H%M%S}-{uuid.uuid4().hex[:8]}'
+    staging = os.path.join(directory, f'.{version}')
+    os.makedirs(staging)
+
+    for name, values in columns.items():
+        np.save(os.path.join(staging, f'{name}.npy'), values[:size])
+
+    with open(os.path.join(staging, 'meta.json'), 'w') as meta:
+        json.dump({'version': version, 'size': size, 'built_at': built_at.timestamp()}, meta)
+
+    os.rename(staging, os.path.join(directory, version))
+
+    # Readers only ever see a complete version
+    pointer = os.path.join(directory, f'.{CURRENT}.{version}')
+    with open(pointer, 'w') as current:
+        current.write(version)
+    os.replace(pointer, os.path.join(directory, CURRENT))
+
+    prune_versions(directory, keep=version)
+
+    return os.path.join(directory, version)
+
+
+def confirm_current(directory=None):
+    """Tell the readers the current version still matches the database, by touching CURRENT"""
+    os.utime(os.path.join(directory or settings.CATALOG_SNAPSHOT_DIR, CURRENT))
+
+
+def prune_versions(directory, keep, retain=2):
+    """Delete old versions, workers still mapping one keep reading it until they switch"""
+    versions = sorted(
+        name for name in os.listdir(directory)
+        if not name.startswith('.') and name != CURRENT and name != keep
+    )
+    for name in versions[:max(len(versions) - retain, 0)]:
+        shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+
+class Snapshot:
+    """Read-only memory-mapped columns of one version, shared by every process through the page cache"""
+
+    def __init__(self, path):
+        with open(os.path.join(path, 'meta.json')) as meta:
+            self.meta = json.load(meta)
+
+        self.version = self.meta['version']
+        self.built_at = self.meta['built_at']
+        self.columns = {name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r') for name in COLUMNS}
+
+    def __len__(self):
+        return self.meta['size']
+
+    def select(self, min_price=None, max_price=None, category_ids=None, business_ids=None,
+               min_rating=None, sort_by='created_at', descending=True):
+        """Ids of the products matching the filters, in the requested order"""
+        columns = self.columns
+        mask = np.ones(len(self), dtype=bool)
+
+        if min_price is not None:
+            mask &= columns['price'] >= round(min_price * 100)
+
+        if max_price is not None:
+            mask &= columns['price'] <= round(max_price * 100)
+
+        if category_ids is not None:
+            mask &= np.isin(columns['category_id'], category_ids)
+
+        if business_ids is not None:
+            mask &= np.isin(columns['business_id'], business_ids)
+
+        if min_rating is not None:
+            mask &= columns['rating_avg'] >= round(min_rating * 100)
+
+        ids = columns['id'][mask]
+        keys = columns[SORT_COLUMNS[sort_by]][mask]
+
+        # lexsort sorts by the last key first, the id breaks ties
+        order = np.lexsort((ids, keys))
+        if descending:
+            order = order[::-1]
+
+        return ids[order]
+
+
+def current_snapshot():
+    """The snapshot CURRENT points to, reloaded when it changes, or None without a usable one"""
+    global _loaded, _checked_at, _confirmed_at
+
+    if not available():
+        return None
+
+    now = time.monotonic()
+    if _loaded is not None and now - _checked_at < settings.CATALOG_SNAPSHOT_CHECK_INTERVAL:
+        return _usable(_loaded)
+
+    with _lock:
+        _checked_at = now
+        try:
+            pointer = os.path.join(settings.CATALOG_SNAPSHOT_DIR, CURRENT)
+            _confirmed_at = os.stat(pointer).st_mtime
+            with open(pointer) as current:
+                version = current.read().strip()
+
+            if _loaded is None or _loaded.version != version:
+                _loaded = Snapshot(os.path.join(settings.CATALOG_SNAPSHOT_DIR, version))
+        except (OSError, ValueError):
+            _loaded = None
+
+    return _usable(_loaded)
+
+
+def _usable(snapshot):
+    # Without a builder confirming it, a snapshot drifts from the database
+    if snapshot is None or time.time() - _confirmed_at > settings.CATALOG_SNAPSHOT_MAX_AGE:
+        return None
+    return snapshot
+
+
+class SnapshotResult:
+    """Lazy list of products over snapshot ids, only the rows of the requested page are fetched"""
+
+    def __init__(self, ids, query):
+        self.ids = ids
+        self.query = query
+
+    def count(self):
+        return len(self.ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            ids = [int(product_id) for product_id in self.ids[index]]
+            products = self.query.in_bulk(ids)
+            # Products deleted since the snapshot was built are skipped
+            return [products[product_id] for product_id in ids if product_id in products]
+
+        return self[index:index + 1][0]
+
+
+def signature():
+    """Changes whenever a product card is written or deleted"""
+    from .models import ProductCard
+
+    stats = ProductCard.objects.aggregate(count=Count('product_id'), refreshed_at=Max('refreshed_at'))
+    return stats['count'], stats['refreshed_at']
@@ -0,0 +1,56 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from jobs.queue import task
+from . import popularity, recommendations, rollups
+from .importing import process_import
+from .models import Business, Product, ProductImport, RequestCart
+
+# Products deleted per transaction when a business is deleted
+DELETE_BATCH_SIZE = 500
+
+
+@task(atomic=True)
+def record_sales(request_cart_ids):
+    """Add the request carts of a payment to the sales rollups"""
+    rollups.record_sales(list(RequestCart.objects.filter(id__in=request_cart_ids)))
+
+
+@task
+def import_products(import_id):
+    """Run an uploaded product import"""
+    # Left processing by a worker that died, running it again would report its written rows as duplicates
+    ProductImport.objects.filter(
+        id=import_id, status=ProductImport.PROCESSING,
+        updated_at__lt=timezone.now() - timedelta(seconds=settings.JOBS_LOCK_TIMEOUT)
+    ).update(status=ProductImport.FAILED, error='The worker running the import stopped', updated_at=timezone.now())
+
+    process_import(import_id)
+
+
+@task
+def delete_business(business_id):
+    """Remove a deleted business, its products first in batches so no transaction locks the whole catalog"""
+    products = Product.objects.filter(business_id=business_id).order_by('id').values_list('id', flat=True)
+
+    while True:
+        with transaction.atomic():
+            batch = list(products[:DELETE_BATCH_SIZE])
+            if not batch:
+                break
+            Product.objects.filter(id__in=batch).delete()
+
+    Business.objects.filter(id=business_id).delete()
+
+
+@task
+def refresh_popularity():
+    popularity.refresh_popularity()
+
+
+@task
+def build_related_products():
+    recommendations.build_related_products()
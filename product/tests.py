@@ -1,3 +1,342 @@
-from django.test import TestCase
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from backend.authentication import TokenManager
+from backend.middlewares import ReplicaPinningMiddleware
+from backend.permissions import resolve_keyset
+from backend.routers import PrimaryReplicaRouter, begin_request, end_request
+from jobs.models import Job
+from user.models import ImageUpload, User
+from .cards import refresh_cards
+from .covers import set_cover
+from .models import (
+    Business, Category, Product, ProductCard, ProductComment, ProductImage, ProductImport, RequestCart, Wish
+)
+from .schema import REVIEW_ORDERINGS
+from .tasks import delete_business, import_products
+from .wishlist import add_to_wishlist, wished_product_ids
+
+
+class CatalogTestCase(TestCase):
+    """A seller with one product"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user(
+            email='seller@example.com', password='x', first_name='Seller', last_name='S'
+        )
+        cls.buyer = User.objects.create_user(
+            email='buyer@example.com', password='x', first_name='Buyer', last_name='B'
+        )
+        cls.business = Business.objects.create(user=cls.seller, name='Shop')
+        cls.category = Category.objects.create(name='Phones')
+        cls.product = Product.objects.create(
+            business=cls.business, category=cls.category, name='Phone', price=Decimal('10.00'),
+            total_available=5, total_count=5, description='A phone'
+        )
+
+    @staticmethod
+    def auth(user):
+        return {'HTTP_AUTHORIZATION': 'JWT ' + TokenManager.get_access_token({'user_id': str(user.id)})}
+
+    def graphql(self, query, user=None, **variables):
+        headers = self.auth(user) if user else {}
+
+        with override_settings(RATE_LIMIT=False):
+            response = self.client.post(
+                '/graphview/', {'query': query, 'variables': variables}, content_type='application/json', **headers
+            )
+
+        return response.json()
+
+
+class WishlistCacheTests(CatalogTestCase):
+    def setUp(self):
+        add_to_wishlist(self.buyer.id, self.product.id)
+        cache.clear()
+
+    @override_settings(DATABASE_REPLICAS=['replica_1'])
+    def test_cache_miss_keeps_reading_from_the_replica(self):
+        token = begin_request()
+        self.assertEqual(wished_product_ids(self.buyer.id), {self.product.id})
+        # The reads of a TestCase stay in its transaction, outside of one they'd go to the replica
+        with mock.patch.object(connections[DEFAULT_DB_ALIAS], 'in_atomic_block', False):
+            alias = PrimaryReplicaRouter().db_for_read(Wish)
+        state = end_request(token)
+
+        self.assertEqual(alias, 'replica_1')
+        self.assertFalse(state.wrote)
+
+    # The test database stands in for the replica
+    @override_settings(DATABASE_REPLICAS=['default'])
+    def test_query_with_a_cache_miss_sets_no_pin_cookie(self):
+        with override_settings(RATE_LIMIT=False):
+            response = self.client.post(
+                '/graphview/', {'query': '{ products { result { id isWished } } }'},
+                content_type='application/json', **self.auth(self.buyer)
+            )
+
+        self.assertEqual(
+            response.json()['data']['products']['result'], [{'id': str(self.product.id), 'isWished': True}]
+        )
+        self.assertIsNotNone(cache.get(f'wishlist:{self.buyer.id}'))
+        self.assertNotIn(ReplicaPinningMiddleware.cookie_name, response.cookies)
+
+
+class KeysetTests(CatalogTestCase):
+    def setUp(self):
+        # Three reviews, the first two written within the same millisecond
+        moment = timezone.now().replace(microsecond=123000)
+        self.reviews = [
+            ProductComment.objects.create(product=self.product, user=self.buyer, comment=str(number), rate=3)
+            for number in range(3)
+        ]
+        for review, created_at in zip(self.reviews, (
+            moment + timedelta(microseconds=100), moment + timedelta(microseconds=400), moment + timedelta(seconds=1)
+        )):
+            ProductComment.objects.filter(id=review.id).update(created_at=created_at)
+
+    def page_through(self, ordering):
+        query = ProductComment.objects.filter(product=self.product)
+        ids, after = [], None
+
+        # A cursor repeating a row would page forever
+        for _ in range(query.count() + 1):
+            page = resolve_keyset(query, ordering, first=1, after=after)
+            ids.extend(review.id for review in page['result'])
+            if not page['has_next']:
+                break
+            after = page['end_cursor']
+
+        return ids
+
+    def test_newest_first_keeps_rows_of_the_same_millisecond(self):
+        self.assertEqual(self.page_through(REVIEW_ORDERINGS['newest']), [review.id for review in self.reviews[::-1]])
+
+    def test_oldest_first_doesnt_repeat_rows_of_the_same_millisecond(self):
+        self.assertEqual(self.page_through(REVIEW_ORDERINGS['oldest']), [review.id for review in self.reviews])
+
+    def test_first_must_be_positive(self):
+        for first in (0, -1):
+            with self.assertRaisesMessage(Exception, 'first must be greater than 0'):
+                resolve_keyset(ProductComment.objects.all(), REVIEW_ORDERINGS['newest'], first=first)
+
+    def test_invalid_cursor(self):
+        with self.assertRaisesMessage(Exception, 'Invalid cursor'):
+            resolve_keyset(ProductComment.objects.all(), REVIEW_ORDERINGS['newest'], after='nonsense')
+
+
+class OrdersTests(CatalogTestCase):
+    QUERY = 'query ($after: String) { %s(first: 2, after: $after) { endCursor hasNext result { id } } }'
+
+    def setUp(self):
+        # The rows of one payment are written within the same millisecond
+        moment = timezone.now().replace(microsecond=500000)
+        self.orders = RequestCart.objects.bulk_create([
+            RequestCart(user=self.buyer, business=self.business, product=self.product, quantity=1, price=10)
+            for _ in range(5)
+        ])
+        for number, order in enumerate(self.orders):
+            RequestCart.objects.filter(id=order.id).update(created_at=moment + timedelta(microseconds=number * 100))
+
+    def page_through(self, field, user):
+        ids, after = [], None
+
+        for _ in range(len(self.orders) + 1):
+            data = self.graphql(self.QUERY % field, user=user, after=after)['data'][field]
+            ids.extend(int(order['id']) for order in data['result'])
+            if not data['hasNext']:
+                break
+            after = data['endCursor']
+
+        return ids
+
+    def test_my_orders_pages_through_one_payment(self):
+        self.assertEqual(self.page_through('myOrders', self.buyer), [order.id for order in self.orders[::-1]])
+
+    def test_business_orders_pages_through_one_payment(self):
+        self.assertEqual(
+            self.page_through('businessOrders', self.seller), [order.id for order in self.orders[::-1]]
+        )
+
+
+class ExportTests(CatalogTestCase):
+    def test_staff_export_of_a_business(self):
+        staff = User.objects.create_user(email='staff@example.com', password='x', first_name='S', last_name='S')
+        User.objects.filter(id=staff.id).update(is_staff=True)
+
+        response = self.client.get('/export/products/', {'business': self.business.id}, **self.auth(staff))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Phone', b''.join(response.streaming_content))
+
+        response = self.client.get('/export/products/', {'business': 'abc'}, **self.auth(staff))
+        self.assertEqual(response.status_code, 400)
+
+    def test_gzip_only_when_accepted(self):
+        for header, encoding in (
+            ('gzip', 'gzip'), ('*', 'gzip'), ('gzip;q=0', None), ('gzip;q=0, *', None), ('br', None)
+        ):
+            response = self.client.get('/export/products/', HTTP_ACCEPT_ENCODING=header, **self.auth(self.seller))
+            self.assertEqual(response.get('Content-Encoding'), encoding, header)
+
+
+class BulkUpdateTests(CatalogTestCase):
+    MUTATION = (
+        'mutation ($items: [BulkProductInput]!) '
+        '{ bulkUpdateProducts(items: $items) { products { id totalAvailable } } }'
+    )
+
+    def update(self, *items):
+        return self.graphql(self.MUTATION, user=self.seller, items=list(items))
+
+    def test_delta(self):
+        result = self.update({'productId': self.product.id, 'delta': -2})
+
+        self.assertEqual(result['data']['bulkUpdateProducts']['products'], [
+            {'id': str(self.product.id), 'totalAvailable': 3}
+        ])
+
+    def test_delta_below_zero_is_rejected(self):
+        other = Product.objects.create(
+            business=self.business, category=self.category, name='Case', price=Decimal('2.00'),
+            total_available=1, total_count=1, description='A case'
+        )
+
+        result = self.update({'productId': other.id, 'delta': 4}, {'productId': self.product.id, 'delta': -6})
+
+        self.assertEqual(result['errors'][0]['message'], f'Stock of products {self.product.id} would go below zero')
+        self.assertEqual(Product.objects.get(id=self.product.id).total_available, 5)
+        self.assertEqual(Product.objects.get(id=other.id).total_available, 1)
+
+    def test_invalid_product_id(self):
+        result = self.update({'productId': 'abc', 'delta': 1})
+
+        self.assertEqual(result['errors'][0]['message'], 'Invalid product id: abc')
+
+
+class CoverTests(CatalogTestCase):
+    def setUp(self):
+        self.images = [
+            ProductImage.objects.create(
+                product=self.product, image=ImageUpload.objects.create(image=f'images/{name}.png')
+            ) for name in ('front', 'back')
+        ]
+
+    def assertCover(self, image):
+        self.assertEqual(
+            list(ProductImage.objects.filter(product=self.product, is_cover=True).values_list('id', flat=True)),
+            [image.id]
+        )
+        self.assertEqual(Product.objects.get(id=self.product.id).cover_image_id, image.id)
+
+    def test_switch_cover_twice(self):
+        front, back = self.images
+
+        self.assertTrue(set_cover(self.product.id, front.id))
+        self.assertCover(front)
+
+        self.assertTrue(set_cover(self.product.id, back.id))
+        self.assertCover(back)
+
+        self.assertTrue(set_cover(self.product.id, front.id))
+        self.assertCover(front)
+
+    def test_image_of_another_product(self):
+        other = Product.objects.create(
+            business=self.business, category=self.category, name='Case', price=Decimal('2.00'),
+            total_available=1, total_count=1, description='A case'
+        )
+        set_cover(self.product.id, self.images[0].id)
+
+        self.assertFalse(set_cover(other.id, self.images[1].id))
+        self.assertCover(self.images[0])
+
+
+class ImportTests(CatalogTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        storage = mock.patch.object(
+            ProductImport._meta.get_field('file'), 'storage', FileSystemStorage(location=directory.name)
+        )
+        storage.start()
+        self.addCleanup(storage.stop)
+
+    def upload(self, content):
+        return ProductImport.objects.create(
+            business=self.business, file=SimpleUploadedFile('products.csv', content), format=ProductImport.CSV
+        )
+
+    def test_import_job(self):
+        product_import = self.upload(b'name,description,price,category,total_count\nCase,A case,2.50,Phones,3\n')
+
+        import_products(product_import.id)
+
+        product_import.refresh_from_db()
+        self.assertEqual((product_import.status, product_import.created_count), (ProductImport.DONE, 1))
+        self.assertTrue(Product.objects.filter(business=self.business, name='Case').exists())
+
+    def test_rows_with_a_bad_category_id_are_reported(self):
+        product_import = self.upload(
+            'name,description,price,category_id,total_count\n'
+            'Case,A case,2.50,\u00b2,3\n'
+            'Cover,A cover,1.00,{},1\n'.format(self.category.id).encode()
+        )
+
+        import_products(product_import.id)
+
+        product_import.refresh_from_db()
+        self.assertEqual((product_import.status, product_import.created_count), (ProductImport.DONE, 1))
+        self.assertEqual(product_import.errors, [{'row': 2, 'errors': {'category_id': 'Unknown category'}}])
+
+    def test_import_left_by_a_dead_worker_fails(self):
+        product_import = self.upload(b'name\n')
+        ProductImport.objects.filter(id=product_import.id).update(
+            status=ProductImport.PROCESSING, updated_at=timezone.now() - timedelta(days=1)
+        )
+
+        import_products(product_import.id)
+
+        product_import.refresh_from_db()
+        self.assertEqual(product_import.status, ProductImport.FAILED)
+
+
+class DeleteBusinessTests(CatalogTestCase):
+    MUTATION = 'mutation { deleteBusiness { status } }'
+
+    def test_business_is_hidden_before_the_job_runs(self):
+        refresh_cards([self.product.id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(self.graphql(self.MUTATION, user=self.seller)['data']['deleteBusiness']['status'])
+
+        business = Business.objects.get(id=self.business.id)
+        self.assertIsNone(business.user_id)
+        self.assertIsNotNone(business.deleted_at)
+        self.assertFalse(Product.objects.visible().filter(id=self.product.id).exists())
+        self.assertFalse(ProductCard.objects.filter(business_id=self.business.id).exists())
+        self.assertEqual(Job.objects.filter(task='product.tasks.delete_business').count(), 1)
+
+        result = self.graphql('query ($id: ID!) { product(id: $id) { id } }', id=self.product.id)
+        self.assertIsNone(result['data']['product'])
+
+        # The owner has no business to add products to anymore
+        result = self.graphql(
+            'mutation { createProduct(productData: {name: "Case", price: "1.00", description: "A case", '
+            'categoryId: %d}, totalCount: 1, images: []) { product { id } } }' % self.category.id, user=self.seller
+        )
+        self.assertEqual(result['errors'][0]['message'], "User doesn't have a business card")
+
+        delete_business(self.business.id)
+
+        self.assertFalse(Business.objects.filter(id=self.business.id).exists())
+        self.assertFalse(Product.objects.filter(id=self.product.id).exists())
@@ -0,0 +1,55 @@
+from django.db import router
+from django.http import HttpResponseBadRequest, HttpResponseForbidden, StreamingHttpResponse
+from django.utils import timezone
+from django.views.decorators.http import require_GET
+
+from backend.authentication import Authentication
+from backend.middlewares import accepted_encodings
+from .export import CONTENT_TYPES, CSV, export_products
+from .models import Product
+
+
+@require_GET
+def product_export(request):
+    """Stream the catalog of the business of the user, or of every business to staff"""
+    user = Authentication(request).authenticate()
+
+    if not user:
+        return HttpResponseForbidden("U aren't authorized to perform operation")
+
+    export_format = request.GET.get('format', CSV)
+    if export_format not in CONTENT_TYPES:
+        return HttpResponseBadRequest(f"Unsupported format, use one of {', '.join(CONTENT_TYPES)}")
+
+    query = Product.objects.visible()
+
+    if user.is_staff:
+        if request.GET.get('business'):
+            try:
+                business_id = int(request.GET['business'])
+            except ValueError:
+                return HttpResponseBadRequest("business must be a business id")
+            query = query.filter(business_id=business_id)
+    else:
+        try:
+            query = query.filter(business_id=user.user_business.id)
+        except Exception:
+            return HttpResponseForbidden("User doesn't have a business card")
+
+    # The rows are read after the request is over, pick the database while it still runs
+    query = query.using(router.db_for_read(Product))
+
+    # Only gzip is streamed, * stands for it unless the client refused it with q=0
+    accepted = accepted_encodings(request.headers.get('Accept-Encoding', ''))
+    gzip = accepted.get('gzip', accepted.get('*', 0)) > 0
+    response = StreamingHttpResponse(
+        export_products(query, export_format, gzip=gzip), content_type=CONTENT_TYPES[export_format]
+    )
+
+    filename = f"products-{timezone.now():%Y%m%d%H%M%S}.{export_format}"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response['Vary'] = 'Accept-Encoding, Authorization'
+    if gzip:
+        response['Content-Encoding'] = 'gzip'
+
+    return response
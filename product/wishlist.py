@@ -0,0 +1,66 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+
+
+def _key(user_id):
+    return f'wishlist:{user_id}'
+
+
+def wished_product_ids(user_id):
+    """Ids of the products a user wished, cached until the wish list changes"""
+    from .models import Wish
+
+    ids = cache.get(_key(user_id))
+
+    if ids is None:
+        ids = frozenset(
+            Wish.products.through.objects.filter(wish__user_id=user_id).values_list('product_id', flat=True)
+        )
+        cache.set(_key(user_id), ids, settings.WISHLIST_CACHE_TIMEOUT)
+
+    return ids
+
+
+def request_wished_ids(request):
+    """Wished product ids of the request's user, read once per request however many products ask"""
+    if not hasattr(request, '_wished_product_ids'):
+        user = getattr(request, 'user', None)
+        request._wished_product_ids = wished_product_ids(user.id) if user and user.is_authenticated else frozenset()
+
+    return request._wished_product_ids
+
+
+def invalidate(user_ids):
+    """Forget the cached wish lists once the current transaction commits"""
+    keys = [_key(user_id) for user_id in user_ids]
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def add_to_wishlist(user_id, product_id):
+    """Add a product to a user's wish list, adding it twice is a no-op"""
+    from .models import Wish
+
+    wish, _ = Wish.objects.get_or_create(user_id=user_id)
+
+    try:
+        with transaction.atomic():
+            Wish.products.through.objects.bulk_create(
+                [Wish.products.through(wish_id=wish.id, product_id=product_id)], ignore_conflicts=True
+            )
+    except IntegrityError:
+        raise Exception("Product with product_id doesn't exist")
+
+    invalidate([user_id])
+
+
+def remove_from_wishlist(user_id, product_id):
+    """Remove a product from a user's wish list, returns whether it was in it"""
+    from .models import Wish
+
+    deleted, _ = Wish.products.through.objects.filter(wish__user_id=user_id, product_id=product_id).delete()
+
+    if deleted:
+        invalidate([user_id])
+
+    return bool(deleted)
@@ -0,0 +1,136 @@
+import hashlib
+import io
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image
+
+# Renderers run in worker processes, so this module must stay importable
+# without a configured Django: models are imported inside the functions.
+
+WEBP = 'webp'
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_process_pool():
+    """Process-wide pool of derivative renderers, created on first use"""
+    global _pool
+
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=settings.IMAGE_DERIVATIVE_PROCESSES,
+                # Forking a process running ingestion threads is unsafe
+                mp_context=multiprocessing.get_context('forkserver')
+            )
+        return _pool
+
+
+def reset_process_pool(broken):
+    """Drop a broken pool so the next call starts a fresh one"""
+    global _pool
+
+    with _pool_lock:
+        if _pool is broken:
+            _pool = None
+    broken.shutdown(wait=False)
+
+
+def render_derivatives(content, widths, quality):
+    """Resize an image to the given widths (never upscaling) as WebP and JPEG, or PNG with transparency"""
+    with Image.open(io.BytesIO(content)) as source:
+        widths = sorted({min(width, source.width) for width in widths}, reverse=True)
+
+        # Let the JPEG decoder downscale by a power of two while decoding
+        source.draft('RGB', (widths[0], source.height * widths[0] // source.width))
+        source.load()
+
+        has_alpha = source.mode in ('RGBA', 'LA') or 'transparency' in source.info
+        current = source.convert('RGBA' if has_alpha else 'RGB')
+
+    fallback = ('PNG', 'png') if has_alpha else ('JPEG', 'jpg')
+    derivatives = []
+
+    # Every size is resized from the previous one, which is much cheaper than
+    # starting from the full-size image each time
+    for width in widths:
+        height = max(1, round(current.height * width / current.width))
+        if current.width != width:
+            current = current.resize((width, height), Image.LANCZOS)
+
+        for image_format, extension in (('WEBP', WEBP), fallback):
+            output = io.BytesIO()
+            current.save(output, format=image_format, quality=quality)
+            derivatives.append({
+                'width': width,
+                'height': height,
+                'format': extension,
+                'content': output.getvalue()
+            })
+
+    return derivatives
+
+
+def derivative_name(content_hash, width, extension):
+    return f'derivatives/{content_hash}/{width}.{extension}'
+
+
+def generate_derivatives(image, force=False):
+    """Render and store the derivatives of a ready image, reusing the ones of identical images.
+
+    Forced, the image is rendered again with the current settings and its derivatives replaced once all are stored.
+    """
+    from .models import ImageUpload
+
+    if not image.image:
+        return image
+
+    if not image.content_hash:
+        with image.image.open('rb') as source:
+            image.content_hash = hashlib.sha256(source.read()).hexdigest()
+
+    cached = None if force else ImageUpload.objects.filter(content_hash=image.content_hash).exclude(
+        id=image.id).exclude(derivatives=[]).values_list('derivatives', flat=True).first()
+
+    if cached:
+        image.derivatives = cached
+    else:
+        with image.image.open('rb') as source:
+            content = source.read()
+
+        pool = get_process_pool()
+        try:
+            rendered = pool.submit(
+                render_derivatives, content, settings.IMAGE_DERIVATIVE_WIDTHS, settings.IMAGE_QUALITY
+            ).result()
+        except BrokenProcessPool:
+            # A crashed renderer (e.g. killed for memory) must not disable the pool for good
+            reset_process_pool(pool)
+            raise
+
+        storage = image.image.storage
+        derivatives = []
+
+        for derivative in rendered:
+            name = derivative_name(image.content_hash, derivative['width'], derivative['format'])
+            # Identical content always renders to the same name. Forced, the storage picks a free name next
+            # to it, the old files stay served until the row points to the new ones.
+            if force or not storage.exists(name):
+                name = storage.save(name, ContentFile(derivative.pop('content')))
+            else:
+                derivative.pop('content')
+
+            derivatives.append({**derivative, 'name': name})
+
+        image.derivatives = derivatives
+
+    ImageUpload.objects.filter(id=image.id).update(
+        content_hash=image.content_hash, derivatives=image.derivatives
+    )
+    return image
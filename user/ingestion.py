@@ -0,0 +1,276 @@
+import hashlib
+import io
+import logging
+import os
+import uuid
+
+from django.conf import settings
+from django.core import signing
+from django.core.files.base import ContentFile
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from jobs.queue import enqueue
+
+from .derivatives import generate_derivatives
+from .models import ImageUpload
+
+logger = logging.getLogger(__name__)
+
+# Formats accepted from clients, everything is re-encoded into the same format
+ALLOWED_FORMATS = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp', 'GIF': 'gif'}
+
+# Content types accepted for direct uploads and the extension they are stored with
+CONTENT_TYPES = {'image/jpeg': 'jpg', 'image/png': 'png', 'image/webp': 'webp', 'image/gif': 'gif'}
+
+DIRECT_UPLOAD_SALT = 'user.ingestion.direct_upload'
+DIRECT_UPLOAD_CONFIRM_WINDOW = 24 * 60 * 60
+
+
+class InvalidImage(Exception):
+    """Raised when an upload is not an image we accept"""
+
+
+def hash_upload(upload):
+    """sha256 of an uploaded file, read chunk by chunk"""
+    digest = hashlib.sha256()
+    for chunk in upload.chunks():
+        digest.update(chunk)
+
+    upload.seek(0)
+    return digest.hexdigest()
+
+
+def spool_upload(upload):
+    """Write an uploaded file to the spool directory chunk by chunk, hashing it on the way"""
+    os.makedirs(settings.IMAGE_SPOOL_DIR, exist_ok=True)
+    path = os.path.join(settings.IMAGE_SPOOL_DIR, uuid.uuid4().hex)
+    digest = hashlib.sha256()
+
+    with open(path, 'wb') as spool:
+        for chunk in upload.chunks():
+            digest.update(chunk)
+            spool.write(chunk)
+
+    return path, digest.hexdigest()
+
+
+def ingest_upload(upload):
+    """Stage an upload where every job worker can read it and queue it for processing, returns the pending image.
+
+    Uploads are spooled to IMAGE_SPOOL_DIR when it is set, a directory the web and worker processes must share,
+    and otherwise written to the storage under a temporary name, like direct uploads.
+    """
+    if settings.IMAGE_SPOOL_DIR:
+        spool_path, source_hash = spool_upload(upload)
+    else:
+        spool_path, source_hash = '', hash_upload(upload)
+
+    # The same file was already processed: reference its blob, nothing to upload
+    existing = ImageUpload.objects.filter(
+        source_hash=source_hash, status=ImageUpload.READY
+    ).exclude(image='').values('image', 'content_hash', 'derivatives').first()
+
+    if existing:
+        if spool_path:
+            _remove_spool(spool_path)
+        return ImageUpload.objects.create(status=ImageUpload.READY, source_hash=source_hash, **existing)
+
+    if spool_path:
+        image = ImageUpload.objects.create(
+            status=ImageUpload.PENDING, spool_path=spool_path, source_hash=source_hash
+        )
+    else:
+        storage = ImageUpload._meta.get_field('image').storage
+        name = storage.save(f'uploads/{uuid.uuid4().hex}', upload)
+        image = ImageUpload.objects.create(status=ImageUpload.PENDING, image=name, source_hash=source_hash)
+
+    submit(image.id)
+
+    return image
+
+
+def request_direct_upload(content_type):
+    """Presigned target for a client uploading an image straight to the storage, returns (upload_id, target)"""
+    if content_type not in CONTENT_TYPES:
+        raise InvalidImage(f'Unsupported content type: {content_type}')
+
+    name = f'uploads/{uuid.uuid4().hex}.{CONTENT_TYPES[content_type]}'
+    storage = ImageUpload._meta.get_field('image').storage
+
+    target = storage.presigned_upload(
+        name, content_type, settings.IMAGE_UPLOAD_MAX_SIZE, settings.IMAGE_UPLOAD_EXPIRES
+    )
+
+    # Only names handed out here can be confirmed
+    return signing.dumps(name, salt=DIRECT_UPLOAD_SALT), target
+
+
+def confirm_direct_upload(upload_id):
+    """Register a finished direct upload and queue it for processing, returns the pending image"""
+    try:
+        name = signing.loads(upload_id, salt=DIRECT_UPLOAD_SALT, max_age=DIRECT_UPLOAD_CONFIRM_WINDOW)
+    except signing.BadSignature:
+        raise InvalidImage('Invalid or expired upload id')
+
+    # Processing moves the image to its blob, the upload is found by the name it was confirmed with
+    existing = ImageUpload.objects.filter(source_name=name).first()
+    if existing:
+        return existing
+
+    storage = ImageUpload._meta.get_field('image').storage
+
+    if not storage.exists(name):
+        raise InvalidImage("The upload hasn't been received")
+
+    if storage.size(name) > settings.IMAGE_UPLOAD_MAX_SIZE:
+        storage.delete(name)
+        raise InvalidImage('Image is too large')
+
+    try:
+        with transaction.atomic():
+            image = ImageUpload.objects.create(status=ImageUpload.PENDING, image=name, source_name=name)
+    except IntegrityError:
+        # Confirmed concurrently
+        return ImageUpload.objects.get(source_name=name)
+
+    submit(image.id)
+
+    return image
+
+
+def blob_name(content_hash, extension):
+    """Content addressed name of an image in the storage"""
+    return f'images/{content_hash[:2]}/{content_hash}.{extension}'
+
+
+def store_blob(image, content, extension):
+    """Point the image to the blob of its content, uploading it only if no identical blob exists"""
+    image.content_hash = hashlib.sha256(content).hexdigest()
+
+    existing = ImageUpload.objects.filter(
+        content_hash=image.content_hash, status=ImageUpload.READY
+    ).exclude(image='').exclude(id=image.id).values('image', 'derivatives').first()
+
+    if existing:
+        image.image = existing['image']
+        image.derivatives = existing['derivatives']
+        return image
+
+    storage = image.image.storage
+    name = blob_name(image.content_hash, extension)
+
+    if not storage.exists(name):
+        name = storage.save(name, ContentFile(content))
+
+    image.image = name
+    return image
+
+
+def submit(image_id):
+    """Queue a job processing an image, it runs once the current transaction commits"""
+    enqueue('user.tasks.process_image', {'image_id': image_id})
+
+
+def sanitize_image(source):
+    """Validate an image file and re-encode it without metadata, returns (bytes, extension)"""
+    try:
+        with Image.open(source) as image:
+            image.verify()
+        source.seek(0)
+
+        with Image.open(source) as image:
+            image_format = image.format
+            if image_format not in ALLOWED_FORMATS:
+                raise InvalidImage(f'Unsupported image format: {image_format}')
+
+            if image.width * image.height > settings.IMAGE_MAX_PIXELS:
+                raise InvalidImage('Image is too large')
+
+            # Bake the EXIF orientation into the pixels before EXIF is dropped
+            image = ImageOps.exif_transpose(image)
+            if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+
+            output = io.BytesIO()
+            image.save(output, format=image_format, optimize=True, **_save_options(image_format))
+    except InvalidImage:
+        raise
+    except Exception:
+        raise InvalidImage('File is not a valid image')
+
+    return output.getvalue(), ALLOWED_FORMATS[image_format]
+
+
+def _save_options(image_format):
+    if image_format in ('JPEG', 'WEBP'):
+        return {'quality': settings.IMAGE_QUALITY}
+    return {}
+
+
+def process_image_upload(image_id):
+    """Validate, strip and push a spooled or directly uploaded image to the storage"""
+    claimed = ImageUpload.objects.filter(id=image_id, status=ImageUpload.PENDING).update(
+        status=ImageUpload.PROCESSING, updated_at=timezone.now()
+    )
+    if not claimed:
+        return None
+
+    image = ImageUpload.objects.get(id=image_id)
+    # A direct upload sits in the storage under a temporary name until processed
+    uploaded_name = '' if image.spool_path else image.image.name
+
+    try:
+        if image.spool_path:
+            with open(image.spool_path, 'rb') as source:
+                raw = source.read()
+        else:
+            with image.image.open('rb') as source:
+                raw = source.read()
+
+        if not image.source_hash:
+            image.source_hash = hashlib.sha256(raw).hexdigest()
+
+        content, extension = sanitize_image(io.BytesIO(raw))
+        store_blob(image, content, extension)
+    except InvalidImage as e:
+        image.status = ImageUpload.FAILED
+        image.error = str(e)
+        image.image = ''
+    except Exception as e:
+        # Storage hiccups are retried later, the uploaded file is kept for it
+        logger.exception('Image ingestion of %s failed', image_id)
+        image.status = ImageUpload.PENDING
+        image.error = str(e)
+        image.save(update_fields=('status', 'error', 'updated_at'))
+        return image
+    else:
+        image.status = ImageUpload.READY
+        image.error = ''
+
+    if image.spool_path:
+        _remove_spool(image.spool_path)
+    elif uploaded_name and uploaded_name != image.image.name:
+        image.image.storage.delete(uploaded_name)
+
+    image.spool_path = ''
+    image.save(update_fields=(
+        'image', 'source_hash', 'content_hash', 'derivatives', 'status', 'error', 'spool_path', 'updated_at'
+    ))
+
+    if image.status == ImageUpload.READY and not image.derivatives:
+        try:
+            generate_derivatives(image)
+        except Exception:
+            # The original is served until the derivatives are backfilled
+            logger.exception('Derivatives of image %s failed', image_id)
+
+    return image
+
+
+def _remove_spool(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
@@ -0,0 +1,63 @@
+import io
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from PIL import Image
+
+from user.derivatives import render_derivatives
+
+
+def make_photo(width, height):
+    """A noisy gradient encodes and resizes like a photo, a flat color would not"""
+    gradient = Image.linear_gradient('L').resize((width, height))
+    noise = Image.effect_noise((width, height), 64)
+    photo = Image.merge('RGB', (gradient, noise, gradient.transpose(Image.FLIP_LEFT_RIGHT)))
+
+    output = io.BytesIO()
+    photo.save(output, format='JPEG', quality=90)
+    return output.getvalue()
+
+
+class Command(BaseCommand):
+    help = 'Measure the derivative rendering throughput per number of worker processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--images', type=int, default=48)
+        parser.add_argument('--width', type=int, default=3000)
+        parser.add_argument('--height', type=int, default=2000)
+        parser.add_argument(
+            '--processes', default=f'1,2,4,{multiprocessing.cpu_count()}',
+            help='Comma separated pool sizes to measure'
+        )
+
+    def handle(self, *args, **options):
+        content = make_photo(options['width'], options['height'])
+        widths = settings.IMAGE_DERIVATIVE_WIDTHS
+        quality = settings.IMAGE_QUALITY
+        processes = sorted({int(size) for size in options['processes'].split(',')})
+
+        self.stdout.write(
+            f"{options['images']} images of {options['width']}x{options['height']} "
+            f"({len(content) // 1024} KiB), widths {list(widths)}, {multiprocessing.cpu_count()} CPUs"
+        )
+        self.stdout.write(f"{'processes':>10} {'seconds':>9} {'images/s':>9} {'images/s/core':>14}")
+
+        context = multiprocessing.get_context('forkserver')
+        for size in processes:
+            with ProcessPoolExecutor(max_workers=size, mp_context=context) as pool:
+                # Start the workers before the clock does
+                list(pool.map(render_derivatives, [content] * size, [widths] * size, [quality] * size))
+
+                started = time.perf_counter()
+                list(pool.map(
+                    render_derivatives,
+                    [content] * options['images'], [widths] * options['images'], [quality] * options['images']
+                ))
+                elapsed = time.perf_counter() - started
+
+            throughput = options['images'] / elapsed
+            cores = min(size, multiprocessing.cpu_count())
+            self.stdout.write(f'{size:>10} {elapsed:>9.2f} {throughput:>9.2f} {throughput / cores:>14.2f}')
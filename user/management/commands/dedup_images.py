@@ -0,0 +1,99 @@
+import hashlib
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from product.cards import mark_dirty
+from product.models import Product
+from user.models import ImageUpload
+
+
+class Command(BaseCommand):
+    help = 'Hash existing images in batches and point identical ones to a single blob'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--delete-duplicates', action='store_true',
+            help='Delete the blobs that no image references anymore'
+        )
+
+    def handle(self, *args, **options):
+        hashed = self.hash_images(options['batch_size'])
+        groups, repointed, deleted = self.dedup(options['batch_size'], options['delete_duplicates'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Hashed {hashed} images, merged {groups} duplicate groups, '
+            f'repointed {repointed} images, deleted {deleted} blobs'
+        ))
+
+    def hash_images(self, batch_size):
+        query = ImageUpload.objects.filter(
+            status=ImageUpload.READY, content_hash=''
+        ).exclude(image='').only('id', 'image').order_by('id')
+
+        hashed = 0
+        last_id = 0
+
+        while True:
+            batch = list(query.filter(id__gt=last_id)[:batch_size])
+            if not batch:
+                return hashed
+
+            for image in batch:
+                digest = hashlib.sha256()
+                try:
+                    with image.image.open('rb') as source:
+                        for chunk in source.chunks():
+                            digest.update(chunk)
+                except Exception as e:
+                    self.stderr.write(f'Image {image.id}: {e}')
+                    continue
+                image.content_hash = digest.hexdigest()
+
+            ready = [image for image in batch if image.content_hash]
+            ImageUpload.objects.bulk_update(ready, ['content_hash'])
+
+            hashed += len(ready)
+            last_id = batch[-1].id
+            self.stdout.write(f'{hashed} images hashed')
+
+    def dedup(self, batch_size, delete_duplicates):
+        duplicated = ImageUpload.objects.filter(status=ImageUpload.READY).exclude(content_hash='').values(
+            'content_hash').annotate(blobs=Count('image', distinct=True)).filter(blobs__gt=1).order_by('content_hash')
+
+        groups = repointed = deleted = 0
+        last_hash = ''
+
+        while True:
+            hashes = list(duplicated.filter(content_hash__gt=last_hash).values_list('content_hash', flat=True)[:batch_size])
+            if not hashes:
+                return groups, repointed, deleted
+
+            for content_hash in hashes:
+                images = ImageUpload.objects.filter(content_hash=content_hash, status=ImageUpload.READY)
+
+                # Keep the oldest blob that already has its derivatives rendered
+                rows = sorted(images.values('id', 'image', 'derivatives'), key=lambda row: (not row['derivatives'], row['id']))
+                canonical = rows[0]
+                duplicates = {row['image'] for row in rows} - {canonical['image']}
+
+                with transaction.atomic():
+                    moved = images.exclude(image=canonical['image'])
+                    # The cards keep the cover path, they are refreshed when this commits, before any blob goes
+                    mark_dirty(Product.objects.filter(
+                        cover_image__image_id__in=moved.values('id')
+                    ).values_list('id', flat=True))
+                    repointed += moved.update(image=canonical['image'], derivatives=canonical['derivatives'])
+                groups += 1
+
+                if delete_duplicates:
+                    storage = ImageUpload._meta.get_field('image').storage
+                    for name in duplicates:
+                        if not ImageUpload.objects.filter(image=name).exists():
+                            storage.delete(name)
+                            deleted += 1
+
+            last_hash = hashes[-1]
+            self.stdout.write(f'{groups} duplicate groups merged')
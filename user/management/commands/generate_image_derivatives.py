@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+
+from user.derivatives import generate_derivatives
+from user.models import ImageUpload
+
+
+class Command(BaseCommand):
+    help = 'Render the resized derivatives of ready images that have none yet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--all', action='store_true', help='Render again images that already have derivatives')
+
+    def handle(self, *args, **options):
+        query = ImageUpload.objects.filter(status=ImageUpload.READY).exclude(image='').order_by('id')
+        # Rendered again, the derivatives of an image are replaced as soon as its new ones are stored
+        if not options['all']:
+            query = query.filter(derivatives=[])
+
+        done = failed = 0
+        last_id = 0
+
+        while True:
+            batch = list(query.filter(id__gt=last_id)[:options['batch_size']])
+            if not batch:
+                break
+
+            for image in batch:
+                try:
+                    generate_derivatives(image, force=options['all'])
+                    done += 1
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(f'Image {image.id}: {e}')
+
+            last_id = batch[-1].id
+            self.stdout.write(f'{done} images done, {failed} failed')
+
+        self.stdout.write(self.style.SUCCESS(f'Rendered derivatives of {done} images, {failed} failed'))
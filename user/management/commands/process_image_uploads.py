@@ -0,0 +1,42 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from user.ingestion import process_image_upload
+from user.models import ImageUpload
+
+
+class Command(BaseCommand):
+    help = 'Process spooled image uploads left pending, e.g. after a worker restart'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--stale-minutes', type=int, default=15,
+            help='Retry uploads stuck in processing for longer than this'
+        )
+
+    def handle(self, *args, **options):
+        stale_before = timezone.now() - timedelta(minutes=options['stale_minutes'])
+        reset = ImageUpload.objects.filter(
+            status=ImageUpload.PROCESSING, updated_at__lt=stale_before
+        ).update(status=ImageUpload.PENDING)
+
+        processed = failed = retried = 0
+        pending = ImageUpload.objects.filter(status=ImageUpload.PENDING).values_list('id', flat=True)
+
+        for image_id in pending.iterator():
+            image = process_image_upload(image_id)
+            if image is None:
+                continue
+            if image.status == ImageUpload.READY:
+                processed += 1
+            elif image.status == ImageUpload.FAILED:
+                failed += 1
+            else:
+                retried += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Reset {reset} stale uploads, processed {processed}, failed {failed}, '
+            f'left {retried} for a retry'
+        ))
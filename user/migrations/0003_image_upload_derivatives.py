@@ -0,0 +1,23 @@
+# Generated by Django 3.2.8 on 2026-10-19 10:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0002_image_upload_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imageupload',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='imageupload',
+            name='derivatives',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.8 on 2026-10-19 10:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0003_image_upload_derivatives'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imageupload',
+            name='source_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+    ]
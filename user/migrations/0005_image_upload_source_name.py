@@ -0,0 +1,30 @@
+# Generated by Django 3.2.8 on 2026-10-19 11:38
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_source_names(apps, schema_editor):
+    # Uploads not processed yet still have the name they were confirmed with
+    ImageUpload = apps.get_model('user', 'ImageUpload')
+    ImageUpload.objects.filter(image__startswith='uploads/').update(source_name=F('image'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0004_image_upload_source_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imageupload',
+            name='source_name',
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+        migrations.RunPython(backfill_source_names, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='imageupload',
+            constraint=models.UniqueConstraint(condition=models.Q(('source_name', ''), _negated=True), fields=('source_name',), name='unique_image_upload_source_name'),
+        ),
+    ]
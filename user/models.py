@@ -2,6 +2,7 @@ import uuid
 
 from django.core.validators import RegexValidator
 from django.db import models
+from django.db.models import Q
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin, BaseUserManager
 
 
@@ -63,10 +64,41 @@ class User(AbstractBaseUser, PermissionsMixin):
 
 
 class ImageUpload(models.Model):
-    image = models.ImageField(upload_to="images/%Y/%m/%d/")
+    """Class for creation an uploaded image table in a database"""
+
+    PENDING = 'pending'
+    PROCESSING = 'processing'
+    READY = 'ready'
+    FAILED = 'failed'
+
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (PROCESSING, 'Processing'),
+        (READY, 'Ready'),
+        (FAILED, 'Failed')
+    )
+
+    image = models.ImageField(upload_to="images/%Y/%m/%d/", blank=True)
+    # SHA-256 of the file as uploaded and of the stored (sanitized) blob
+    source_hash = models.CharField(max_length=64, blank=True, db_index=True)
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)
+    derivatives = models.JSONField(default=list, blank=True)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=READY, db_index=True)
+    spool_path = models.CharField(max_length=255, blank=True, editable=False)
+    # Name a direct upload was confirmed with, kept once processing moves the image to its blob
+    source_name = models.CharField(max_length=255, blank=True, editable=False)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         verbose_name_plural = 'Images'
+        constraints = [
+            # A direct upload confirmed twice is registered once
+            models.UniqueConstraint(
+                fields=('source_name', ), condition=~Q(source_name=''), name='unique_image_upload_source_name'
+            ),
+        ]
 
     def __str__(self):
         return str(self.image)
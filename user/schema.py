@@ -1,13 +1,15 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 
 import graphene
 from django.conf import settings
 from django.contrib.auth import authenticate
+from django.utils import timezone
 from graphene_django import DjangoObjectType
 from graphene_file_upload.scalars import Upload
 
 from backend.authentication import TokenManager
 from backend.permissions import is_authenticated, paginate
+from .ingestion import confirm_direct_upload, ingest_upload, request_direct_upload
 from .models import User, ImageUpload, UserProfile, UserAddress
 
 
@@ -17,18 +19,58 @@ class UserType(DjangoObjectType):
         model = User
 
 
+def media_url(name):
+    """Public URL of a file in the media storage"""
+    return "{}{}{}".format(settings.S3_BUCKET_URL, settings.MEDIA_URL, name)
+
+
+class ImageDerivativeType(graphene.ObjectType):
+    """Response with a resized copy of an image"""
+    url = graphene.String()
+    width = graphene.Int()
+    height = graphene.Int()
+    format = graphene.String()
+
+    def resolve_url(self, info):
+        return media_url(self['name'])
+
+    def resolve_width(self, info):
+        return self['width']
+
+    def resolve_height(self, info):
+        return self['height']
+
+    def resolve_format(self, info):
+        return self['format']
+
+
 class ImageUploadType(DjangoObjectType):
     """Response with image data"""
     image = graphene.String()
+    derivatives = graphene.List(ImageDerivativeType, format=graphene.String())
+    srcset = graphene.String(format=graphene.String(default_value='webp'))
 
     class Meta:
         model = ImageUpload
+        exclude = ('spool_path', )
 
     def resolve_image(self, info):
         if self.image:
-            return "{}{}{}".format(settings.S3_BUCKET_URL, settings.MEDIA_URL, self.image)
+            return media_url(self.image)
         return ""
 
+    def resolve_derivatives(self, info, format=None):
+        if format:
+            return [derivative for derivative in self.derivatives if derivative['format'] == format]
+        return self.derivatives
+
+    def resolve_srcset(self, info, format):
+        """Value for the srcset attribute of an img tag, with width hints"""
+        return ", ".join(
+            "{} {}w".format(media_url(derivative['name']), derivative['width'])
+            for derivative in self.derivatives if derivative['format'] == format
+        )
+
 
 class UserProfileType(DjangoObjectType):
     """Response with profile data"""
@@ -103,18 +145,54 @@ class GetAccess(graphene.Mutation):
 
 
 class ImageUploadMain(graphene.Mutation):
-    """Uploading a image"""
+    """Uploading a image, it is processed in the background and the status can be polled"""
     image = graphene.Field(ImageUploadType)
 
     class Arguments:
         image = Upload(required=True)
 
     def mutate(self, info, image):
-        image = ImageUpload.objects.create(image=image)
+        image = ingest_upload(image)
 
         return ImageUploadMain(image=image)
 
 
+class RequestImageUpload(graphene.Mutation):
+    """Presigned target to upload an image straight to the storage, bypassing the API"""
+    upload_id = graphene.String()
+    url = graphene.String()
+    fields = graphene.JSONString()
+    expires_at = graphene.DateTime()
+
+    class Arguments:
+        content_type = graphene.String(required=True)
+
+    @is_authenticated
+    def mutate(self, info, content_type):
+        upload_id, target = request_direct_upload(content_type)
+
+        return RequestImageUpload(
+            upload_id=upload_id,
+            url=target['url'],
+            fields=target['fields'],
+            expires_at=timezone.now() + timedelta(seconds=settings.IMAGE_UPLOAD_EXPIRES)
+        )
+
+
+class ConfirmImageUpload(graphene.Mutation):
+    """Registering an image uploaded to a presigned target, it is processed in the background"""
+    image = graphene.Field(ImageUploadType)
+
+    class Arguments:
+        upload_id = graphene.String(required=True)
+
+    @is_authenticated
+    def mutate(self, info, upload_id):
+        image = confirm_direct_upload(upload_id)
+
+        return ConfirmImageUpload(image=image)
+
+
 class UserProfileInput(graphene.InputObjectType):
     profile_picture = graphene.String()
     country_code = graphene.String()
@@ -253,6 +331,10 @@ class Query(graphene.ObjectType):
         paginate(ImageUploadType), page=graphene.Int(),
         description='Response data in pagination about existing images'
     )
+    image = graphene.Field(
+        ImageUploadType, id=graphene.ID(required=True),
+        description='Response data about an uploaded image and its processing status'
+    )
     me = graphene.Field(UserType, description='Response data about the authorized user')
 
     def resolve_users(self, info, **kwargs):
@@ -261,6 +343,9 @@ class Query(graphene.ObjectType):
     def resolve_images(self, info, **kwargs):
         return ImageUpload.objects.filter(**kwargs)
 
+    def resolve_image(self, info, id):
+        return ImageUpload.objects.get(id=id)
+
     @is_authenticated
     def resolve_me(self, info):
         return info.context.user
@@ -271,6 +356,8 @@ class Mutation(graphene.ObjectType):
     login_user = LoginUser.Field()
     get_access = GetAccess.Field()
     image_upload = ImageUploadMain.Field()
+    request_image_upload = RequestImageUpload.Field()
+    confirm_image_upload = ConfirmImageUpload.Field()
     create_user_profile = CreateUserProfile.Field()
     update_user_profile = UpdateUserProfile.Field()
     create_user_address = CreateUserAddress.Field()
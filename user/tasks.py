@@ -0,0 +1,28 @@
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from jobs.queue import task
+from .ingestion import process_image_upload
+from .models import ImageUpload
+
+
+@task(priority=10)
+def process_image(image_id):
+    """Process an uploaded image, raising while the storage fails so the job is retried"""
+    # Left processing by a worker that died, the lock of its job expired since
+    ImageUpload.objects.filter(
+        id=image_id, status=ImageUpload.PROCESSING,
+        updated_at__lt=timezone.now() - timedelta(seconds=settings.JOBS_LOCK_TIMEOUT)
+    ).update(status=ImageUpload.PENDING)
+
+    spool_path = ImageUpload.objects.filter(id=image_id).values_list('spool_path', flat=True).first()
+    if spool_path and not os.path.exists(spool_path):
+        raise Exception(f'Spooled file {spool_path} not found, the workers must share IMAGE_SPOOL_DIR')
+
+    image = process_image_upload(image_id)
+
+    if image is not None and image.status == ImageUpload.PENDING:
+        raise Exception(f'Image {image_id} is kept for a retry: {image.error}')
@@ -1,3 +1,87 @@
+import io
+import tempfile
+from unittest import mock
+
+from django.core import signing
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.management import call_command
 from django.test import TestCase
+from PIL import Image
+
+from .ingestion import DIRECT_UPLOAD_SALT, InvalidImage, confirm_direct_upload
+from .models import ImageUpload
+
+OLD_DERIVATIVES = [{'width': 160, 'format': 'webp', 'name': 'derivatives/old/160.webp'}]
+
+
+class StorageTestCase(TestCase):
+    """Images stored in a temporary directory"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.storage = FileSystemStorage(location=directory.name)
+        patcher = mock.patch.object(ImageUpload._meta.get_field('image'), 'storage', self.storage)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class DirectUploadTests(StorageTestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.name = 'uploads/0123456789abcdef.png'
+        self.upload_id = signing.dumps(self.name, salt=DIRECT_UPLOAD_SALT)
+
+    def test_confirm_is_idempotent_after_processing(self):
+        self.storage.save(self.name, ContentFile(b'png'))
+
+        with mock.patch('user.ingestion.submit') as submit:
+            image = confirm_direct_upload(self.upload_id)
+            # Processing moved the image to its blob and deleted the upload
+            ImageUpload.objects.filter(id=image.id).update(image='images/ab/ab.png', status=ImageUpload.READY)
+            self.storage.delete(self.name)
+
+            self.assertEqual(confirm_direct_upload(self.upload_id).id, image.id)
+
+        submit.assert_called_once_with(image.id)
+        self.assertEqual(ImageUpload.objects.count(), 1)
+
+    def test_upload_not_received(self):
+        with self.assertRaisesMessage(InvalidImage, "The upload hasn't been received"):
+            confirm_direct_upload(self.upload_id)
+
+
+class RegenerateDerivativesTests(StorageTestCase):
+    def setUp(self):
+        super().setUp()
+        content = io.BytesIO()
+        Image.new('RGB', (400, 300), 'red').save(content, format='PNG')
+        self.images = [
+            ImageUpload.objects.create(
+                image=self.storage.save(f'images/{number}.png', ContentFile(content.getvalue())),
+                derivatives=OLD_DERIVATIVES
+            ) for number in range(2)
+        ]
+
+    def call(self):
+        call_command('generate_image_derivatives', '--all', stdout=io.StringIO(), stderr=io.StringIO())
+
+    def test_derivatives_are_replaced(self):
+        self.call()
+
+        for image in self.images:
+            derivatives = ImageUpload.objects.get(id=image.id).derivatives
+            self.assertNotEqual(derivatives, OLD_DERIVATIVES)
+            self.assertTrue(all(self.storage.exists(derivative['name']) for derivative in derivatives))
+
+    def test_failed_render_keeps_the_old_derivatives(self):
+        with mock.patch(
+            'user.management.commands.generate_image_derivatives.generate_derivatives', side_effect=OSError
+        ):
+            self.call()
 
-# Create your tests here.
+        self.assertEqual(
+            list(ImageUpload.objects.values_list('derivatives', flat=True)), [OLD_DERIVATIVES, OLD_DERIVATIVES]
+        )
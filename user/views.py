@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.core import signing
+from django.core.files.storage import default_storage
+from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseForbidden
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+
+from backend.storage_backends import LOCAL_UPLOAD_SALT
+
+
+@csrf_exempt
+@require_POST
+def local_upload(request):
+    """Receive a file POSTed to a target of LocalMediaStorage.presigned_upload, like the bucket would"""
+    try:
+        token = signing.loads(
+            request.POST.get('token', ''), salt=LOCAL_UPLOAD_SALT, max_age=settings.IMAGE_UPLOAD_EXPIRES
+        )
+    except signing.BadSignature:
+        return HttpResponseForbidden('Invalid or expired upload target')
+
+    upload = request.FILES.get('file')
+
+    if not upload or not 0 < upload.size <= token['max_size']:
+        return HttpResponseBadRequest('File is missing or too large')
+
+    if request.POST.get('Content-Type') != token['content_type']:
+        return HttpResponseBadRequest('Content type does not match the upload target')
+
+    if default_storage.exists(token['name']):
+        return HttpResponseForbidden('Upload target was already used')
+
+    default_storage.save(token['name'], upload)
+
+    return HttpResponse(status=204)